@@ -1,30 +1,69 @@
 from __future__ import unicode_literals
-from flask import Flask, request, jsonify, Response
-from flask import redirect, url_for, abort
+import gc
+import io
+import hmac
+import json
+import tempfile
+import itertools
+from flask import Flask, Request, request, jsonify, Response, stream_with_context
+from flask import redirect, url_for, abort, g
 from flask_cors import CORS, cross_origin
 import pandas as pd
 from src.api_helper import *
 from src.config import *
 from src.data_extractors import *
+from src.catalog_holder import current_catalog, start_catalog_watcher, start_catalog_reload, catalog_holder_stats
+from src.table_profile import TableProfile
+from src.row_matcher import iter_table_matches
+from src.layout_cache import detect_columns_with_layout_cache
+from src.chunked_upload import iter_upload_sheets, iter_chunked_matches
+from src.workbook import iter_workbook_matches
+from src.page_tables import iter_page_matches
+from src.upstream import fetch_page, iter_fetched_pages
+from src.result_cache import result_key, get_result, store_result, result_cache_stats
+from src.single_flight import single_flight, single_flight_stats
+from src.layout_cache import layout_cache_stats
+from src.table_pool import table_pool_stats
 from werkzeug.utils import secure_filename
 
 
-UPLOAD_FOLDER = './uploads'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
 
+
+class SpooledRequest(Request):
+    # uploaded files are parsed straight from a per request buffer, kept in memory up to UPLOAD_SPOOL_MAX_SIZE
+    # bytes and spilled to an anonymous temporary file above that (nothing shared between requests)
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE, mode="w+b")
+
+
 app = Flask(__name__)
+app.request_class = SpooledRequest
 app.config['CORS_HEADERS'] = 'Content-Type'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+# streamed records are encoded like jsonify() does, one shared encoder (json.dumps() per record builds a new one)
+ndjson_encoder = json.JSONEncoder(sort_keys=app.json.sort_keys, ensure_ascii=app.json.ensure_ascii,
+                                  separators=(",", ":"), default=app.json.default)
 
 
 # Global Variables
-BRAND_NAMES = set(read_lines('./data/outputs/brand_names.txt')).difference(invalid_brand_names)
-BRAND_ALIASES = set(read_lines('./data/outputs/brand_aliases.txt')).difference(invalid_brand_names)
-PART_NUMBERS = set(read_lines('./data/outputs/part_numbers.txt')).difference(invalid_part_numbers)
+# memory-mapped binary snapshot (python -m src.catalog_snapshot), falls back to data/outputs text/JSON files.
+# Loaded at startup and reloaded in the background when its files change, every request works on the catalog
+# it took in before_request (g.catalog) until it is done
+current_catalog()
+
+
+@app.before_request
+def take_catalog():
+    start_catalog_watcher()   # per process, also in workers forked after the import
+    g.catalog = current_catalog()
+
 
-BRAND_NAME_TO_ID = read_dictionary_json("./data/outputs/brand_name_to_id.json")
-BRAND_ALIAS_TO_ID = read_dictionary_json("./data/outputs/brand_alias_to_id.json")
-PART_NUMBER_TO_ID = read_dictionary_json("./data/outputs/part_number_to_id.json")
+@app.after_request
+def add_catalog_version(response):
+    if "catalog" in g:
+        response.headers["X-Catalog-Version"] = g.catalog.version
+    return response
 
 
 def allowed_file(filename):
@@ -32,72 +71,271 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def wants_ndjson():
+    # opt-in streaming response: ?stream=1 or "Accept: application/x-ndjson", the default stays one JSON array
+    if request.args.get("stream", "").lower() in ["1", "true", "yes"]:
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def iter_blocks(parts):
+    # encoded parts written out in blocks of about NDJSON_BUFFER_SIZE bytes (a write per record is several times
+    # slower), the first one alone
+    blocks, size, flushed = [], 0, False
+    for part in parts:
+        blocks.append(part)
+        size += len(part)
+        if size >= NDJSON_BUFFER_SIZE or not flushed:
+            yield "".join(blocks)
+            blocks, size, flushed = [], 0, True
+    if blocks:
+        yield "".join(blocks)
+
+
+def iter_ndjson_lines(matches):
+    # one JSON record per line. The status line is already out when a later row fails, so the error becomes the
+    # last line of the body
+    try:
+        for match in matches:
+            yield ndjson_encoder.encode(match) + "\n"
+    except Exception:
+        traceback.print_exc()
+        yield ndjson_encoder.encode({"Error": "Can not process tables"}) + "\n"
+
+
+def iter_ndjson(matches):
+    return iter_blocks(iter_ndjson_lines(matches))
+
+
+def iter_json_array_parts(matches):
+    # the body jsonify(list(matches)) would give, record by record. A failure after the status line is out
+    # becomes the last element of the array
+    separator = "["
+    try:
+        for match in matches:
+            yield separator + ndjson_encoder.encode(match)
+            separator = ","
+    except Exception:
+        traceback.print_exc()
+        yield separator + ndjson_encoder.encode({"Error": "Can not process tables"})
+        separator = ","
+    yield "[]\n" if separator == "[" else "]\n"
+
+
+def iter_json_array(matches):
+    return iter_blocks(iter_json_array_parts(matches))
+
+
+def iter_cached_matches(cache_key, matches):
+    # records passed through to the stream, the whole result is cached once the stream is complete (not after an
+    # error, a table error entry or a client disconnect, nor above RESULT_CACHE_MAX_RECORDS records)
+    records = []
+    for match in matches:
+        if records is not None:
+            records.append(match)
+            if len(records) > RESULT_CACHE_MAX_RECORDS or "Error" in match:
+                records = None
+        yield match
+    if records is not None:
+        store_result(cache_key, jsonify(records).get_data())
+
+
+def matches_response(matches, cache_key=None, stream=False):
+    # NDJSON, or with stream=True a JSON array written out as it is matched (a chunked upload is never held whole)
+    if wants_ndjson() or stream:
+        # first record is matched before the response starts, so a table failing right away still answers 500
+        matches = iter(matches)
+        first = next(matches, None)
+        matches = itertools.chain([] if first is None else [first], matches)
+        if cache_key:
+            matches = iter_cached_matches(cache_key, matches)
+        if wants_ndjson():
+            response = Response(stream_with_context(iter_ndjson(matches)), mimetype=NDJSON_MIMETYPE)
+        else:
+            response = Response(stream_with_context(iter_json_array(matches)), mimetype=app.json.mimetype)
+    else:
+        response = jsonify(list(matches))
+    response.vary.add("Accept")   # JSON or NDJSON at the same URL
+    if cache_key:
+        response.set_etag(result_etag(cache_key))
+    return response, 200
+
+
+def encode_result(cache_key, matches):
+    # JSON array body of a result as jsonify() builds it, kept in the result cache unless a table failed (a table
+    # that failed once may not the next time)
+    matches = list(matches)
+    body = jsonify(matches).get_data()
+    if len(matches) <= RESULT_CACHE_MAX_RECORDS and not any(["Error" in match for match in matches]):
+        store_result(cache_key, body)
+    return body
+
+
+def coalesced_response(cache_key, compute):
+    # JSON array answer computed once for concurrent identical requests (same cache key), requests arriving while
+    # it is computed wait for it and answer with the same body. compute() gives (body, status)
+    body, status = single_flight(cache_key, compute, "match")
+    response = Response(body, status=status, mimetype=app.json.mimetype)
+    response.vary.add("Accept")
+    if status == 200:
+        response.set_etag(result_etag(cache_key))
+    return response
+
+
+def result_etag(cache_key):
+    # the JSON array and the NDJSON body of a result are two representations
+    return cache_key + ".ndjson" if wants_ndjson() else cache_key
+
+
+def cached_response(cache_key):
+    # for a result in the cache: 304 when the client has it already (same input and catalog, same result),
+    # otherwise the cached body. None when it is not cached (never cached with table error entries, so a client
+    # holding a result with errors gets it computed again)
+    etag = result_etag(cache_key)
+    body = get_result(cache_key)
+    if body is None:
+        return None
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        if wants_ndjson():
+            response = Response(iter_ndjson(json.loads(body)), mimetype=NDJSON_MIMETYPE)
+        else:
+            response = Response(body, mimetype=app.json.mimetype)
+    response.vary.add("Accept")   # the ETag names the representation too
+    response.set_etag(etag)
+    return response
+
+
+def iter_upload_matches(file, filename, catalog):
+    # matches of a very large upload read chunk by chunk, sheet after sheet. The request closes its files when
+    # the view returns, while a streamed response is still reading, so the upload stream is taken over and
+    # closed here
+    stream, file.stream = file.stream, io.BytesIO()
+    try:
+        for sheet, chunks in iter_upload_sheets(stream, filename, UPLOAD_CHUNK_ROWS):
+            for chunk_matches in iter_chunked_matches(chunks, catalog.brand_names, catalog.brand_aliases,
+                                                      catalog.brand_name_to_id, catalog.brand_alias_to_id,
+                                                      catalog.part_numbers, catalog.part_number_to_id):
+                for match in chunk_matches:
+                    if sheet is not None:
+                        match["sheet"], match["table_index"] = sheet, 0
+                    yield match
+    finally:
+        stream.close()
+
+
+def page_matches(page_id, tables, catalog):
+    return iter_page_matches(page_id, tables, catalog.brand_names, catalog.brand_aliases, catalog.brand_name_to_id,
+                             catalog.brand_alias_to_id, catalog.part_numbers, catalog.part_number_to_id,
+                             catalog_version=catalog.version)
+
+
+def page_result(page_id, content, cache_key, catalog):
+    # (body, status) of a fetched page
+    try:
+        tables = get_tables_from_page(content)
+    except Exception as e:
+        print("ERROR reading tables: mid={}, {}".format(page_id, e))
+        return jsonify({"Error": "Could not fetch tables"}).get_data(), 400
+    return encode_result(cache_key, page_matches(page_id, tables, catalog)), 200
+
+
+def iter_file_matches(stream, filename, catalog):
+    # every sheet/ stacked table of a workbook, records tagged with "sheet" and "table_index"
+    if filename.endswith(".xlsx") or filename.endswith(".xls"):
+        for match in iter_workbook_matches(stream, catalog.brand_names, catalog.brand_aliases, catalog.brand_name_to_id,
+                                           catalog.brand_alias_to_id, catalog.part_numbers,
+                                           catalog.part_number_to_id, catalog_version=catalog.version):
+            yield match
+        return
+
+    # LOAD DataFrame (from the request's own upload buffer)
+    if filename.endswith(".csv"):
+        df = pd.read_csv(stream)
+
+    df, table_header = fix_data_frame(df, catalog.brand_names, catalog.brand_aliases, catalog.part_numbers)
+    profile = TableProfile(df, table_header)
+    brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df = \
+        detect_columns_with_layout_cache(profile, catalog.brand_names, catalog.brand_aliases, catalog.part_numbers)
+
+    for match in iter_table_matches(df, brand_name_column, quantity_column, part_number_column,
+                                    suggested_quantity_column, catalog.brand_names, catalog.brand_aliases,
+                                    catalog.brand_name_to_id, catalog.brand_alias_to_id, catalog.part_numbers,
+                                    catalog.part_number_to_id):
+        yield match
+
+
+def iter_batch_results(page_ids, catalog):
+    # one result per id in request order: {"id", "status": 200, "matches"} or {"id", "status", "Error"},
+    # pages are fetched concurrently ahead of the one being matched
+    urls = [EMAIL_DETAIL_URL.format(i=page_id) for page_id in page_ids]
+    for page_id, (content, error) in zip(page_ids, iter_fetched_pages(urls)):
+        try:
+            if error is not None:
+                yield {"id": page_id, "status": 400, "Error": "Could not fetch tables"}
+                continue
+            # same cache entries/ in-flight computations as /api/get-match/<id>
+            cache_key = result_key(catalog.version, "page", page_id, content)
+            body, status = get_result(cache_key), 200
+            if body is None:
+                body, status = single_flight(cache_key, lambda: page_result(page_id, content, cache_key, catalog),
+                                             "match")
+            if status != 200:
+                yield {"id": page_id, "status": status, "Error": "Could not fetch tables"}
+                continue
+            yield {"id": page_id, "status": 200, "matches": json.loads(body)}
+        except Exception:
+            traceback.print_exc()
+            yield {"id": page_id, "status": 500, "Error": "Can not process tables"}
+
+
 @app.route('/api/get-match/<int:page_id>', methods=['GET'])
 @cross_origin(origin='*', headers=['Content-Type'])
 def process_from_message_id(page_id):
-    global BRAND_NAMES
-    global BRAND_ALIASES
-    global PART_NUMBERS
-    global BRAND_NAME_TO_ID
-    global BRAND_ALIAS_TO_ID
-    global PART_NUMBER_TO_ID
-
+    catalog = g.catalog
     try:
         url = EMAIL_DETAIL_URL.format(i=page_id)
         try:
-            tables = get_tables_from_url(url)
+            content = fetch_page(url)
         except Exception as e:
             print("ERROR fetching tables:", e)
             return jsonify({"Error": "Could not fetch tables"}), 400
 
-        matches = []
-        for index, df in enumerate(tables):
-            df, table_header = fix_data_frame(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
-            brand_name_column = get_brand_name_column(df, table_header, BRAND_NAMES, BRAND_ALIASES)
-            quantity_column, suggested_quantity_column = get_quantity_column(df, table_header)
-            part_number_column = get_part_number_column(df, table_header, brand_name_column, quantity_column,
-                                                        PART_NUMBERS)
-
-            # Check Existing Patterns for brand_names and part_numbers (PN#BN, PN/BN, PN(BN)...)
-            if brand_name_column is False or part_number_column is False:
-                brand_name_column, part_number_column = check_existing_patterns(df, table_header, brand_name_column,
-                                                                                part_number_column, BRAND_NAMES,
-                                                                                BRAND_ALIASES, PART_NUMBERS)
-
-            # Check B.N. and P.N. columns merged with others
-            if brand_name_column is False and part_number_column is False:
-                brand_name_column, part_number_column = try_search_with_splitter(df, table_header, BRAND_NAMES,
-                                                                                 BRAND_ALIASES, PART_NUMBERS)
-
-            # Check column header with keyword based search
-            if brand_name_column is False or part_number_column is False:
-                brand_name_column, part_number_column, suggested_quantity_column, table_header, df = \
-                    try_search_with_keywords(df, table_header, brand_name_column, part_number_column,
-                                             suggested_quantity_column)
-
-            if table_header["status"] and not (brand_name_column or part_number_column or quantity_column):
-                print("ERROR in detecting columns: mid={}, table_index={}\n".format(page_id, index))
-                continue
+        # a page already matched with this body and catalog is answered from the result cache/ with a 304
+        cache_key = result_key(catalog.version, "page", page_id, content)
+        response = cached_response(cache_key)
+        if response is not None:
+            return response
 
-            df["Suggested Quantity"] = 0
-            if suggested_quantity_column or suggested_quantity_column is 0:  # 0 is logically False
-                df["Suggested Quantity"] = df[suggested_quantity_column]
-                df["Suggested Quantity"].ffill(inplace=True)
-
-            header_crossed = False
-            for row in df.iterrows():
-                if not header_crossed:
-                    if not any([is_integer(clm) for clm in row[1].drop(labels=["Suggested Quantity"])]):
-                        if not exist_brand_alias_or_part(row[1], BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
-                            continue
-                header_crossed = True
-                row_match = get_row_match(row[1], brand_name_column, quantity_column, part_number_column,
-                                          BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
-                                          PART_NUMBERS, PART_NUMBER_TO_ID)
-                if not any([bool(x) for x in row_match.values()]):
-                    continue
-                matches.append(row_match)
-        return jsonify(matches), 200
+        # tables of the page in the table pool, failing tables reported as {"table_index": i, "Error": ...}.
+        # Streamed answers are matched per request, JSON arrays once for concurrent requests of the same page
+        if not wants_ndjson():
+            return coalesced_response(cache_key, lambda: page_result(page_id, content, cache_key, catalog))
+        try:
+            tables = get_tables_from_page(content)
+        except Exception as e:
+            print("ERROR fetching tables:", e)
+            return jsonify({"Error": "Could not fetch tables"}), 400
+        return matches_response(page_matches(page_id, tables, catalog), cache_key)
+    except Exception:
+        traceback.print_exc()
+        return jsonify({"Error": "Can not process tables"}), 500
+
+
+@app.route('/api/get-match-batch/', methods=['POST'])
+@cross_origin(origin='*', headers=['Content-Type'])
+def process_from_message_ids():
+    # body: {"ids": [message ids]}
+    try:
+        body = request.get_json(silent=True)
+        page_ids = body.get("ids") if type(body) is dict else None
+        if type(page_ids) is not list or not all([type(page_id) is int and page_id >= 0 for page_id in page_ids]):
+            return jsonify({"Error": "Expected {\"ids\": [message ids]}"}), 400
+        if len(page_ids) > BATCH_MAX_IDS:
+            return jsonify({"Error": "At most {} ids per request".format(BATCH_MAX_IDS)}), 400
+
+        return matches_response(iter_batch_results(page_ids, g.catalog))
     except Exception:
         traceback.print_exc()
         return jsonify({"Error": "Can not process tables"}), 500
@@ -106,18 +344,9 @@ def process_from_message_id(page_id):
 @app.route('/api/get-match-from-file/', methods=['POST'])
 @cross_origin(origin='*', headers=['Content-Type'])
 def process_from_excel():
-    global BRAND_NAMES
-    global BRAND_ALIASES
-    global PART_NUMBERS
-    global BRAND_NAME_TO_ID
-    global BRAND_ALIAS_TO_ID
-    global PART_NUMBER_TO_ID
-
+    catalog = g.catalog
     try:
         matches = []
-        if not os.path.exists("./uploads"):
-            os.mkdir("./uploads")
-
         if request.method == 'POST':
             # check if the post request has the file part
             if 'file' not in request.files:
@@ -132,62 +361,91 @@ def process_from_excel():
 
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
-                # LOAD DataFrame
-                if filename.endswith(".xlsx") or filename.endswith(".xls"):
-                    df = pd.read_excel(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                if filename.endswith(".csv"):
-                    df = pd.read_csv(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
-                matches = []
-                df, table_header = fix_data_frame(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
-                brand_name_column = get_brand_name_column(df, table_header, BRAND_NAMES, BRAND_ALIASES)
-                quantity_column, suggested_quantity_column = get_quantity_column(df, table_header)
-                part_number_column = get_part_number_column(df, table_header, brand_name_column, quantity_column,
-                                                            PART_NUMBERS)
-
-                # Check Existing Patterns for brand_names and part_numbers (PN#BN, PN/BN, PN(BN)...)
-                if brand_name_column is False or part_number_column is False:
-                    brand_name_column, part_number_column = check_existing_patterns(df, table_header, brand_name_column,
-                                                                                    part_number_column, BRAND_NAMES,
-                                                                                    BRAND_ALIASES, PART_NUMBERS)
-
-                # Check B.N. and P.N. columns merged with others
-                if brand_name_column is False and part_number_column is False:
-                    brand_name_column, part_number_column = try_search_with_splitter(df, table_header, BRAND_NAMES,
-                                                                                     BRAND_ALIASES, PART_NUMBERS)
-
-                # Check column header with keyword based search
-                if brand_name_column is False or part_number_column is False:
-                    brand_name_column, part_number_column, suggested_quantity_column, table_header, df = \
-                        try_search_with_keywords(df, table_header, brand_name_column, part_number_column,
-                                                 suggested_quantity_column)
-
-                df["Suggested Quantity"] = 0
-                if suggested_quantity_column or suggested_quantity_column is 0:   # 0 is logically False
-                    df["Suggested Quantity"] = df[suggested_quantity_column]
-                    df["Suggested Quantity"].ffill(inplace=True)
-
-                header_crossed = False
-                for row in df.iterrows():
-                    if (not header_crossed) and (not any([is_integer(clm) for clm in row[1]])) and \
-                            not exist_brand_alias_or_part(row[1], BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
-                        continue
-                    header_crossed = True
-                    row_match = get_row_match(row[1], brand_name_column, quantity_column, part_number_column,
-                                              BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
-                                              PART_NUMBERS, PART_NUMBER_TO_ID)
-                    if not any([bool(x) for x in row_match.values()]):
-                        continue
-                    matches.append(row_match)
-
-                os.system("rm ./uploads/*")   # clean uploads folder
-                return jsonify(matches), 200
+
+                # an upload already matched with this catalog is answered from the result cache/ with a 304
+                cache_key = result_key(catalog.version, "upload", os.path.splitext(filename)[1], file.stream)
+                response = cached_response(cache_key)
+                if response is not None:
+                    return response
+
+                # very large csv/ xlsx uploads are read, detected and matched chunk by chunk
+                file.stream.seek(0, os.SEEK_END)
+                upload_size = file.stream.tell()
+                file.stream.seek(0)
+                chunked = CHUNKED_UPLOAD_MIN_SIZE and upload_size >= CHUNKED_UPLOAD_MIN_SIZE and \
+                    (filename.endswith(".csv") or filename.endswith(".xlsx"))
+                if chunked:
+                    matches = iter_upload_matches(file, filename, catalog)
+                else:
+                    matches = iter_file_matches(file.stream, filename, catalog)
+
+                # streamed answers (NDJSON, and the JSON array of a chunked upload) are matched per request, other
+                # JSON arrays once for concurrent uploads of the same file
+                if wants_ndjson() or chunked:
+                    return matches_response(matches, cache_key, stream=chunked)
+                return coalesced_response(cache_key, lambda: (encode_result(cache_key, matches), 200))
     except Exception:
         traceback.print_exc()
         return jsonify({"Error": "Can not process tables"}), 500
 
 
+@app.route('/api/metrics/', methods=['GET'])
+@cross_origin(origin='*', headers=['Content-Type'])
+def get_metrics():
+    # counters of this worker process: requests coalesced/ executed, result and layout cache hits, catalog reloads,
+    # column detections decided on a row sample/ by a full scan, brand/ part number normalization cache hits
+    return jsonify({"catalog": dict(catalog_holder_stats, version=g.catalog.version, source=g.catalog.source),
+                    "single_flight": dict(single_flight_stats),
+                    "result_cache": dict(result_cache_stats),
+                    "layout_cache": dict(layout_cache_stats),
+                    "table_pool": dict(table_pool_stats),
+                    "detection_sample": detection_sample_info(),
+                    "normalization_cache": normalization_cache_info()}), 200
+
+
+@app.route('/api/admin/reload-catalog/', methods=['POST'])
+@cross_origin(origin='*', headers=['Content-Type'])
+def reload_catalog_files():
+    # loads the catalog again in the background (this worker process, the watcher picks the change up in the
+    # others), answers right away with the catalog in use
+    # 401 without a token, 403 with a wrong one (or when CATALOG_ADMIN_TOKEN is not set)
+    token = request.headers.get("X-Admin-Token", "")
+    if CATALOG_ADMIN_TOKEN is None:
+        return jsonify({"Error": "Not allowed"}), 403
+    if not token:
+        return jsonify({"Error": "X-Admin-Token required"}), 401, {"WWW-Authenticate": "X-Admin-Token"}
+    if not hmac.compare_digest(token.encode(), CATALOG_ADMIN_TOKEN.encode()):
+        return jsonify({"Error": "Not allowed"}), 403
+    start_catalog_reload(force=True)
+    return jsonify({"version": g.catalog.version, "source": g.catalog.source, "reloading": True}), 202
+
+
+def warm_up(catalog):
+    # a small table of catalog brands/ part numbers through reading, column detection and matching (normalization
+    # caches, pandas parser paths) before the first request
+    brands = list(itertools.islice(iter(catalog.brand_names), 20))
+    part_numbers = list(itertools.islice(iter(catalog.part_numbers), len(brands)))
+    df = pd.DataFrame({"Brand": brands[:len(part_numbers)], "Part Number": part_numbers,
+                       "Qty": [str(100 * (i + 1)) for i in range(len(part_numbers))]})
+    matches = list(iter_file_matches(io.BytesIO(df.to_csv(index=False).encode("utf-8")), "warm_up.csv", catalog))
+    print("Warmed up with {} rows, {} matches".format(len(df), len(matches)))
+
+
+def create_app():
+    # WSGI app of the production server (gunicorn -c gunicorn.conf.py), preloaded in the master process: catalog
+    # loaded and code paths warmed once, then everything allocated so far is frozen out of the garbage collector so
+    # collections in the forked workers do not write to (and copy) the pages they share with the master
+    catalog = current_catalog()
+    if WARM_UP_ON_START:
+        try:
+            warm_up(catalog)
+        except Exception:
+            traceback.print_exc()
+    gc.collect()
+    gc.freeze()
+    return app
+
+
 if __name__ == '__main__':
+    # development server, production: gunicorn -c gunicorn.conf.py
     app.run(debug=DEBUG, port=5000, host='0.0.0.0')
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import random
+import resource
+import subprocess
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+# Peak memory of a large csv upload matched whole (pd.read_csv) and in chunks (UPLOAD_CHUNK_ROWS rows at a time):
+# the chunked peak only grows by the row hashes kept to drop duplicates (8 bytes a row). "endpoint" posts it to
+# /api/get-match-from-file/ as a chunked upload and reads the JSON array answer as it is written out, the records are never all held.
+# Every run is a fresh process (peak RSS is per process).
+# usage: python bench/bench_chunked_upload.py [rows ...]   (default 100000 400000 1600000), catalog of src/config.py
+# 1600000 rows (50 MB), 50k part catalog: whole +644 MB, chunked +147 MB, endpoint +199 MB (records kept for the
+# result cache up to RESULT_CACHE_MAX_RECORDS); endpoint +1223 MB when the JSON array was built with jsonify()
+def write_upload(path, rows):
+    # brand, part number, quantity rows of catalog names, a quarter of them unknown to the catalog
+    from src.catalog_holder import current_catalog
+    catalog = current_catalog()
+    random.seed(rows)
+    brands = sorted(catalog.brand_names)[:5000]
+    part_numbers = [key for _, key in zip(range(50000), catalog.part_number_to_id.keys())]
+    with open(path, "w") as fp:
+        fp.write("Manufacturer,MPN,Qty\n")
+        for i in range(rows):
+            part_number = random.choice(part_numbers) if i % 4 else "X{}".format(i)
+            fp.write('"{}","{}",{}\n'.format(random.choice(brands), part_number, random.randint(1, 10000)))
+
+
+def run(mode, path):
+    import api
+    from werkzeug.datastructures import FileStorage
+    catalog = api.current_catalog()
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start, matches = time.time(), 0
+    with open(path, "rb") as stream:
+        if mode == "whole":
+            for _ in api.iter_file_matches(stream, path, catalog):
+                matches += 1
+        elif mode == "endpoint":
+            api.CHUNKED_UPLOAD_MIN_SIZE = 1   # chunked whatever the size
+            response = api.app.test_client().post("/api/get-match-from-file/", buffered=False,
+                                                  data={"file": (stream, os.path.basename(path))})
+            for block in response.response:
+                matches += block.count(b'"part_number_id"')
+            response.close()
+        else:
+            for _ in api.iter_upload_matches(FileStorage(stream=stream, filename=path), path, catalog):
+                matches += 1
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("{:8} {:5} MB: peak RSS +{} MB, {} matches, {:.1f}s".format(
+        mode, os.path.getsize(path) // 2 ** 20, (peak - base) // 1024, matches, time.time() - start))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ("whole", "chunked", "endpoint"):
+        run(sys.argv[1], sys.argv[2])
+        sys.exit()
+    for rows in [int(arg) for arg in sys.argv[1:]] or [100000, 400000, 1600000]:
+        path = os.path.join("/tmp", "bench_upload_{}.csv".format(rows))
+        if not os.path.exists(path):
+            write_upload(path, rows)
+        for mode in ["whole", "chunked", "endpoint"]:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), mode, path])
@@ -0,0 +1,108 @@
+import io
+import os
+import sys
+import glob
+import time
+import random
+import warnings
+import tracemalloc
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pandas as pd
+from src.html_tables import read_html_tables
+
+
+# Parse time and traced peak allocations of pd.read_html and read_html_tables on email pages: saved pages given
+# on the command line, otherwise 40 email like pages built from the sample workbooks (outlook layout tables,
+# signature tables, quoted text, data tables with thead/ th/ td headers, rowspan, <br> in cells, hidden rows,
+# thousands separators). tracemalloc only sees Python allocations (text rows, DataFrames), not the lxml tree.
+# usage: python bench/bench_html_tables.py [page.html ...]
+SIGNATURE = ('<table><tr><td><img src="logo.png"></td><td>John Doe<br>Purchasing<br>Tel: +86 755 1234 5678</td>'
+             '</tr><tr><td colspan="2">ACME Electronics Ltd.</td></tr></table>')
+QUOTED = "".join("<div class=MsoNormal><p>{}</p></div>".format("Lorem ipsum dolor sit amet, " * 12) for _ in range(40))
+
+
+def cell_text(value, column):
+    if value != value:
+        return ""
+    if isinstance(value, (int, float)) and abs(value) >= 1000 and column % 2:
+        return "{:,}".format(value)
+    return str(value)
+
+
+def data_table(df, style):
+    out = ['<table border="1" cellspacing="0" style="border-collapse:collapse">']
+    header = "".join("<{0}>{1}</{0}>".format("td" if style == "td" else "th", column) for column in df.columns)
+    out.append("<thead><tr>{}</tr></thead><tbody>".format(header) if style == "thead" else "<tr>{}</tr>".format(header))
+    rows, i = df.values.tolist(), 0
+    while i < len(rows):
+        span = style == "th" and i % 7 == 0 and i + 1 < len(rows) and df.shape[1] > 2
+        cells = []
+        for j, value in enumerate(rows[i]):
+            text = cell_text(value, j)
+            if j == 0 and span:
+                cells.append('<td rowspan="2"><span style="font-family:Calibri">{}</span></td>'.format(text))
+            elif j == 1 and i % 11 == 3:
+                cells.append("<td>{}<br>note</td>".format(text))
+            else:
+                cells.append("<td><p class=MsoNormal><span lang=EN-US>{}<o:p></o:p></span></p></td>".format(text))
+        out.append("<tr>{}</tr>".format("".join(cells)))
+        if span:
+            out.append("<tr>{}</tr>".format("".join("<td>{}</td>".format(cell_text(v, j + 1))
+                                                    for j, v in enumerate(rows[i + 1][1:]))))
+            i += 1
+        i += 1
+    out.append("</tbody>" if style == "thead" else "")
+    out.append('<tr style="display:none"><td>hidden</td></tr></table>')
+    return "".join(out)
+
+
+def email_pages(count=40):
+    random.seed(7)
+    frames = [pd.read_excel(path) for path in sorted(glob.glob(os.path.join(ROOT, "data", "excel", "*")))]
+    pages = []
+    for n in range(count):
+        tables = [data_table(frames[(n + t) % len(frames)], ["thead", "th", "td"][(n + t) % 3])
+                  for t in range(1 + n % 4)]
+        if n % 5 == 4:
+            # a long request: one sheet repeated
+            tables[0] = data_table(pd.concat([frames[n % len(frames)]] * 20, ignore_index=True), "th")
+        pages.append("".join([
+            "<html><head><meta charset='utf-8'><style>p.MsoNormal{margin:0}</style></head><body>",
+            "<p>Hi, please check stock for the following:</p>",
+            "<table width='100%'><tr><td>{}</td></tr><tr><td>{}</td></tr></table>".format("<br>".join(tables), SIGNATURE),
+            SIGNATURE, "<table><tr><td></td></tr></table><table><tr><td>&nbsp;</td></tr></table>", QUOTED,
+            "</body></html>"]).encode("utf-8"))
+    return pages
+
+
+def run(name, parse, pages):
+    parse(pages[0])
+    tables, best = 0, None
+    for _ in range(3):
+        start = time.perf_counter()
+        tables = sum(len(parse(page)) for page in pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peaks = []
+    for page in pages:
+        tracemalloc.start()
+        parse(page)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print("{:17} {} pages ({} KB) -> {} tables: {:.2f}s, {:.1f} ms/page, traced peak per page max {:.1f} MB, "
+          "mean {:.1f} MB".format(name, len(pages), sum(map(len, pages)) // 1024, tables, best,
+                                  best / len(pages) * 1000, max(peaks) / 2 ** 20, sum(peaks) / len(peaks) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as fp:
+                pages.append(fp.read())
+    else:
+        pages = email_pages()
+    run("pd.read_html", lambda page: pd.read_html(io.BytesIO(page), encoding="utf-8"), pages)
+    run("read_html_tables", read_html_tables, pages)
@@ -0,0 +1,103 @@
+import gc
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+from src.config import CATALOG_SOURCE_DIR
+from src.api_helper import read_lines, read_dictionary_json
+from src.catalog_snapshot import build_catalog_snapshot, load_catalog_snapshot, PartNumberSet, PartNumberMap
+from src.part_index import build_part_index, PartIndex
+
+
+# Memory and lookup time of the part numbers kept as a set/dict, in the compact index of the catalog snapshot
+# (mmap) and in the compact index built in memory (text/JSON fallback). Heap is what tracemalloc sees after the
+# load, the snapshot pages are mapped from the file (mmap MB). Lookups: membership plus the id of the record on
+# hits, misses are hits with a suffix.
+# usage: python bench/bench_part_index.py [synthetic keys]   (default the part number files of CATALOG_SOURCE_DIR)
+def write_catalog(directory, keys):
+    for name in os.listdir(CATALOG_SOURCE_DIR):
+        if name.startswith("brand_"):
+            shutil.copy(os.path.join(CATALOG_SOURCE_DIR, name), directory)
+    if keys:
+        random.seed(3)
+        alphabet = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789-"
+        prefixes = ["".join(random.choice(alphabet) for _ in range(random.randint(2, 5))) for _ in range(5000)]
+        lines, part_number_to_id = [], {}
+        for i in range(keys):
+            part_number = random.choice(prefixes) + "".join(random.choice(alphabet) for _ in range(random.randint(4, 10)))
+            key = part_number.replace("-", "").lower()
+            lines.append(key)
+            part_number_to_id[key] = {"id": i + 1, "part_number": part_number, "brand_id": i % 2000}
+        with open(os.path.join(directory, "part_numbers.txt"), "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+        with open(os.path.join(directory, "part_number_to_id.json"), "w") as fp:
+            json.dump(part_number_to_id, fp, indent=4)
+    else:
+        for name in ["part_numbers.txt", "part_number_to_id.json"]:
+            shutil.copy(os.path.join(CATALOG_SOURCE_DIR, name), directory)
+
+
+def measure(load):
+    # (loaded object, traced heap bytes, load time without tracemalloc)
+    gc.collect()
+    start = time.time()
+    load()
+    elapsed = time.time() - start
+    gc.collect()
+    tracemalloc.start()
+    loaded = load()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return loaded, size, elapsed
+
+
+def lookup_time(part_numbers, part_number_to_id, probes):
+    # microseconds per probe
+    start = time.perf_counter()
+    for probe in probes:
+        if probe in part_numbers:
+            part_number_to_id[probe]["id"]
+    return (time.perf_counter() - start) / len(probes) * 1e6
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix="bench_part_index_")
+    try:
+        write_catalog(directory, int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+        parts_path = os.path.join(directory, "part_numbers.txt")
+        map_path = os.path.join(directory, "part_number_to_id.json")
+        snapshot_path = os.path.join(directory, "catalog.snapshot")
+        build_catalog_snapshot(directory, snapshot_path)
+        lines, part_number_to_id = read_lines(parts_path), read_dictionary_json(map_path)
+        random.seed(1)
+        hits = random.sample(list(part_number_to_id), min(20000, len(part_number_to_id)))
+        misses = [key + "q9" for key in hits]
+
+        rows = []
+        (part_numbers, records), size, elapsed = measure(lambda: (set(read_lines(parts_path)),
+                                                                  read_dictionary_json(map_path)))
+        rows.append(("set/dict", size, 0, elapsed, part_numbers, records))
+        catalog, size, elapsed = measure(lambda: load_catalog_snapshot(snapshot_path))
+        rows.append(("compact snapshot", size, os.path.getsize(snapshot_path), elapsed, catalog.part_numbers,
+                     catalog.part_number_to_id))
+        (part_numbers, records), size, elapsed = measure(
+            lambda: (lambda index: (PartNumberSet(index), PartNumberMap(index)))(
+                PartIndex(build_part_index(lines, part_number_to_id))))
+        rows.append(("compact in memory", size, 0, elapsed, part_numbers, records))
+
+        print("{} keys".format(len(part_number_to_id)))
+        print("{:18} {:>9} {:>9} {:>9} {:>9} {:>9}".format("", "heap MB", "mmap MB", "load s", "hit us", "miss us"))
+        for name, size, mapped, elapsed, part_numbers, records in rows:
+            print("{:18} {:9.1f} {:9.1f} {:9.3f} {:9.2f} {:9.2f}".format(
+                name, size / 2 ** 20, mapped / 2 ** 20, elapsed, lookup_time(part_numbers, records, hits),
+                lookup_time(part_numbers, records, misses)))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+import random
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from src.quantity_parser import string_quantity_to_integer, is_integer, string_quantities_to_integers, integer_mask
+
+
+# Quantity column parsing cell by cell (string_quantity_to_integer/ is_integer) and per column
+# (string_quantities_to_integers/ integer_mask) on quantity strings of the usual shapes.
+# usage: python bench/bench_quantity_parser.py [cells]   (default 200000)
+FORMS = [lambda: str(random.randint(1, 99999)), lambda: "{:,}".format(random.randint(1000, 9999999)),
+         lambda: "{}k".format(random.randint(1, 99)), lambda: "{:.1f}K".format(random.random()),
+         lambda: "{} pcs".format(random.randint(1, 999)), lambda: "-{}".format(random.randint(1, 99)),
+         lambda: "{} pieces".format(random.randint(1, 999))]
+
+
+def timed(function, cells):
+    start = time.time()
+    result = function(cells)
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    cells = [random.choice(FORMS)() for _ in range(count)]
+    for name, scalar, column in [("string_quantity_to_integer", string_quantity_to_integer, string_quantities_to_integers),
+                                 ("is_integer", is_integer, integer_mask)]:
+        expected, scalar_time = timed(lambda values: [scalar(value) for value in values], cells)
+        got, column_time = timed(column, cells)
+        print("{:27} {} cells: per cell {:.3f}s, per column {:.3f}s, same results: {}".format(
+            name, count, scalar_time, column_time, [bool(v) if name == "is_integer" else v for v in expected] == list(got)))
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import socket
+import threading
+import subprocess
+import requests
+import pandas as pd
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+# Load test of the production server: gunicorn -c gunicorn.conf.py is started with the given workers/ threads
+# (the catalog of src/config.py), clients upload distinct csv files (a sample workbook with a different number of
+# trailing blank lines, so the result cache never answers) as fast as they can for the given time. Prints
+# requests/s, errors, p50/p99 latency and the memory of every worker.
+# usage: python bench/load_test.py [workers] [threads] [clients] [seconds]
+#        (defaults: SERVER_WORKERS, SERVER_THREADS, 8 clients, 30 s; workers 0 = one per core)
+# Worker scaling needs a multi-core host, run there for each worker count (here 4 threads, 8 clients, 15 s):
+#   for workers in 1 2 4 8; do python bench/load_test.py $workers 4 8 15; done
+# Only a single core host (nproc = 1) was available so far, the numbers below show what extra workers cost on one
+# core, not how they scale. 50k part catalog, two runs each, 0 errors:
+#   1 worker  91.4/ 90.6 req/s, p50 88 ms, p99 120/ 116 ms, 51 MB private
+#   2 workers 88.3/ 88.7 req/s, p50 89 ms, p99 148/ 143 ms, 33-34 MB private each
+#   4 workers 83.8/ 84.7 req/s, p50 85/ 92 ms, p99 196/ 171 ms, 23-29 MB private each
+UPLOAD = os.path.join(ROOT, "data", "excel", "check stock for mg0248 shortage 20180412.xlsx")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def worker_memory(master_pid):
+    # (pid, RSS MB, private MB) of the gunicorn workers
+    with open("/proc/{0}/task/{0}/children".format(master_pid)) as fp:
+        pids = [int(pid) for pid in fp.read().split()]
+    result = []
+    for pid in pids:
+        values = {}
+        with open("/proc/{}/smaps_rollup".format(pid)) as fp:
+            for line in fp:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    values[parts[0].rstrip(":")] = int(parts[1])
+        result.append((pid, values.get("Rss", 0) / 1024.0,
+                       (values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)) / 1024.0))
+    return result
+
+
+def run_clients(url, body, clients, seconds):
+    stop = time.time() + seconds
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def client(index):
+        session, n = requests.Session(), 0
+        while time.time() < stop:
+            n += 1
+            upload = body + b"\n" * (index * 1000 + n)   # distinct content, same records
+            start = time.time()
+            status = session.post(url, files={"file": ("u{}_{}.csv".format(index, n), upload)}).status_code
+            with lock:
+                latencies.append(time.time() - start)
+                errors[0] += status != 200
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.time() - start
+
+
+if __name__ == '__main__':
+    from src.config import SERVER_WORKERS, SERVER_THREADS
+    args = [int(arg) for arg in sys.argv[1:]]
+    workers, threads, clients, seconds = args + [SERVER_WORKERS, SERVER_THREADS, 8, 30][len(args):]
+    workers = workers or len(os.sched_getaffinity(0))
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", "127.0.0.1:{}".format(port),
+                               "-w", str(workers), "--threads", str(threads)])
+    try:
+        base = "http://127.0.0.1:{}".format(port)
+        for _ in range(600):
+            try:
+                if requests.get(base + "/api/metrics").status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.5)
+        body = pd.read_excel(UPLOAD).to_csv(index=False).encode("utf-8")
+        latencies, errors, elapsed = run_clients(base + "/api/get-match-from-file/", body, clients, seconds)
+        latencies.sort()
+        print("{} workers x {} threads, {} clients, {:.0f} s: {:.1f} req/s, {} errors, p50 {:.0f} ms, p99 {:.0f} ms".format(
+            workers, threads, clients, elapsed, (len(latencies) - errors) / elapsed, errors,
+            latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+        for pid, rss, private in worker_memory(server.pid):
+            print("worker {}: RSS {:.0f} MB, private {:.0f} MB".format(pid, rss, private))
+    finally:
+        server.terminate()
+        server.wait()
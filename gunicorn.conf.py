@@ -0,0 +1,16 @@
+import os
+from src.config import SERVER_BIND, SERVER_WORKERS, SERVER_THREADS, SERVER_TIMEOUT
+
+
+# Production server: gunicorn -c gunicorn.conf.py
+# -----------------------------------------------
+# The app is preloaded once in the master (catalog, warm up, gc.freeze in api.create_app) and SERVER_WORKERS
+# worker processes are forked from it, sharing its memory copy-on-write, each serving SERVER_THREADS requests at a
+# time. Per worker state (catalog watcher, table pool, upstream session, caches) is started in the worker itself.
+wsgi_app = "api:create_app()"
+bind = SERVER_BIND
+workers = SERVER_WORKERS or len(os.sched_getaffinity(0))
+threads = SERVER_THREADS
+worker_class = "gthread"
+preload_app = True
+timeout = SERVER_TIMEOUT
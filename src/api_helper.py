@@ -7,7 +7,22 @@ from cleanco import cleanco
 import re
 import json
 import requests
-from collections import defaultdict
+from collections import defaultdict, Counter
+from functools import lru_cache
+try:
+    from src.config import NORMALIZATION_CACHE_SIZE, ADAPTIVE_DETECTION, DETECTION_SAMPLE_MIN_ROWS, \
+        DETECTION_SAMPLE_SIZE, DETECTION_CONFIDENCE_MARGIN, HEADER_SEARCH_ROWS
+    from src.quantity_parser import string_quantity_to_integer, is_integer, parse_quantities, \
+        string_quantities_to_integers, integer_mask
+    from src.upstream import fetch_page
+    from src.html_tables import read_html_tables
+except:
+    from config import NORMALIZATION_CACHE_SIZE, ADAPTIVE_DETECTION, DETECTION_SAMPLE_MIN_ROWS, \
+        DETECTION_SAMPLE_SIZE, DETECTION_CONFIDENCE_MARGIN, HEADER_SEARCH_ROWS
+    from quantity_parser import string_quantity_to_integer, is_integer, parse_quantities, \
+        string_quantities_to_integers, integer_mask
+    from upstream import fetch_page
+    from html_tables import read_html_tables
 
 
 # Global Variables Used All Over
@@ -39,26 +54,6 @@ def read_dictionary_json(file_path):
         return json.load(fp)
 
 
-def string_quantity_to_integer(string_number):
-    try:
-        if string_number != string_number:
-            # nan converted to zero
-            return 0
-        if type(string_number) in [int, float]:
-            return int(float(string_number))
-        string_number = re.sub(r"[^0-9k\.\-]*", "", str(string_number).strip().lower())   # preserver minus sign
-        is_k = True if string_number.strip().endswith("k") else False
-        if is_k:
-            element = re.sub(r"[^0-9\.]*", "", string_number.replace("k", "")).strip()
-            if bool(re.match(r'^(\d+\.\d+)?$', element)):
-                return int(float(element) * 1000.0)
-            else:
-                return int(element) * 1000
-        return int(float(re.sub(r"[^0-9\.\-]*", "", string_number).strip()))
-    except Exception as e:
-        return False
-
-
 def write_to_pickle(obj, file_path):
     with open(file_path, 'wb') as fp:
         pickle.dump(obj, fp)
@@ -74,87 +69,138 @@ def remove_punctuations(text):
     return re.sub(r"[^a-zA-Z0-9 ]*", "", str(text)).strip().lower()
 
 
-def clean_brand_name(text):
+# Normalization is memoized process-wide on the string form of a cell, so a manufacturer string repeated
+# all over a sheet (and re-checked by every detector) pays the cleanco cost once
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def _clean_brand_name(text):
+    if len(text.split()) <= 1:
+        # cleanco only strips legal terms after a space, for a single token it's a no-op after remove_punctuations
+        return remove_punctuations(text)
     # remove punctuations
-    return remove_punctuations(cleanco(str(text)).clean_name())
+    return remove_punctuations(cleanco(text).clean_name())
 
 
-def clean_part_number(pn):
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def _clean_part_number(pn):
     # only alphanumeric allowed
-    return re.sub(r"[^a-zA-Z0-9]*", "", str(pn)).strip().lower()
+    return re.sub(r"[^a-zA-Z0-9]*", "", pn).strip().lower()
 
 
-def is_integer(element):
-    try:
-        if type(element) == int:
-            return True
-        if element != element:
-            return False
+def clean_brand_name(text):
+    return _clean_brand_name(str(text))
 
-        qty_related_words = ["pieces", "piece", "k", "qty"]   # not implemented yet, .replace() used instead
-        element = str(element).lower().replace(r'k', '').replace("pieces", "").replace("piece", "").replace(",", "").strip()
-        if element.isdigit():
-            return True
-        elif float(element) or int(element):
-            return True
-        return False
-    except Exception as e:
-        return False
+
+def clean_part_number(pn):
+    return _clean_part_number(str(pn))
 
 
-def get_tables_from_url(url):
-    tables = pd.read_html(url, encoding="utf-8")
+def clean_brand_names(values):
+    # clean_brand_name over an array of strings, single tokens (part numbers, quantities...) in one vectorized pass
+    values = pd.Series(values, dtype=object)
+    single_token = values.str.split().str.len() <= 1
+    cleaned = values.str.replace(r"[^a-zA-Z0-9 ]", "", regex=True).str.strip().str.lower()
+    cleaned[~single_token] = [clean_brand_name(v) for v in values[~single_token]]
+    return cleaned.values
+
+
+def clean_part_numbers(values):
+    # clean_part_number over an array of strings
+    return pd.Series(values, dtype=object).str.replace(r"[^a-zA-Z0-9]", "", regex=True).str.lower().values
+
+
+def normalization_cache_info():
+    info = {}
+    for name, cache in [("brand_name", _clean_brand_name), ("part_number", _clean_part_number)]:
+        hits, misses, maxsize, currsize = cache.cache_info()
+        info[name] = {"hits": hits, "misses": misses, "maxsize": maxsize, "size": currsize}
+    return info
+
+
+def clear_normalization_cache():
+    # on a catalog swap: brands of the old catalog are not kept around (hit/ miss counts start over too)
+    _clean_brand_name.cache_clear()
+    _clean_part_number.cache_clear()
+
+
+def warm_normalization_cache(BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID):
+    # pre-clean every catalog brand name/ alias, raw (as written in sheets) and already cleaned forms
+    for brand_to_id in [BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID]:
+        for key, record in brand_to_id.items():
+            clean_brand_name(key)
+            for field in ["brand_name", "brand_alias"]:
+                if record.get(field):
+                    clean_brand_name(record[field])
+    return normalization_cache_info()
+
+
+def get_tables_from_page(content):
+    # data tables of a fetched page (layout/ tiny tables dropped), same DataFrames as pd.read_html
+    tables = read_html_tables(content)
     return tables
 
 
+def get_tables_from_url(url):
+    # fetched over the pooled upstream session (keep-alive, timeouts, retries)
+    return get_tables_from_page(fetch_page(url))
+
+
 def exist_brand_alias_or_part(row, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
-    return any([set(map(clean_brand_name, row)).intersection(BRAND_NAMES),
-                set(map(clean_brand_name, row)).intersection(BRAND_ALIASES),
-                set(map(clean_part_number, row)).intersection(PART_NUMBERS)])
+    return any([BRAND_NAMES.intersection(set(map(clean_brand_name, row))),
+                BRAND_ALIASES.intersection(set(map(clean_brand_name, row))),
+                PART_NUMBERS.intersection(set(map(clean_part_number, row)))])
+
+
+def is_header_row(row, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # a quantity keyword, no integer and no brand_name/ brand_alias/ part_number;
+    # cheap keyword and integer checks run before the catalog check
+    global quantity_keywords
+    if any([qty_elt in str(df_elt).lower() for df_elt in row for qty_elt in quantity_keywords]):
+        if not any([is_integer(clm) for clm in row]) and \
+                not exist_brand_alias_or_part(row, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+            return True
+    return False
+
+
+def find_header_row(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # header row = first header-like row of the leading HEADER_SEARCH_ROWS rows
+    window = df.head(HEADER_SEARCH_ROWS) if HEADER_SEARCH_ROWS else df
+    for row_number, row in zip(window.index, window.values):
+        if is_header_row(row, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+            return {"status": True, "row_number": row_number}
+    return {"status": False, "row_number": None}
 
 
 def fix_data_frame(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
     global quantity_keywords
     global invalid_brand_names
     df.columns = pd.Series([str(c) for c in df.columns])
-    df = df.dropna(axis=0, how="all").drop_duplicates()
+    df = df.dropna(axis=0, how="all")
     df = df.dropna(axis=1, how="all")
-    table_header = {"status": False, "row_number": None}
     # removing 'manufacturer' and 'L/T' from matches, since it's mostly part of header
     # following condition will check if no brand_name, brand_alias and part_number exists first row
     # plus none of the column headers is integer, then surely it's a table header
     df_columns = [str(elt).lower() for elt in df.columns]
     if any([qty_elt in str(df_elt).lower() for df_elt in df_columns for qty_elt in quantity_keywords]):
-        if not exist_brand_alias_or_part(df_columns, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS) and not \
-                any([is_integer(clm) for clm in df_columns]):
-            return df, {"status": True, "row_number": -1}
-
-    for row in df.iterrows():
-        if any([qty_elt in str(df_elt).lower() for df_elt in row[1] for qty_elt in quantity_keywords]):
-            if not exist_brand_alias_or_part(row[1], BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS) and not \
-                    any([is_integer(clm) for clm in row[1]]):
-                table_header = {"status": True, "row_number": row[0]}
-                break
+        if not any([is_integer(clm) for clm in df_columns]) and \
+                not exist_brand_alias_or_part(df_columns, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+            return df.drop_duplicates(), {"status": True, "row_number": -1}
 
-    # if exist_brand_alias_or_part(df_columns, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS) or \
-    #         any([is_integer(clm) for clm in df_columns]):
-    #     table_header = {"status": False, "row_number": None}
-    #     break
-    return df, table_header
+    # duplicates dropped after the header search, the first occurrence of a row (and its label) is the one kept
+    table_header = find_header_row(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+    return df.drop_duplicates(), table_header
 
 
-def get_brand_name_column(df, table_header, BRAND_NAMES, BRAND_ALIASES):
+def get_brand_name_column(profile, BRAND_NAMES, BRAND_ALIASES):
     try:
-        if table_header["status"] and table_header["row_number"] != -1:
-            df = df[table_header["row_number"]+1:]
         brands = BRAND_NAMES.union(BRAND_ALIASES)
+        scores = profile.catalog_scores("brand", brands)
         columns_ratio = {}
-        for column in df.columns:
-            unique_elements = set([x for x in list(map(clean_brand_name, [elt for elt in df[column].values if elt and elt == elt])) if x])
+        for column in profile.columns:
+            hits, unique_elements = scores[column]
             if not unique_elements:
                 continue
-            intersection = brands.intersection(unique_elements)
-            columns_ratio[column] = len(intersection) / (df.shape[0] / len(unique_elements))
+            columns_ratio[column] = hits / (profile.row_count / unique_elements)
+        profile.ratios["brand_name"] = columns_ratio
         if not columns_ratio or sum(columns_ratio.values()) == 0:
             return False
         return max(columns_ratio.items(), key=operator.itemgetter(1))[0]
@@ -163,7 +209,7 @@ def get_brand_name_column(df, table_header, BRAND_NAMES, BRAND_ALIASES):
         return False
 
 
-def get_quantity_column(df, table_header):
+def get_quantity_column(profile):
     try:
         def is_qty_clm(clm_name, header_row, table_header):
             global quantity_keywords
@@ -175,25 +221,20 @@ def get_quantity_column(df, table_header):
             return False
 
         quantity_column, suggested_quantity_column = False, False
-        header_row = None   # make a copy of DF without header_row for ratios
-        if table_header["status"]:
-            if table_header["row_number"] != -1:
-                header_row = df.iloc[table_header["row_number"]]
-                df = df[table_header["row_number"]+1:]
-            else:
-                header_row = pd.Series(df.columns)
+        table_header, header_row = profile.table_header, profile.header_row
 
+        scores = profile.quantity_scores()
         columns_ratio = {}
-        for column in df.columns:
-            unique_elements = set([str(elt).lower().strip() for elt in df[column] if elt and elt == elt])
+        for column in profile.columns:
+            integer_elements, unique_elements, max_quantity = scores[column]
             if not unique_elements:
                 continue
 
-            integer_elements = set([elt for elt in unique_elements if is_integer(elt)])
-            if integer_elements and max([string_quantity_to_integer(elt) for elt in integer_elements]) > 1000000:
+            if integer_elements and max_quantity > 1000000:
                 if not is_qty_clm(column, header_row, table_header):
                     continue   # integer values more than 100k/row then ignore that row [or column]
-            columns_ratio[column] = len(integer_elements) / len(set(unique_elements))
+            columns_ratio[column] = integer_elements / unique_elements
+        profile.ratios["quantity"] = columns_ratio
 
         if table_header["status"]:
             non_qty_clms = []
@@ -213,8 +254,8 @@ def get_quantity_column(df, table_header):
             highest_ratio = max(_columns_ratio.items(), key=operator.itemgetter(1))
             _columns_ratio.pop(highest_ratio[0])
             second_highest_ratio = max(_columns_ratio.items(), key=operator.itemgetter(1))
-            hr_sum = sum([string_quantity_to_integer(elt) for elt in df[highest_ratio[0]] if is_integer(elt)])
-            shr_sum = sum([string_quantity_to_integer(elt) for elt in df[second_highest_ratio[0]] if is_integer(elt)])
+            hr_sum = profile.quantity_sum(highest_ratio[0])
+            shr_sum = profile.quantity_sum(second_highest_ratio[0])
             suggested_quantity_column = highest_ratio[0] if (abs(hr_sum) > abs(shr_sum)) else second_highest_ratio[0]
 
         if not columns_ratio or sum(columns_ratio.values()) == 0:
@@ -227,7 +268,7 @@ def get_quantity_column(df, table_header):
         return False
 
 
-def get_part_number_column(df, table_header, brand_name_column, quantity_column, PART_NUMBERS):
+def get_part_number_column(profile, brand_name_column, quantity_column, PART_NUMBERS):
     try:
         def item_clm_index(header_row, column_names):
             global item_number_keywords
@@ -236,20 +277,16 @@ def get_part_number_column(df, table_header, brand_name_column, quantity_column,
                     return True, column_names[index]
             return False, None
 
-        header_row = None
-        if table_header["status"]:
-            if table_header["row_number"] != -1:
-                header_row = df.iloc[table_header["row_number"]]
-                df = df[table_header["row_number"]+1:]
-            else:
-                header_row = pd.Series(df.columns)
+        table_header, header_row = profile.table_header, profile.header_row
 
+        scores = profile.catalog_scores("part", PART_NUMBERS)
         columns_ratio = {}
-        for column in df.columns:
-            unique_elements = set(list(map(clean_part_number, [elt for elt in df[column].values if elt and elt == elt])))
+        for column in profile.columns:
+            hits, unique_elements = scores[column]
             if not unique_elements:
                 continue
-            columns_ratio[column] = len(PART_NUMBERS.intersection(unique_elements)) / (df.shape[0] / len(unique_elements))
+            columns_ratio[column] = hits / (profile.row_count / unique_elements)
+        profile.ratios["part_number"] = columns_ratio
 
         non_part_number_clms = []   # just to avoid Error: "called before assignment"
         if brand_name_column:
@@ -258,7 +295,7 @@ def get_part_number_column(df, table_header, brand_name_column, quantity_column,
             non_part_number_clms.append(quantity_column)
 
         if table_header["status"]:
-            item_clm_exist, item_clm_name = item_clm_index(header_row, df.columns)
+            item_clm_exist, item_clm_name = item_clm_index(header_row, profile.columns)
             if item_clm_exist:
                 non_part_number_clms.append(item_clm_name)
 
@@ -276,37 +313,32 @@ def get_part_number_column(df, table_header, brand_name_column, quantity_column,
 
 
 # Detect patter for brand_name and part_number in same column
-def check_existing_patterns(df, table_header, brand_name_column, part_number_column,
+def check_existing_patterns(profile, brand_name_column, part_number_column,
                             BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
     obn, opn = brand_name_column, part_number_column
 
     pattern_splitters = ["#", "(", "/"]
-    brands = BRAND_NAMES.union(BRAND_ALIASES)
-    if table_header["status"]:
-        if table_header["row_number"] != -1:
-            df = df[table_header["row_number"] + 1:]
+    fragments = profile.fragments(BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
 
     spltr_ratios_sample = {"b#p": 0,  "p#b": 0,  "b(p": 0, "p(b": 0,  "b/p": 0, "p/b": 0}
-    column_pattern_ratios = dict((k,  spltr_ratios_sample.copy()) for k in df.columns.values)
-    column_ratios = dict.fromkeys(df.columns.values, 0)
+    column_pattern_ratios = dict((k,  spltr_ratios_sample.copy()) for k in profile.columns)
+    column_ratios = dict.fromkeys(profile.columns, 0)
 
     for splitter in pattern_splitters:
-        for clm in df.columns.values:
-            for row in df[clm].values:
-                if len(str(row).split(splitter)) == 2:
-                    row_splits = str(row).split(splitter)
+        for clm in profile.columns:
+            for row, count in profile.cell_counts(clm).items():
+                row_splits = row.split(splitter)
+                if len(row_splits) == 2:
                     # brand_name <--splitter--> part_number
-                    if brands.intersection({clean_brand_name(row_splits[0])}) or \
-                            PART_NUMBERS.intersection({clean_part_number(row_splits[1])}):
-                        column_pattern_ratios[clm]["b" + splitter + "p"] += 1
-                        column_ratios[clm] += 1
-                    elif brands.intersection({clean_brand_name(row_splits[1])}) or \
-                            PART_NUMBERS.intersection({clean_part_number(row_splits[0])}):
-                        column_pattern_ratios[clm]["p" + splitter + "b"] += 1
-                        column_ratios[clm] += 1
+                    if fragments.hits(row_splits[0])[0] or fragments.hits(row_splits[1])[1]:
+                        column_pattern_ratios[clm]["b" + splitter + "p"] += count
+                        column_ratios[clm] += count
+                    elif fragments.hits(row_splits[1])[0] or fragments.hits(row_splits[0])[1]:
+                        column_pattern_ratios[clm]["p" + splitter + "b"] += count
+                        column_ratios[clm] += count
 
     best_column = max(column_ratios.items(), key=operator.itemgetter(1))[0] if\
-        sum(column_ratios.values()) is not 0 else ""
+        sum(column_ratios.values()) != 0 else ""
     best_pattern = max(column_pattern_ratios[best_column].items(), key=operator.itemgetter(1))[0] if\
         best_column else ""
 
@@ -340,40 +372,28 @@ def get_brand_name_part_number_with_pattern(row, brand_name_column, part_number_
 
 
 # Split brand_name and part_number from mixed column
-def try_search_with_splitter(df, table_header, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+def split_candidates(cell, splitter):
+    # fragments of a cell split by splitter, plus every fragment split again by all other splitters
+    cell_splits = [elt for elt in cell.split(splitter) if elt and elt == elt]
+    candidate_cell_splits = cell_splits.copy()
+    for elt in cell_splits:
+        for spltr in [s for s in possible_splitter if s in elt]:
+            candidate_cell_splits += elt.split(spltr)
+    return candidate_cell_splits
+
+
+def try_search_with_splitter(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
     try:
         global possible_splitter
-        brands = BRAND_NAMES.union(BRAND_ALIASES)
-
-        header_row = None
-        if table_header["status"]:
-            if table_header["row_number"] != -1:
-                header_row = df.iloc[table_header["row_number"]]
-                df = df[table_header["row_number"] + 1:]
-            else:
-                header_row = pd.Series(df.columns)
+        fragments = profile.fragments(BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
 
         splitter_ratios = []
         for splitter in possible_splitter:
-            column_ratios = dict.fromkeys(df.columns.values, 0)
-            for clm in df.columns.values:
-                for row in df[clm].values:
-                    row_splits = [elt for elt in str(row).split(splitter) if elt and elt == elt]
-
-                    candidate_row_splits = row_splits.copy()
-                    for elt in row_splits:
-                        spltrs = [s for s in possible_splitter if s in elt]
-                        if spltrs:
-                            for spltr in spltrs:
-                                candidate_row_splits += elt.split(spltr)
-
-                    brand_matches = brands.intersection(
-                        set([x for x in list(map(clean_brand_name, candidate_row_splits)) if x]))
-                    part_number_matches = PART_NUMBERS.intersection(
-                        set([x for x in list(map(clean_part_number, candidate_row_splits)) if x]))
-
-                    if brand_matches or part_number_matches:
-                        column_ratios[clm] += 1
+            column_ratios = dict.fromkeys(profile.columns, 0)
+            for clm in profile.columns:
+                for row, count in profile.cell_counts(clm).items():
+                    if fragments.split_hits(row)[splitter]:
+                        column_ratios[clm] += count
 
             if not column_ratios or sum(column_ratios.values()) == 0:
                 splitter_ratios.append({"splitter": splitter, "column": False,  "max_matches": 0})
@@ -383,7 +403,7 @@ def try_search_with_splitter(df, table_header, BRAND_NAMES, BRAND_ALIASES, PART_
 
         # check if splitter_ratios is empty
         best_match = max(splitter_ratios, key=lambda x: x["max_matches"])
-        if best_match["max_matches"] is 0 or best_match["column"] is False:
+        if best_match["max_matches"] == 0 or best_match["column"] is False:
             return False, False
         return best_match, best_match
     except Exception:
@@ -402,15 +422,7 @@ def get_brand_name_part_number_with_splitter(row, brand_name_column, part_number
             return extracted_brand_name, extracted_part_number
 
         cell = row[brand_name_column["column"]]
-        splitter = brand_name_column["splitter"]
-        cell_splits = [elt for elt in str(cell).split(splitter) if elt and elt == elt]
-
-        candidate_cell_splits = cell_splits.copy()
-        for elt in cell_splits:
-            spltrs = [s for s in possible_splitter if s in elt]
-            if spltrs:
-                for spltr in spltrs:
-                    candidate_cell_splits += elt.split(spltr)
+        candidate_cell_splits = split_candidates(str(cell), brand_name_column["splitter"])
 
         brand_matches = brands.intersection(
             set([x for x in list(map(clean_brand_name, candidate_cell_splits)) if x]))
@@ -431,15 +443,13 @@ def get_brand_name_part_number_with_splitter(row, brand_name_column, part_number
         return "", ""
 
 
-def try_search_with_keywords(df, table_header, brand_name_column, part_number_column, suggested_quantity_column):
+def try_search_with_keywords(profile, brand_name_column, part_number_column, suggested_quantity_column):
     try:
         global brand_name_header_keywords
         global part_number_header_keywords
         global quantity_header_keywords
 
-        df.columns = pd.Series([str(c) for c in df.columns])
-        df = df.dropna(axis=0, how="all").drop_duplicates()
-        df = df.dropna(axis=1, how="all")
+        df = profile.frame   # already cleaned by fix_data_frame (str columns, empty rows/ columns and duplicates dropped)
         table_header = {"status": False, "row_number": None}
         sbnc, spnc, sqc = False, False, False
 
@@ -514,6 +524,65 @@ def try_search_with_keywords(df, table_header, brand_name_column, part_number_co
         return brand_name_column, part_number_column, suggested_quantity_column, table_header, df
 
 
+# Adaptive detection on a row sample, counts of sampled decisions and full scans since startup
+detection_sample_stats = Counter()
+
+
+def is_confident(columns_ratio, margin):
+    # best column leads the runner-up by margin (relative to the best ratio)
+    ratios = sorted(columns_ratio.values(), reverse=True) if columns_ratio else []
+    if not ratios or ratios[0] <= 0:
+        return False
+    runner_up = ratios[1] if len(ratios) > 1 else 0
+    return ratios[0] - runner_up >= margin * ratios[0]
+
+
+def detect_with_sample(profile, name, detect):
+    # run detect(profile) on a stratified sample of rows first, keep the sampled answer only when it is clear
+    if not ADAPTIVE_DETECTION or profile.row_count < DETECTION_SAMPLE_MIN_ROWS:
+        return detect(profile)
+    sample = profile.sample(DETECTION_SAMPLE_SIZE)
+    result = detect(sample)
+    if is_confident(sample.ratios.get(name), DETECTION_CONFIDENCE_MARGIN):
+        detection_sample_stats[name + "_sampled"] += 1
+        return result
+    detection_sample_stats[name + "_full_scan"] += 1
+    return detect(profile)
+
+
+def detection_sample_info():
+    # how often the row sample was enough, per detector
+    return dict(detection_sample_stats)
+
+
+def detect_columns(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # full detection cascade for one table, every step reads the same TableProfile
+    table_header, df = profile.table_header, profile.frame
+    brand_name_column = detect_with_sample(profile, "brand_name", lambda p: get_brand_name_column(
+        p, BRAND_NAMES, BRAND_ALIASES))
+    quantity_column, suggested_quantity_column = detect_with_sample(profile, "quantity", get_quantity_column)
+    part_number_column = detect_with_sample(profile, "part_number", lambda p: get_part_number_column(
+        p, brand_name_column, quantity_column, PART_NUMBERS))
+
+    # Check Existing Patterns for brand_names and part_numbers (PN#BN, PN/BN, PN(BN)...)
+    if brand_name_column is False or part_number_column is False:
+        brand_name_column, part_number_column = check_existing_patterns(profile, brand_name_column,
+                                                                        part_number_column, BRAND_NAMES,
+                                                                        BRAND_ALIASES, PART_NUMBERS)
+
+    # Check B.N. and P.N. columns merged with others
+    if brand_name_column is False and part_number_column is False:
+        brand_name_column, part_number_column = try_search_with_splitter(profile, BRAND_NAMES,
+                                                                         BRAND_ALIASES, PART_NUMBERS)
+
+    # Check column header with keyword based search
+    if brand_name_column is False or part_number_column is False:
+        brand_name_column, part_number_column, suggested_quantity_column, table_header, df = \
+            try_search_with_keywords(profile, brand_name_column, part_number_column, suggested_quantity_column)
+
+    return brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df
+
+
 # --------------------------------------------------------------------------------
 def get_row_match(row, brand_name_column, quantity_column, part_number_column,
                   BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
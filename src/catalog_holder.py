@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+import traceback
+from collections import Counter
+try:
+    from src.config import *
+    from src.catalog_snapshot import load_catalog, source_fingerprint, catalog_update_running
+    from src.result_cache import set_result_catalog_version
+    from src.layout_cache import set_layout_catalog_version
+    from src.api_helper import warm_normalization_cache, clear_normalization_cache
+except:
+    from config import *
+    from catalog_snapshot import load_catalog, source_fingerprint, catalog_update_running
+    from result_cache import set_result_catalog_version
+    from layout_cache import set_layout_catalog_version
+    from api_helper import warm_normalization_cache, clear_normalization_cache
+
+
+# Catalog holder
+# --------------
+# The catalog of this worker process (snapshot or text/JSON fallback) behind one reference. A request takes it
+# once with current_catalog() and uses that catalog to its end, a reload builds the new catalog aside in a
+# background thread and replaces the reference in a single assignment, so no request sees parts of two catalogs.
+# Reloads are started by the watcher (snapshot/ source files changed, checked every CATALOG_RELOAD_INTERVAL
+# seconds) or by the admin endpoint. The old catalog is freed when its last request is done.
+catalog_state = {"catalog": None, "signature": None, "watcher_pid": None}
+catalog_reload_lock = threading.Lock()
+catalog_watcher_lock = threading.Lock()
+catalog_holder_stats = Counter()
+
+
+def _reset_after_fork():
+    # a reload/ watcher thread of the parent does not exist in a forked child
+    global catalog_reload_lock
+    global catalog_watcher_lock
+    catalog_reload_lock = threading.Lock()
+    catalog_watcher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def catalog_signature():
+    # cheap change check: source/ delta files fingerprint and the snapshot file identity
+    try:
+        stat = os.stat(CATALOG_SNAPSHOT_PATH)
+        snapshot = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+    except FileNotFoundError:
+        snapshot = None
+    return [source_fingerprint(CATALOG_SOURCE_DIR), snapshot]
+
+
+def _install_catalog(catalog, signature):
+    # caches filled with the old catalog go in the same swap: results and layouts of other versions are dropped
+    # (results are keyed on the version too), normalized strings are dropped and the new brands warmed
+    set_result_catalog_version(catalog.version)
+    set_layout_catalog_version(catalog.version)
+    clear_normalization_cache()
+    if WARM_NORMALIZATION_CACHE:
+        warm_normalization_cache(catalog.brand_name_to_id, catalog.brand_alias_to_id)
+    catalog_state["catalog"] = catalog
+    catalog_state["signature"] = signature
+
+
+def current_catalog():
+    catalog = catalog_state["catalog"]
+    if catalog is None:
+        with catalog_reload_lock:
+            if catalog_state["catalog"] is None:
+                signature = catalog_signature()
+                _install_catalog(load_catalog(CATALOG_SNAPSHOT_PATH, CATALOG_SOURCE_DIR), signature)
+            catalog = catalog_state["catalog"]
+    return catalog
+
+
+def reload_catalog(force=False):
+    # loads the catalog again if its files changed (always with force), True when a new version was swapped in.
+    # Skipped while a crawl/ sync holds the update lock or another reload is running
+    if catalog_update_running(CATALOG_SOURCE_DIR):
+        return False
+    if not catalog_reload_lock.acquire(blocking=False):
+        return False
+    try:
+        signature = catalog_signature()
+        if not force and signature == catalog_state["signature"]:
+            return False
+        catalog_holder_stats["reloads"] += 1
+        catalog = load_catalog(CATALOG_SNAPSHOT_PATH, CATALOG_SOURCE_DIR)
+        old = catalog_state["catalog"]
+        if old is not None and catalog.version == old.version and catalog.source == old.source:
+            catalog_state["signature"] = signature   # touched, same content: keep the catalog (and table pool)
+            return False
+        _install_catalog(catalog, signature)
+        catalog_holder_stats["swaps"] += 1
+        print("Catalog {} loaded from {} (was {})".format(catalog.version, catalog.source,
+                                                           old.version if old is not None else None))
+        return True
+    except Exception:
+        catalog_holder_stats["reload_errors"] += 1
+        traceback.print_exc()   # the current catalog stays
+        return False
+    finally:
+        catalog_reload_lock.release()
+
+
+def start_catalog_reload(force=False):
+    # reload_catalog() in a background thread, requests keep using the current catalog meanwhile
+    thread = threading.Thread(target=reload_catalog, args=(force,), name="catalog-reload", daemon=True)
+    thread.start()
+    return thread
+
+
+def _watch_catalog(pid):
+    while catalog_state["watcher_pid"] == pid:
+        time.sleep(CATALOG_RELOAD_INTERVAL)
+        reload_catalog()
+
+
+def start_catalog_watcher():
+    # one watcher thread per process (started again in a forked worker), CATALOG_RELOAD_INTERVAL = 0 disables it
+    pid = os.getpid()
+    if not CATALOG_RELOAD_INTERVAL or catalog_state["watcher_pid"] == pid:
+        return
+    with catalog_watcher_lock:
+        if catalog_state["watcher_pid"] == pid:
+            return
+        catalog_state["watcher_pid"] = pid
+    threading.Thread(target=_watch_catalog, args=(pid,), name="catalog-watcher", daemon=True).start()
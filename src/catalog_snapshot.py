@@ -0,0 +1,668 @@
+import os
+import sys
+import glob
+import fcntl
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+from array import array
+from collections import namedtuple
+try:
+    from src.config import *
+    from src.api_helper import read_lines, read_dictionary_json, invalid_brand_names, invalid_part_numbers
+    from src.part_index import build_part_index, PartIndex, PART_INDEX_SECTIONS, LISTED, HAS_RECORD
+except:
+    from config import *
+    from api_helper import read_lines, read_dictionary_json, invalid_brand_names, invalid_part_numbers
+    from part_index import build_part_index, PartIndex, PART_INDEX_SECTIONS, LISTED, HAS_RECORD
+
+
+# Binary catalog snapshot
+# -----------------------
+# Brand strings are interned once in a shared string table. The brand sets (brand_names, brand_aliases) are
+# open addressing hash indexes of string ids, the brand *_to_id maps hash indexes of (key string id, record id)
+# entries, records stored once as compact JSON and decoded on lookup only. part_numbers and part_number_to_id
+# (by far the largest) share one compact part number index (src/part_index.py) in the part_numbers.* sections.
+# The file is memory-mapped read-only, so loading it costs a few page faults instead of parsing text/JSON
+# and the pages are shared by every worker process through the OS page cache. Without an up to date snapshot,
+# CATALOG_SHARED_DIR (a tmpfs) gets one built by the first worker and mapped by all of them.
+#
+# layout:   header | section table | sections (8 byte aligned)
+SNAPSHOT_MAGIC = b"SFCATLOG"
+SNAPSHOT_FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sIIc3x40s")   # magic, format version, section count, byte order, catalog version
+SECTION = struct.Struct("<32sQQ")       # name, offset, length
+EMPTY_SLOT = -1
+
+CATALOG_SETS = ["brand_names", "brand_aliases", "part_numbers"]
+CATALOG_MAPS = ["brand_name_to_id", "brand_alias_to_id", "part_number_to_id"]
+CATALOG_SOURCES = {"brand_names": "brand_names.txt",
+                   "brand_aliases": "brand_aliases.txt",
+                   "part_numbers": "part_numbers.txt",
+                   "brand_name_to_id": "brand_name_to_id.json",
+                   "brand_alias_to_id": "brand_alias_to_id.json",
+                   "part_number_to_id": "part_number_to_id.json"}
+
+Catalog = namedtuple("Catalog", ["brand_names", "brand_aliases", "part_numbers",
+                                 "brand_name_to_id", "brand_alias_to_id", "part_number_to_id",
+                                 "version", "source"])
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _hash(key_bytes):
+    return zlib.crc32(key_bytes)
+
+
+def _capacity(n):
+    capacity = 8
+    while capacity < n * 2:
+        capacity <<= 1
+    return capacity
+
+
+def manifest_path(source_dir=CATALOG_SOURCE_DIR):
+    return os.path.join(source_dir, "catalog.manifest.json")
+
+
+def read_manifest(source_dir=CATALOG_SOURCE_DIR):
+    # {"sources": {catalog name: file name}, "deltas": [delta file names], "generation": n}: the files of the
+    # catalog, replaced by a crawl/ sync with one os.replace so a loader reads either the old files or the new
+    # ones. Before the first crawl/ sync there is none: the CATALOG_SOURCES names and every delta file
+    try:
+        with open(manifest_path(source_dir), "r") as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {"sources": dict(CATALOG_SOURCES), "generation": 0,
+                "deltas": [os.path.basename(path) for path in
+                           sorted(glob.glob(os.path.join(source_dir, "*.delta.*.jsonl")))]}
+
+
+def write_manifest(manifest, source_dir=CATALOG_SOURCE_DIR):
+    path = manifest_path(source_dir)
+    with open(path + ".tmp", "w") as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def source_paths(source_dir=CATALOG_SOURCE_DIR, manifest=None):
+    manifest = manifest or read_manifest(source_dir)
+    return dict((name, os.path.join(source_dir, file_name)) for name, file_name in manifest["sources"].items())
+
+
+def delta_paths(source_dir=CATALOG_SOURCE_DIR, manifest=None):
+    # delta files of incremental syncs (python -m src.data_extractors sync), applied in name order
+    manifest = manifest or read_manifest(source_dir)
+    return [os.path.join(source_dir, file_name) for file_name in sorted(manifest["deltas"])]
+
+
+def update_lock_path(source_dir=CATALOG_SOURCE_DIR):
+    # flock()ed while a crawl/ sync is replacing the source files and rebuilding the snapshot
+    return os.path.join(source_dir, "catalog.update.lock")
+
+
+def catalog_update_running(source_dir=CATALOG_SOURCE_DIR):
+    # True while a crawl/ sync holds the update lock (a lock file left by a killed update is not held)
+    try:
+        with open(update_lock_path(source_dir), "r") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except FileNotFoundError:
+        return False
+    except BlockingIOError:
+        return True
+    return False
+
+
+def wait_for_catalog_update(source_dir=CATALOG_SOURCE_DIR):
+    # blocks while a crawl/ sync holds the update lock
+    try:
+        with open(update_lock_path(source_dir), "r") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+    except FileNotFoundError:
+        pass
+
+
+def catalog_version(source_dir=CATALOG_SOURCE_DIR, manifest=None):
+    # content digest of all source and delta files, identical for the snapshot and the text/JSON fallback
+    manifest = manifest or read_manifest(source_dir)
+    digest = hashlib.sha1()
+    for name, path in sorted(source_paths(source_dir, manifest).items()) + \
+            [(os.path.basename(path), path) for path in delta_paths(source_dir, manifest)]:
+        digest.update(name.encode())
+        with open(path, "rb") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(source_dir=CATALOG_SOURCE_DIR, manifest=None):
+    # cheap staleness check: (size, mtime) of every source and delta file, None if a source file is missing
+    manifest = manifest or read_manifest(source_dir)
+    fingerprint = {}
+    for name, path in source_paths(source_dir, manifest).items():
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        fingerprint[name] = [stat.st_size, stat.st_mtime_ns]
+    for path in delta_paths(source_dir, manifest):
+        stat = os.stat(path)
+        fingerprint[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+def read_catalog_sources(source_dir=CATALOG_SOURCE_DIR, manifest=None):
+    # lines of every catalog set and dict of every map, with the delta files applied in order on top. A delta
+    # line [set name, key, record] adds the key to the set and maps it to the record in the matching *_to_id map,
+    # unless the key is mapped to a record with a higher id already (catalog pages are in id order, the last page
+    # listing a key wins in a full crawl)
+    manifest = manifest or read_manifest(source_dir)
+    paths = source_paths(source_dir, manifest)
+    sources = dict((name, read_lines(paths[name])) for name in CATALOG_SETS)
+    sources.update((name, read_dictionary_json(paths[name])) for name in CATALOG_MAPS)
+    for path in delta_paths(source_dir, manifest):
+        with open(path, "r") as fp:
+            for line in fp:
+                name, key, record = json.loads(line)
+                if key:
+                    sources[name].append(key)
+                mapping = sources[CATALOG_MAPS[CATALOG_SETS.index(name)]]
+                if key not in mapping or _record_id(record) is None or _record_id(mapping[key]) is None or \
+                        _record_id(record) >= _record_id(mapping[key]):
+                    mapping[key] = record
+    return sources
+
+
+def _record_id(record):
+    try:
+        return int(record["id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# --------------------------------------------------------------------------------
+# Build
+# --------------------------------------------------------------------------------
+class _SnapshotWriter(object):
+    def __init__(self):
+        self.strings = {}
+        self.string_offsets = array("I", [0])
+        self.string_blob = bytearray()
+        self.records = {}
+        self.record_offsets = array("I", [0])
+        self.record_blob = bytearray()
+        self.sections = []
+
+    def intern(self, text):
+        sid = self.strings.get(text)
+        if sid is None:
+            sid = self.strings[text] = len(self.strings)
+            self.string_blob += text.encode("utf-8")
+            self.string_offsets.append(len(self.string_blob))
+        return sid
+
+    def add_record(self, record):
+        encoded = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        rid = self.records.get(encoded)
+        if rid is None:
+            rid = self.records[encoded] = len(self.records)
+            self.record_blob += encoded
+            self.record_offsets.append(len(self.record_blob))
+        return rid
+
+    def _hash_slots(self, string_ids):
+        slots = array("i", [EMPTY_SLOT]) * _capacity(len(string_ids))
+        mask = len(slots) - 1
+        for index, sid in enumerate(string_ids):
+            start, end = self.string_offsets[sid], self.string_offsets[sid + 1]
+            i = _hash(bytes(self.string_blob[start:end])) & mask
+            while slots[i] != EMPTY_SLOT:
+                i = (i + 1) & mask
+            slots[i] = index
+        return slots
+
+    def add_set(self, name, values):
+        string_ids = array("i", sorted(set(self.intern(v) for v in values)))
+        self.sections.append((name + ".ids", string_ids.tobytes()))
+        self.sections.append((name + ".slots", self._hash_slots(string_ids).tobytes()))
+
+    def add_map(self, name, dictionary):
+        keys, values = array("i"), array("i")
+        for key, record in dictionary.items():
+            keys.append(self.intern(key))
+            values.append(self.add_record(record))
+        self.sections.append((name + ".keys", keys.tobytes()))
+        self.sections.append((name + ".values", values.tobytes()))
+        self.sections.append((name + ".slots", self._hash_slots(keys).tobytes()))
+
+    def add_part_index(self, name, part_numbers, part_number_to_id):
+        for section, data in build_part_index(part_numbers, part_number_to_id).items():
+            self.sections.append((name + "." + section, data))
+
+    def write(self, path, version):
+        if len(self.string_blob) >= 2 ** 32 or len(self.record_blob) >= 2 ** 32:
+            raise SnapshotError("catalog too large for snapshot format {}".format(SNAPSHOT_FORMAT_VERSION))
+        sections = [("strings.offsets", self.string_offsets.tobytes()),
+                    ("strings.blob", bytes(self.string_blob)),
+                    ("records.offsets", self.record_offsets.tobytes()),
+                    ("records.blob", bytes(self.record_blob))] + self.sections
+
+        offset = HEADER.size + SECTION.size * len(sections)
+        table = []
+        for name, data in sections:
+            offset += -offset % 8
+            table.append((name, offset, len(data)))
+            offset += len(data)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(sections),
+                                 b"<" if sys.byteorder == "little" else b">", version.encode()))
+            for name, section_offset, length in table:
+                fp.write(SECTION.pack(name.encode(), section_offset, length))
+            for (name, data), (_, section_offset, _) in zip(sections, table):
+                fp.write(b"\0" * (section_offset - fp.tell()))
+                fp.write(data)
+        os.replace(tmp_path, path)   # readers never see a half-written snapshot
+
+
+def build_catalog_snapshot(source_dir=CATALOG_SOURCE_DIR, snapshot_path=CATALOG_SNAPSHOT_PATH):
+    manifest = read_manifest(source_dir)
+    sources = read_catalog_sources(source_dir, manifest)
+    writer = _SnapshotWriter()
+    for name in ["brand_names", "brand_aliases"]:
+        writer.add_set(name, sources[name])
+    for name in ["brand_name_to_id", "brand_alias_to_id"]:
+        writer.add_map(name, sources[name])
+    writer.add_part_index("part_numbers", sources["part_numbers"], sources["part_number_to_id"])
+    # source fingerprint lets the loader detect text/JSON files refreshed after the build
+    writer.add_set("meta", [json.dumps(source_fingerprint(source_dir, manifest), sort_keys=True)])
+
+    version = catalog_version(source_dir, manifest)
+    writer.write(snapshot_path, version)
+    print("Catalog snapshot {} written to {} ({} strings, {} records)".format(
+        version, snapshot_path, len(writer.strings), len(writer.records)))
+    return version
+
+
+# --------------------------------------------------------------------------------
+# Load
+# --------------------------------------------------------------------------------
+class CatalogSnapshot(object):
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size < HEADER.size:   # an empty file can not even be mapped
+                raise SnapshotError("truncated snapshot: {}".format(path))
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, format_version, section_count, byte_order, version = HEADER.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError("not a catalog snapshot: {}".format(path))
+        if format_version != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotError("unsupported snapshot format {} in {}".format(format_version, path))
+        if byte_order != (b"<" if sys.byteorder == "little" else b">"):
+            raise SnapshotError("snapshot built on a machine with different byte order: {}".format(path))
+        self.version = version.decode()
+
+        if HEADER.size + SECTION.size * section_count > len(self._mmap):
+            raise SnapshotError("truncated snapshot (section table): {}".format(path))
+        # sections follow the table in order, 8 byte aligned, the last one ends the file (as written)
+        self.sections = {}
+        end = HEADER.size + SECTION.size * section_count
+        for index in range(section_count):
+            name, offset, length = SECTION.unpack_from(self._mmap, HEADER.size + SECTION.size * index)
+            if offset != end + -end % 8:
+                raise SnapshotError("corrupt section table in {}".format(path))
+            self.sections[name.rstrip(b"\0").decode()] = (offset, length)
+            end = offset + length
+        if end != len(self._mmap):
+            raise SnapshotError("truncated snapshot: {}".format(path))
+
+        self.string_offsets = self.section("strings.offsets", "I")
+        self.string_blob = self.section("strings.blob")
+        self.record_offsets = self.section("records.offsets", "I")
+        self.record_blob = self.section("records.blob")
+
+    def section(self, name, fmt=None):
+        if name not in self.sections:
+            raise SnapshotError("missing section {} in {}".format(name, self.path))
+        offset, length = self.sections[name]
+        if offset % 8 or offset + length > len(self._mmap) or length % struct.calcsize(fmt or "B"):
+            raise SnapshotError("corrupt section {} (offset {}, length {}) in {}".format(
+                name, offset, length, self.path))
+        view = self._view[offset:offset + length]
+        return view.cast(fmt) if fmt else view
+
+    def string(self, sid):
+        return self.string_blob[self.string_offsets[sid]:self.string_offsets[sid + 1]].tobytes().decode("utf-8")
+
+    def record(self, rid):
+        return json.loads(self.record_blob[self.record_offsets[rid]:self.record_offsets[rid + 1]].tobytes())
+
+    def find(self, slots, string_ids, key):
+        # index into string_ids of key, -1 if missing
+        if not isinstance(key, str):
+            return -1
+        key_bytes = key.encode("utf-8")
+        mask = len(slots) - 1
+        i = _hash(key_bytes) & mask
+        offsets, blob = self.string_offsets, self.string_blob
+        while True:
+            index = slots[i]
+            if index == EMPTY_SLOT:
+                return -1
+            sid = string_ids[index]
+            if blob[offsets[sid]:offsets[sid + 1]] == key_bytes:
+                return index
+            i = (i + 1) & mask
+
+    def part_index(self, name):
+        return PartIndex(dict((section, self.section(name + "." + section, fmt))
+                              for section, fmt in PART_INDEX_SECTIONS))
+
+    def fingerprint(self):
+        meta_ids = self.section("meta.ids", "i")
+        try:
+            return json.loads(self.string(meta_ids[0])) if len(meta_ids) else None
+        except (ValueError, IndexError) as e:
+            raise SnapshotError("corrupt fingerprint in {} ({})".format(self.path, e))
+
+
+class CatalogSet(object):
+    # set calls used by api_helper on top of __contains__/ __iter__ and excluding()
+    def intersection(self, *others):
+        result = set(elt for elt in others[0] if elt in self) if others else set(self)
+        for other in others[1:]:
+            result.intersection_update(other)
+        return result
+
+    def union(self, *others):
+        return CatalogUnion(self, *others)
+
+    def difference(self, *others):
+        excluded = set(self.excluded)
+        for other in others:
+            excluded.update(other)
+        return self.excluding(excluded)
+
+
+class SnapshotSet(CatalogSet):
+    # read-only set backed by a snapshot hash index
+    def __init__(self, snapshot, name, excluded=()):
+        self.snapshot = snapshot
+        self.name = name
+        self.excluded = frozenset(excluded)
+        self._ids = snapshot.section(name + ".ids", "i")
+        self._slots = snapshot.section(name + ".slots", "i")
+
+    def __contains__(self, key):
+        if key in self.excluded:
+            return False
+        return self.snapshot.find(self._slots, self._ids, key) != -1
+
+    def __iter__(self):
+        for sid in self._ids:
+            value = self.snapshot.string(sid)
+            if value not in self.excluded:
+                yield value
+
+    def __len__(self):
+        return len(self._ids) - sum(1 for v in self.excluded if self.snapshot.find(self._slots, self._ids, v) != -1)
+
+    def excluding(self, excluded):
+        return SnapshotSet(self.snapshot, self.name, excluded)
+
+
+class PartNumberSet(CatalogSet):
+    # read-only set of the part numbers listed in a part number index
+    def __init__(self, index, excluded=()):
+        self.index = index
+        self.excluded = frozenset(excluded)
+        self._len = None
+
+    def __contains__(self, key):
+        if key in self.excluded:
+            return False
+        position = self.index.find(key)
+        return position != -1 and bool(self.index.flags[position] & LISTED)
+
+    def __iter__(self):
+        flags = self.index.flags
+        for position, value in self.index.keys():
+            if flags[position] & LISTED and value not in self.excluded:
+                yield value
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+    def excluding(self, excluded):
+        return PartNumberSet(self.index, excluded)
+
+
+class CatalogUnion(object):
+    # lazy union view, avoids materializing BRAND_NAMES.union(BRAND_ALIASES) on every detector call
+    def __init__(self, *members):
+        self.members = members
+
+    def __contains__(self, key):
+        return any(key in member for member in self.members)
+
+    def __iter__(self):
+        seen = set()
+        for member in self.members:
+            for value in member:
+                if value not in seen:
+                    seen.add(value)
+                    yield value
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def intersection(self, *others):
+        result = set(elt for elt in others[0] if elt in self) if others else set(self)
+        for other in others[1:]:
+            result.intersection_update(other)
+        return result
+
+    def union(self, *others):
+        return CatalogUnion(*(self.members + others))
+
+
+class SnapshotMap(object):
+    # read-only mapping key -> record, records are decoded only when looked up
+    def __init__(self, snapshot, name):
+        self.snapshot = snapshot
+        self.name = name
+        self._keys = snapshot.section(name + ".keys", "i")
+        self._values = snapshot.section(name + ".values", "i")
+        self._slots = snapshot.section(name + ".slots", "i")
+
+    def __getitem__(self, key):
+        index = self.snapshot.find(self._slots, self._keys, key)
+        if index == -1:
+            raise KeyError(key)
+        return self.snapshot.record(self._values[index])
+
+    def get(self, key, default=None):
+        index = self.snapshot.find(self._slots, self._keys, key)
+        return default if index == -1 else self.snapshot.record(self._values[index])
+
+    def __contains__(self, key):
+        return self.snapshot.find(self._slots, self._keys, key) != -1
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        for sid in self._keys:
+            yield self.snapshot.string(sid)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for rid in self._values:
+            yield self.snapshot.record(rid)
+
+    def items(self):
+        for sid, rid in zip(self._keys, self._values):
+            yield self.snapshot.string(sid), self.snapshot.record(rid)
+
+
+class PartNumberMap(object):
+    # read-only mapping part number -> record of a part number index, records are built only when looked up
+    def __init__(self, index):
+        self.index = index
+        self._len = None
+
+    def _position(self, key):
+        position = self.index.find(key)
+        return position if position != -1 and self.index.flags[position] & HAS_RECORD else -1
+
+    def __getitem__(self, key):
+        position = self._position(key)
+        if position == -1:
+            raise KeyError(key)
+        return self.index.record(position, key)
+
+    def get(self, key, default=None):
+        position = self._position(key)
+        return default if position == -1 else self.index.record(position, key)
+
+    def __contains__(self, key):
+        return self._position(key) != -1
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+    def __iter__(self):
+        flags = self.index.flags
+        for position, key in self.index.keys():
+            if flags[position] & HAS_RECORD:
+                yield key
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for _, record in self.items():
+            yield record
+
+    def items(self):
+        flags = self.index.flags
+        for position, key in self.index.keys():
+            if flags[position] & HAS_RECORD:
+                yield key, self.index.record(position, key)
+
+
+def load_catalog_snapshot(snapshot_path=CATALOG_SNAPSHOT_PATH):
+    try:
+        snapshot = CatalogSnapshot(snapshot_path)
+        part_index = snapshot.part_index("part_numbers")
+    except (ValueError, TypeError, IndexError, struct.error) as e:   # anything the checks above let through
+        raise SnapshotError("corrupt snapshot {} ({})".format(snapshot_path, e))
+    return Catalog(brand_names=SnapshotSet(snapshot, "brand_names", invalid_brand_names),
+                   brand_aliases=SnapshotSet(snapshot, "brand_aliases", invalid_brand_names),
+                   part_numbers=PartNumberSet(part_index, invalid_part_numbers),
+                   brand_name_to_id=SnapshotMap(snapshot, "brand_name_to_id"),
+                   brand_alias_to_id=SnapshotMap(snapshot, "brand_alias_to_id"),
+                   part_number_to_id=PartNumberMap(part_index),
+                   version=snapshot.version,
+                   source="snapshot")
+
+
+def load_catalog_files(source_dir=CATALOG_SOURCE_DIR):
+    # fallback: original text/JSON files (and sync deltas), part numbers in a compact index built in memory.
+    # The files named by one manifest, read again if a crawl/ sync replaced and removed them meanwhile
+    while True:
+        manifest = read_manifest(source_dir)
+        try:
+            sources = read_catalog_sources(source_dir, manifest)
+            version = catalog_version(source_dir, manifest)
+            break
+        except FileNotFoundError:
+            if manifest == read_manifest(source_dir):
+                raise
+    part_index = None
+    if COMPACT_PART_INDEX:
+        try:
+            part_index = PartIndex(build_part_index(sources["part_numbers"], sources["part_number_to_id"]))
+        except ValueError as e:
+            print("ERROR building part number index ({}), keeping part numbers in a set/ dict".format(e))
+    if part_index is not None:
+        part_numbers, part_number_to_id = PartNumberSet(part_index, invalid_part_numbers), PartNumberMap(part_index)
+    else:
+        part_numbers = set(sources["part_numbers"]).difference(invalid_part_numbers)
+        part_number_to_id = sources["part_number_to_id"]
+    return Catalog(brand_names=set(sources["brand_names"]).difference(invalid_brand_names),
+                   brand_aliases=set(sources["brand_aliases"]).difference(invalid_brand_names),
+                   part_numbers=part_numbers,
+                   brand_name_to_id=sources["brand_name_to_id"],
+                   brand_alias_to_id=sources["brand_alias_to_id"],
+                   part_number_to_id=part_number_to_id,
+                   version=version,
+                   source="files")
+
+
+def load_shared_catalog(source_dir=CATALOG_SOURCE_DIR, shared_dir=CATALOG_SHARED_DIR):
+    # snapshot of the current sources in shared_dir (catalog.<version>.snapshot), built by the first process that
+    # needs it while the others wait on the lock, then mapped read-only by every process: one copy of the catalog
+    # for any number of workers. Snapshots of other versions are removed once a new one is built, processes that
+    # still map them keep them until they reload
+    os.makedirs(shared_dir, exist_ok=True)
+    version = catalog_version(source_dir)
+    path = os.path.join(shared_dir, "catalog.{}.snapshot".format(version))
+    with open(os.path.join(shared_dir, "catalog.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)   # no snapshot is removed while it is being mapped
+        if not os.path.exists(path):
+            fcntl.flock(lock, fcntl.LOCK_EX)   # released on close, or when the builder dies
+            if not os.path.exists(path):
+                build_catalog_snapshot(source_dir, path)
+                for other_path in glob.glob(os.path.join(shared_dir, "catalog.*.snapshot")):
+                    if other_path != path:
+                        os.remove(other_path)
+        catalog = load_catalog_snapshot(path)
+    return catalog._replace(source="shared")
+
+
+def load_catalog(snapshot_path=CATALOG_SNAPSHOT_PATH, source_dir=CATALOG_SOURCE_DIR):
+    if USE_CATALOG_SNAPSHOT and os.path.exists(snapshot_path):
+        try:
+            catalog = load_catalog_snapshot(snapshot_path)
+            fingerprint = source_fingerprint(source_dir)
+            if fingerprint is None or fingerprint == catalog.brand_names.snapshot.fingerprint():
+                return catalog
+            if catalog_update_running(source_dir):
+                # sources half replaced by a running crawl/ sync, the snapshot is swapped once it is done
+                print("Catalog update in progress, using snapshot {}".format(catalog.version))
+                return catalog
+            if catalog_version(source_dir) == catalog.version:   # touched (e.g. fresh checkout) but same content
+                return catalog
+            print("Catalog snapshot {} is older than {}, falling back to text/JSON files".format(
+                snapshot_path, source_dir))
+        except SnapshotError as e:
+            print("ERROR loading catalog snapshot ({}), falling back to text/JSON files".format(e))
+    if catalog_update_running(source_dir):
+        # no snapshot to use meanwhile, the sources are read once the crawl/ sync is done
+        print("Catalog update in progress, waiting for it to read {}".format(source_dir))
+        wait_for_catalog_update(source_dir)
+    if CATALOG_SHARED_DIR:
+        try:
+            return load_shared_catalog(source_dir, CATALOG_SHARED_DIR)
+        except (OSError, ValueError, SnapshotError) as e:
+            print("ERROR building shared catalog snapshot ({}), falling back to text/JSON files".format(e))
+    return load_catalog_files(source_dir)
+
+
+if __name__ == '__main__':
+    # build step: python -m src.catalog_snapshot [source_dir] [snapshot_path]
+    build_catalog_snapshot(*sys.argv[1:3])
@@ -0,0 +1,145 @@
+import itertools
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+try:
+    from src.config import CHUNKED_DETECTION_MIN_ROWS
+    from src.api_helper import fix_data_frame
+    from src.table_profile import TableProfile
+    from src.layout_cache import detect_columns_with_layout_cache
+    from src.row_matcher import get_table_matches, first_data_row, SUGGESTED_QUANTITY
+except:
+    from config import CHUNKED_DETECTION_MIN_ROWS
+    from api_helper import fix_data_frame
+    from table_profile import TableProfile
+    from layout_cache import detect_columns_with_layout_cache
+    from row_matcher import get_table_matches, first_data_row, SUGGESTED_QUANTITY
+
+
+# Chunked ingestion for very large uploads
+# ----------------------------------------
+# The table is read in fixed-size row chunks (chunked read_csv, read-only openpyxl rows for xlsx), columns are
+# detected on the leading chunks (at least CHUNKED_DETECTION_MIN_ROWS rows) and every chunk is cleaned and
+# matched with them before the next one is read, so memory is bounded by the chunk size instead of the file size.
+# Columns detected on part of a table are not kept in the layout cache.
+def iter_csv_chunks(stream, chunk_rows):
+    for chunk in pd.read_csv(stream, chunksize=chunk_rows):
+        yield chunk
+
+
+def _excel_cell(cell):
+    # same conversion as pandas' openpyxl reader (pd.read_excel)
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _excel_frame(rows, width, columns, offset):
+    # DataFrame of converted sheet rows through the parser pd.read_excel uses (same naming/ type inference),
+    # rows padded/ cut to the width of the leading chunk
+    rows = [row[:width] + [""] * (width - len(row)) for row in rows]
+    if columns is None:
+        return TextParser(rows, header=0, skip_blank_lines=False).read()
+    df = TextParser(rows, header=None, skip_blank_lines=False).read()
+    df.columns = columns
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+
+def iter_sheet_chunks(sheet, chunk_rows):
+    sheet.reset_dimensions()
+    rows, width, columns, offset = [], None, None, 0
+    for row in sheet.rows:
+        converted = [_excel_cell(cell) for cell in row]
+        while converted and converted[-1] == "":
+            converted.pop()   # trim trailing empty elements
+        rows.append(converted)
+        if len(rows) < chunk_rows + (columns is None):
+            continue
+        width = width or max(len(elt) for elt in rows)
+        df = _excel_frame(rows, width, columns, offset)
+        columns, offset, rows = df.columns, offset + len(df), []
+        yield df
+    if rows and any(rows):
+        width = width or max(len(elt) for elt in rows)
+        yield _excel_frame(rows, width, columns, offset)
+
+
+def iter_xlsx_sheets(stream, chunk_rows):
+    # (sheet name, chunks of the sheet) for every sheet of the workbook, in order
+    from openpyxl import load_workbook
+    book = load_workbook(stream, read_only=True, data_only=True, keep_links=False)
+    try:
+        for sheet in book.worksheets:
+            yield sheet.title, iter_sheet_chunks(sheet, chunk_rows)
+    finally:
+        book.close()
+
+
+def iter_upload_sheets(stream, filename, chunk_rows):
+    # (sheet name, chunks) per sheet of an xlsx upload, a csv upload is one table without a sheet name
+    if filename.endswith(".csv"):
+        return iter([(None, iter_csv_chunks(stream, chunk_rows))])
+    return iter_xlsx_sheets(stream, chunk_rows)
+
+
+def join_leading_chunks(chunks, min_rows):
+    # (chunks with the leading ones joined until they hold min_rows rows, whether that is the whole table)
+    chunks, leading, rows = iter(chunks), [], 0
+    for chunk in chunks:
+        leading.append(chunk)
+        rows += len(chunk)
+        if rows >= min_rows:
+            break
+    if not leading:
+        return chunks, True
+    first = leading[0] if len(leading) == 1 else pd.concat(leading)
+    return itertools.chain([first], chunks), rows < min_rows
+
+
+def iter_chunked_matches(chunks, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                         PART_NUMBERS, PART_NUMBER_TO_ID):
+    # matches of a table read in chunks, one list per chunk as soon as it is done
+    columns, seen, started, carry = None, np.zeros(0, dtype=np.uint64), False, None
+    chunks, complete = join_leading_chunks(chunks, CHUNKED_DETECTION_MIN_ROWS)
+    for chunk in chunks:
+        chunk.columns = pd.Series([str(c) for c in chunk.columns])
+        if columns is None:
+            df, table_header = fix_data_frame(chunk, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+            profile = TableProfile(df, table_header)
+            brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df = \
+                detect_columns_with_layout_cache(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS,
+                                                 remember=complete)
+            columns = list(df.columns)
+        else:
+            df = chunk.dropna(axis=0, how="all").reindex(columns=columns)
+
+        # duplicate rows dropped across chunks by 64 bit row hash (first occurrence kept, as drop_duplicates),
+        # seen hashes kept as one sorted uint64 array (8 bytes per distinct row)
+        hashes = pd.util.hash_pandas_object(df, index=False).values
+        keep = ~pd.Series(hashes).duplicated().values
+        if len(seen):
+            positions = np.minimum(np.searchsorted(seen, hashes), len(seen) - 1)
+            keep &= seen[positions] != hashes
+        seen = np.sort(np.concatenate([seen, np.sort(hashes[keep])]), kind="stable")   # merge of two sorted runs
+        df = df[keep].copy()
+        if not len(df):
+            continue
+
+        matches = get_table_matches(df, brand_name_column, quantity_column, part_number_column,
+                                    suggested_quantity_column, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID,
+                                    BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID,
+                                    skip_header_rows=not started, suggested_quantity_carry=carry)
+        if not started:
+            # header/ title rows are only skipped until the first data row of the table
+            started = first_data_row(df.values, list(range(df.shape[1])),
+                                     BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS) < len(df)
+        last = df[SUGGESTED_QUANTITY].iloc[-1]
+        carry = last if last == last else carry
+        yield matches
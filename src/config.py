@@ -1,6 +1,13 @@
 # General Environment Settings
 DEBUG = False
 
+# Production server (gunicorn -c gunicorn.conf.py): pre-forked workers with threads, app preloaded in the master
+SERVER_BIND = "0.0.0.0:5000"
+SERVER_WORKERS = 0   # 0 starts one worker per available core
+SERVER_THREADS = 4   # request threads per worker (requests waiting on upstream fetches/ uploads overlap)
+SERVER_TIMEOUT = 120   # seconds a worker may stay silent (large uploads) before it is restarted
+WARM_UP_ON_START = True   # match a small catalog table before forking the workers
+
 # URLs for brands_names/ brand_aliases, part_numbers and emails
 
 BRAND_DETAIL_URL = "http://xdream.eb-cf.com/DR5Bhn9a7.php/Ebrand/get_list/?page={i}"
@@ -8,3 +15,81 @@ BRAND_DETAIL_URL = "http://xdream.eb-cf.com/DR5Bhn9a7.php/Ebrand/get_list/?page=
 PART_NUMBER_DETAIL_URL = "http://xdream.eb-cf.com/DR5Bhn9a7.php/EModel/get_list/?page={i}"
 
 EMAIL_DETAIL_URL = "http://xdream.eb-cf.com/DR5Bhn9a7.php/Einbox/get/?mid={i}"
+
+# Catalog (brand_names/ brand_aliases/ part_numbers) source files and compiled binary snapshot
+# build snapshot with: python -m src.catalog_snapshot
+CATALOG_SOURCE_DIR = "./data/outputs"
+CATALOG_SNAPSHOT_PATH = "./data/outputs/catalog.snapshot"
+USE_CATALOG_SNAPSHOT = True   # falls back to text/JSON files if snapshot is missing, stale or invalid
+CATALOG_SHARED_DIR = None   # e.g. "/dev/shm/catalog": missing/ stale snapshot built there once, mapped by all workers
+COMPACT_PART_INDEX = True   # text/JSON fallback: part numbers in the compact index (False: set/ dict, ~15x memory)
+PART_INDEX_BLOCK_SIZE = 16   # part numbers per prefix-compressed block of the index (lookup searches one block)
+CATALOG_RELOAD_INTERVAL = 10   # seconds between checks for a new snapshot/ changed files (hot reload), 0 disables
+CATALOG_ADMIN_TOKEN = None   # "X-Admin-Token" of POST /api/admin/reload-catalog/, None disables the endpoint
+
+# Process-wide LRU caches for clean_brand_name/ clean_part_number (entries per cache)
+NORMALIZATION_CACHE_SIZE = 200000
+WARM_NORMALIZATION_CACHE = True   # pre-clean all catalog brand names/ aliases at startup
+
+# Adaptive column detection: brand/ part number/ quantity columns are first scored on a stratified sample of rows,
+# the sampled answer is kept when the best column leads the runner-up by the margin (relative to the best ratio),
+# otherwise (and for tables below the row threshold) every row is scanned
+ADAPTIVE_DETECTION = True
+DETECTION_SAMPLE_MIN_ROWS = 5000
+DETECTION_SAMPLE_SIZE = 1000
+DETECTION_CONFIDENCE_MARGIN = 0.5
+
+# Table header row is searched in the leading rows only (0 searches the whole table)
+HEADER_SEARCH_ROWS = 100
+
+# Layout template cache: detected columns remembered per header signature (0 disables), validated on sample rows
+LAYOUT_CACHE_SIZE = 1000
+LAYOUT_CACHE_PATH = None   # e.g. "./data/outputs/layout_cache.json" to keep layouts across restarts
+LAYOUT_VALIDATION_ROWS = 50
+
+# Uploaded files are buffered in memory up to this size (bytes), larger ones spill to a temporary file
+UPLOAD_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Uploads larger than this (bytes, 0 disables) are read and matched in chunks of UPLOAD_CHUNK_ROWS rows,
+# columns are detected on the leading chunks joined until they hold CHUNKED_DETECTION_MIN_ROWS rows
+CHUNKED_UPLOAD_MIN_SIZE = 32 * 1024 * 1024
+UPLOAD_CHUNK_ROWS = 50000
+CHUNKED_DETECTION_MIN_ROWS = 10000
+
+# Streaming responses (?stream=1 or "Accept: application/x-ndjson"): one JSON match record per line
+NDJSON_MIMETYPE = "application/x-ndjson"
+NDJSON_BUFFER_SIZE = 64 * 1024   # lines are written out in blocks of about this many bytes
+
+# Table process pool (worker processes mapping the catalog snapshot): sheets of workbook uploads of at least
+# TABLE_POOL_MIN_SIZE bytes, tables of message pages with at least PAGE_POOL_MIN_TABLES tables
+PARALLEL_TABLES = True
+TABLE_POOL_WORKERS = 0   # per server process, 0 shares the available cores between the SERVER_WORKERS
+TABLE_POOL_MIN_SIZE = 1024 * 1024
+PAGE_POOL_MIN_TABLES = 2
+
+# Upstream (EMAIL_DETAIL_URL) fetches: pooled keep-alive session, timeouts in seconds, retries with backoff
+UPSTREAM_CONCURRENCY = 16   # parallel fetches of a batch request (and connection pool size)
+UPSTREAM_CONNECT_TIMEOUT = 5
+UPSTREAM_READ_TIMEOUT = 30
+UPSTREAM_RETRIES = 3
+UPSTREAM_RETRY_BACKOFF = 0.5
+
+# Batch endpoint: message ids per request
+BATCH_MAX_IDS = 1000
+
+# Message page tables with fewer non-empty cells than this are skipped (layout tables holding other tables always)
+HTML_TABLE_MIN_CELLS = 2
+
+# Result cache: match results by sha256 of the upload/ fetched page + catalog version, also the response ETag
+RESULT_CACHE_SIZE = 128 * 1024 * 1024   # bytes of encoded results kept in memory per worker, 0 disables
+RESULT_CACHE_DIR = None   # e.g. "./data/outputs/result_cache" for an on-disk tier shared by all workers
+RESULT_CACHE_DISK_SIZE = 2 * 1024 * 1024 * 1024
+RESULT_CACHE_MAX_RECORDS = 200000   # larger results (streamed huge uploads) are not kept
+RESULT_CACHE_FORMAT = 1   # bump when matching changes, results of the old code are not served again
+
+# Catalog crawler (python -m src.data_extractors): parallel page fetches, timeouts in seconds, retries with backoff
+CRAWL_CONCURRENCY = 16
+CRAWL_CONNECT_TIMEOUT = 5
+CRAWL_READ_TIMEOUT = 60
+CRAWL_RETRIES = 5
+CRAWL_RETRY_BACKOFF = 1
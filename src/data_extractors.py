@@ -1,91 +1,366 @@
 from cleanco import cleanco
+import os
 import re
+import sys
 import json
+import time
+import fcntl
+import hashlib
+import threading
+import contextlib
 import requests
 import operator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 try:
     from src.config import *
-    from src.api_helper import clean_part_number, remove_punctuations
+    from src.api_helper import clean_part_number, remove_punctuations, read_lines
+    from src.catalog_snapshot import CATALOG_SOURCES, delta_paths, update_lock_path, build_catalog_snapshot, \
+        read_manifest, write_manifest
 except:
     from config import *
-    from api_helper import clean_part_number, remove_punctuations
+    from api_helper import clean_part_number, remove_punctuations, read_lines
+    from catalog_snapshot import CATALOG_SOURCES, delta_paths, update_lock_path, build_catalog_snapshot, \
+        read_manifest, write_manifest
 
 
-def get_all_brands_names():
-    brand_names = list()
-    brand_aliases = list()
-    brand_name_to_id = dict()
-    brand_alias_to_id = dict()
-    counter = 0  # crawling will start from index=1
-    print("Extracting brands....")
-    while True:
-        counter += 1
-        print("page=", counter)
-        current_url = BRAND_DETAIL_URL.format(i=counter)
-        r = requests.get(current_url)
+# Catalog crawler
+# ---------------
+# Catalog pages (1, 2, ... up to the first page without data) are fetched by a bounded thread pool over one
+# keep-alive session and processed in page order. Every page is retried with exponential backoff up to
+# CRAWL_RETRIES times, the crawl fails after that. Records are written to "<output>.part" files as the pages come
+# in, and a checkpoint (last page written, size of every part file) is saved after every page: a failed crawl
+# started again goes on after the last good page. The outputs replace the catalog files only once the crawl is
+# complete: they are renamed to files of a new generation ("part_numbers.<n>.txt") and published together with
+# one os.replace of the catalog manifest (src/catalog_snapshot.py), then the files they replace are removed.
+#
+# Incremental sync: a checksum of every page is kept next to the outputs ("<crawl>.pages.txt"). A sync fetches the
+# last known page and the pages after it (records are appended to the catalog, new ids land there), or all pages
+# with recheck, and writes the records of the pages whose checksum changed to a compact delta file
+# ("<crawl>.delta.<n>.jsonl") that the catalog loader applies on top of the source files, published by a manifest
+# swap as well. Syncs are append-only: a delta adds and updates records, a record deleted upstream (or a page
+# gone from the end of the catalog) stays in the catalog until the next full crawl, which folds the deltas back
+# in. Pages before the last known one are only compared with recheck. Run from the command line, a crawl/ sync
+# holds the update lock the catalog loader checks and swaps the new catalog snapshot in with one os.replace at the
+# end, so the server never loads half of an update.
+def get_crawl_session():
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CRAWL_CONCURRENCY)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_catalog_page(session, url, stopped):
+    # "data" records of a catalog page, [] past the last page (or once the crawl is stopped)
+    for attempt in range(CRAWL_RETRIES + 1):
+        if stopped.is_set():
+            return []
         try:
-            if r.json()["code"] == 200 and r.json()["data"]:
-                for elt in r.json()["data"]:
-                    cleaned_brand_name = remove_punctuations(cleanco(str(elt["brand_name"])).clean_name())
-                    if cleaned_brand_name:
-                        brand_names.append(cleaned_brand_name)
-                        brand_name_to_id[cleaned_brand_name] = elt
-                    cleaned_brand_alias = remove_punctuations(cleanco(str(elt["brand_alias"])).clean_name())
-                    if cleaned_brand_alias:
-                        brand_aliases.append(cleaned_brand_alias)
-                        brand_alias_to_id[cleaned_brand_alias] = elt
-                continue
-            break
+            r = session.get(url, timeout=(CRAWL_CONNECT_TIMEOUT, CRAWL_READ_TIMEOUT))
+            if r.status_code == 429 or r.status_code >= 500:
+                r.raise_for_status()
+            body = r.json()
+            return body["data"] if body["code"] == 200 and body["data"] else []
         except Exception as e:
-            print("Error ({}) Processing URL: {}".format(e, current_url))
+            if attempt == CRAWL_RETRIES:
+                print("Error ({}) Processing URL: {}, giving up".format(e, url))
+                raise
+            print("Error ({}) Processing URL: {}, retrying".format(e, url))
+            stopped.wait(CRAWL_RETRY_BACKOFF * 2 ** attempt)
+
+
+def iter_catalog_pages(url, first_page):
+    # (page, records) in page order from first_page on, at most 2 * CRAWL_CONCURRENCY pages requested ahead.
+    # Pages requested past the last one are stopped (not retried) once the crawl is over
+    session = get_crawl_session()
+    executor = ThreadPoolExecutor(max_workers=CRAWL_CONCURRENCY)
+    stopped = threading.Event()
+    futures = deque()
+    next_page = first_page
+    try:
+        while True:
+            while len(futures) < 2 * CRAWL_CONCURRENCY:
+                futures.append((next_page, executor.submit(fetch_catalog_page, session, url.format(i=next_page),
+                                                           stopped)))
+                next_page += 1
+            page, future = futures.popleft()
+            data = future.result()
+            if not data:
+                return
+            yield page, data
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+
+
+class CrawlOutput(object):
+    # "<path>.part" text files and JSON map files ({"key": record, ...} written entry by entry, the last entry
+    # of a repeated key wins on load as it did in the dict it was built from) with a checkpoint
+    def __init__(self, name, line_files, map_files):
+        self.name = name
+        self.checkpoint_path = os.path.join(CATALOG_SOURCE_DIR, name + ".checkpoint.json")
+        self.paths = dict((key, os.path.join(CATALOG_SOURCE_DIR, CATALOG_SOURCES[key] + ".part"))
+                          for key in line_files + map_files)
+        self.paths["pages"] = page_checksums_path(name) + ".part"
+        self.map_files = map_files
+        self.empty_maps = set()   # map files without an entry yet (no "," before the next one)
+        self.page = 0
+        checkpoint = self.read_checkpoint()
+        self.files = {}
+        for key, path in self.paths.items():
+            if checkpoint:
+                self.files[key] = open(path, "r+")
+                self.files[key].truncate(checkpoint["sizes"][key])   # drop what was written after the checkpoint
+                self.files[key].seek(0, os.SEEK_END)
+                if key in map_files and checkpoint["sizes"][key] == 1:
+                    self.empty_maps.add(key)
+            else:
+                self.files[key] = open(path, "w")
+                if key in map_files:
+                    self.files[key].write("{")
+                    self.empty_maps.add(key)
+        if checkpoint:
+            self.page = checkpoint["page"]
+            print("Resuming crawl after page {}".format(self.page))
+
+    def read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, "r") as fp:
+            checkpoint = json.load(fp)
+        if not all([key in checkpoint["sizes"] and os.path.exists(path) and
+                    os.path.getsize(path) >= checkpoint["sizes"][key] for key, path in self.paths.items()]):
+            print("Crawl checkpoint {} does not match its output files, starting over".format(self.checkpoint_path))
+            return None
+        return checkpoint
+
+    def read_lines(self, key):
+        # lines written so far (e.g. to skip them again after a resume)
+        self.files[key].flush()
+        with open(self.paths[key], "r") as fp:
+            return [line for line in fp.read().split("\n") if line]
+
+    def write_line(self, key, line):
+        self.files[key].write(line + "\n")
+
+    def write_entry(self, key, name, record):
+        self.files[key].write("{}\n{}: {}".format("" if key in self.empty_maps else ",", json.dumps(name),
+                                                  json.dumps(record)))
+        self.empty_maps.discard(key)
+
+    def checkpoint(self, page, data):
+        self.write_line("pages", "{} {}".format(page, page_checksum(data)))
+        sizes = {}
+        for key, fp in self.files.items():
+            fp.flush()
+            sizes[key] = fp.tell()
+        with open(self.checkpoint_path + ".tmp", "w") as fp:
+            json.dump({"page": page, "sizes": sizes}, fp)
+        os.replace(self.checkpoint_path + ".tmp", self.checkpoint_path)
+        self.page = page
+
+    def finish(self):
+        for key, fp in self.files.items():
+            if key in self.map_files:
+                fp.write("\n}\n")
+            fp.close()
+        # outputs renamed to a new generation, published with the deltas of this crawl dropped (their records are
+        # in the new files) in one manifest swap, then the replaced files are removed
+        manifest = read_manifest(CATALOG_SOURCE_DIR)
+        manifest["generation"] = generation = manifest.get("generation", 0) + 1
+        replaced = [os.path.basename(path) for path in crawl_delta_paths(self.name)]
+        manifest["deltas"] = [file_name for file_name in manifest["deltas"] if file_name not in replaced]
+        for key, path in self.paths.items():
+            if key == "pages":
+                continue
+            base, extension = os.path.splitext(CATALOG_SOURCES[key])
+            file_name = "{}.{:06d}{}".format(base, generation, extension)
+            os.replace(path, os.path.join(CATALOG_SOURCE_DIR, file_name))
+            replaced.append(manifest["sources"][key])
+            manifest["sources"][key] = file_name
+        write_manifest(manifest, CATALOG_SOURCE_DIR)
+        os.replace(self.paths["pages"], self.paths["pages"][:-len(".part")])
+        for file_name in replaced:
+            if os.path.exists(os.path.join(CATALOG_SOURCE_DIR, file_name)):
+                os.remove(os.path.join(CATALOG_SOURCE_DIR, file_name))
+        os.remove(self.checkpoint_path)
+
+    def close(self):
+        for fp in self.files.values():
+            fp.close()
+
+
+def page_checksum(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def page_checksums_path(name):
+    return os.path.join(CATALOG_SOURCE_DIR, name + ".pages.txt")
 
-    with open('./data/outputs/brand_names.txt', 'w') as fp:
-        for bn in set(sorted(brand_names, reverse=False)):
-            fp.write(bn + "\n")
 
-    with open('./data/outputs/brand_aliases.txt', 'w') as fp:
-        for ba in set(sorted(brand_aliases, reverse=False)):
-            fp.write(ba + "\n")
+def crawl_delta_paths(name):
+    return [path for path in delta_paths(CATALOG_SOURCE_DIR) if os.path.basename(path).startswith(name + ".delta.")]
 
-    with open("./data/outputs/brand_name_to_id.json", "w") as fp:
-        json.dump(brand_name_to_id, fp)
 
-    with open("./data/outputs/brand_alias_to_id.json", "w") as fp:
-        json.dump(brand_alias_to_id, fp)
+def brand_entries(elt):
+    # (catalog set, cleaned key) of a record, the key goes to the set and to its *_to_id map
+    entries = []
+    cleaned_brand_name = remove_punctuations(cleanco(str(elt["brand_name"])).clean_name())
+    if cleaned_brand_name:
+        entries.append(("brand_names", cleaned_brand_name))
+    cleaned_brand_alias = remove_punctuations(cleanco(str(elt["brand_alias"])).clean_name())
+    if cleaned_brand_alias:
+        entries.append(("brand_aliases", cleaned_brand_alias))
+    return entries
 
-    print("Fetched total {} brands and {} aliases".format(len(brand_names), len(brand_aliases)))
-    return set(brand_names), brand_name_to_id, set(brand_aliases), brand_alias_to_id
+
+def part_number_entries(elt):
+    return [("part_numbers", clean_part_number(elt["part_number"]))]
+
+
+def catalog_crawl(name):
+    # url, {catalog set: its *_to_id map}, record entries and whether set files list every key once
+    if name == "brands":
+        return BRAND_DETAIL_URL, {"brand_names": "brand_name_to_id", "brand_aliases": "brand_alias_to_id"}, \
+            brand_entries, True
+    return PART_NUMBER_DETAIL_URL, {"part_numbers": "part_number_to_id"}, part_number_entries, False
+
+
+def crawl_catalog(name):
+    url, maps, entries, unique = catalog_crawl(name)
+    output = CrawlOutput(name, list(maps), list(maps.values()))
+    try:
+        seen = dict((key, set(output.read_lines(key))) for key in maps) if unique else None
+        records = 0
+        print("Extracting {}....".format(name))
+        for page, data in iter_catalog_pages(url, output.page + 1):   # crawling starts from page=1
+            print("page=", page)
+            for elt in data:
+                for key, value in entries(elt):
+                    if seen is None:
+                        output.write_line(key, value)
+                    elif value not in seen[key]:
+                        seen[key].add(value)
+                        output.write_line(key, value)
+                    output.write_entry(maps[key], value, elt)
+            records += len(data)
+            output.checkpoint(page, data)
+        output.finish()
+    finally:
+        output.close()
+
+    print("Fetched total {} {} records in this run, {} pages".format(records, name, output.page))
+    return output.page
+
+
+def get_all_brands_names():
+    return crawl_catalog("brands")
 
 
 def get_all_part_numbers():
-    part_numbers = list()
-    part_number_to_id = dict()
-    counter = 0  # crawling will start from index=1
-    print("Extracting part numbers....")
+    return crawl_catalog("part_numbers")
+
+
+def sync_catalog(name, recheck=False):
+    # pages changed since the last crawl/ sync into a new delta file, number of pages changed (or crawled).
+    # Append-only, see above: records deleted upstream are only dropped by a full crawl
+    path = page_checksums_path(name)
+    if not os.path.exists(path):
+        print("No crawl of {} to sync with yet, crawling all pages".format(name))
+        return crawl_catalog(name)
+
+    checksums = dict((int(page), checksum) for page, checksum in [line.split(" ") for line in read_lines(path)])
+    url, maps, entries, _ = catalog_crawl(name)
+    sequence = max([int(delta.rsplit(".", 2)[1]) for delta in crawl_delta_paths(name)] + [0]) + 1
+    delta_path = os.path.join(CATALOG_SOURCE_DIR, "{}.delta.{:06d}.jsonl".format(name, sequence))
+    first_page = 1 if recheck or not checksums else max(checksums)
+    changed, records, last_page = [], 0, first_page - 1
+    print("Syncing {}....".format(name))
+    with open(delta_path + ".tmp", "w") as fp:
+        for page, data in iter_catalog_pages(url, first_page):
+            last_page = page
+            checksum = page_checksum(data)
+            if checksums.get(page) == checksum:
+                continue
+            checksums[page] = checksum
+            changed.append(page)
+            for elt in data:
+                for key, value in entries(elt):
+                    fp.write(json.dumps([key, value, elt], separators=(",", ":")) + "\n")
+            records += len(data)
+
+    gone = [page for page in checksums if page > last_page]
+    if gone:
+        print("WARNING {} pages of {} after page {} are gone, their records stay in the catalog until the next "
+              "full crawl".format(len(gone), name, last_page))
+        for page in gone:
+            del checksums[page]
+
+    if not changed:
+        os.remove(delta_path + ".tmp")
+    else:
+        os.replace(delta_path + ".tmp", delta_path)
+        manifest = read_manifest(CATALOG_SOURCE_DIR)
+        manifest["deltas"].append(os.path.basename(delta_path))
+        write_manifest(manifest, CATALOG_SOURCE_DIR)
+    if changed or gone:
+        with open(path + ".tmp", "w") as fp:
+            for page in sorted(checksums):
+                fp.write("{} {}\n".format(page, checksums[page]))
+        os.replace(path + ".tmp", path)
+    print("Synced {}: {} changed pages, {} records{}".format(
+        name, len(changed), records, " into " + delta_path if changed else ""))
+    return len(changed)
+
+
+@contextlib.contextmanager
+def catalog_update_lock():
+    # one crawl/ sync at a time: an exclusive flock on the lock file, held for the whole update and released by
+    # the kernel if the process dies. The catalog loader keeps using the current snapshot while it is held
+    path = update_lock_path(CATALOG_SOURCE_DIR)
     while True:
-        counter += 1
-        # if counter > 5:
-        #     break
-        print("page=", counter)
-        current_url = PART_NUMBER_DETAIL_URL.format(i=counter)
-        r = requests.get(current_url)
+        lock = open(path, "a")
+        for attempt in range(20):   # catalog loaders test the lock with a shared flock for a moment
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(0.05)
+        else:
+            lock.close()
+            raise RuntimeError("Catalog update already running (lock {})".format(path))
         try:
-            if r.json()["code"] == 200 and r.json()["data"]:
-                for elt in r.json()["data"]:
-                    cleaned_part_number = clean_part_number(elt["part_number"])
-                    part_numbers.append(cleaned_part_number)
-                    part_number_to_id[cleaned_part_number] = elt
-                continue
-            break
-        except Exception as e:
-            print("Error ({}) Processing URL: {}".format(e, current_url))
+            if os.path.samestat(os.fstat(lock.fileno()), os.stat(path)):
+                break
+        except FileNotFoundError:
+            pass
+        lock.close()   # locked a file the previous holder removed meanwhile, lock the new one
+    lock.truncate(0)
+    lock.write(str(os.getpid()))   # for humans, the lock is the flock
+    lock.flush()
+    try:
+        yield
+    finally:
+        os.remove(path)
+        lock.close()
+
 
-    with open('./data/outputs/part_numbers.txt', 'w') as fp:
-        for pn in part_numbers:
-            fp.write(pn + "\n")
+def update_catalog(names, sync=False, recheck=False):
+    with catalog_update_lock():
+        pages = 0
+        for name in names:
+            pages += sync_catalog(name, recheck) if sync else crawl_catalog(name)
+        if pages and USE_CATALOG_SNAPSHOT:
+            build_catalog_snapshot()
 
-    with open("./data/outputs/part_number_to_id.json", "w") as fp:
-        json.dump(part_number_to_id, fp)
 
-    print("Fetched total {} part_numbers".format(len(part_numbers)))
-    return set(part_numbers), part_number_to_id
+if __name__ == '__main__':
+    # full crawl:  python -m src.data_extractors [brands|part_numbers]
+    # incremental: python -m src.data_extractors sync [brands|part_numbers] [--recheck]
+    arguments = sys.argv[1:]
+    sync = "sync" in arguments
+    names = [name for name in ["brands", "part_numbers"] if name in arguments] or ["brands", "part_numbers"]
+    update_catalog(names, sync=sync, recheck="--recheck" in arguments)
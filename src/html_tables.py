@@ -0,0 +1,187 @@
+import io
+import re
+from lxml import etree
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+try:
+    from src.config import HTML_TABLE_MIN_CELLS
+except:
+    from config import HTML_TABLE_MIN_CELLS
+
+
+# HTML table extractor
+# --------------------
+# Replacement of pd.read_html for fetched message pages. Tables are taken from a streaming lxml parse as soon as
+# they are closed, layout tables (holding other tables) and tables with less than HTML_TABLE_MIN_CELLS non-empty
+# cells are dropped before any DataFrame is built. Once a table is read, it and everything before it in the page
+# are freed: the parsed tree holds the table being read (with the layout tables around it) and the page since the
+# table read before it, not the whole page. The tables that are kept come out as
+# pd.read_html(encoding="utf-8") builds them: thead/ tbody/ tfoot and leading <th> rows as header, rowspan/ colspan
+# copied, <br> as a line break, hidden (display:none) elements and <style> left out, the same whitespace clean up
+# and TextParser type inference.
+WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+STYLED_ELEMENTS = etree.XPath(".//*[@style]")
+
+
+def _is_hidden(element):
+    return "display:none" in element.get("style", "").replace(" ", "")
+
+
+def _drop_element(element):
+    # remove an element and its children, its tail text stays in place
+    parent = element.getparent()
+    if parent is None:
+        return
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+def _drop_hidden_elements(table):
+    for element in list(table.iter("style")):
+        _drop_element(element)
+    for element in STYLED_ELEMENTS(table):
+        if _is_hidden(element):
+            _drop_element(element)
+
+
+def _cell_text(cell):
+    if not len(cell):
+        return cell.text or ""
+    return etree.tostring(cell, method="text", encoding=str, with_tail=False)
+
+
+def _cells(row):
+    return [cell for cell in row if cell.tag == "td" or cell.tag == "th"]
+
+
+def _inside(element, tag, table):
+    for ancestor in element.iterancestors():
+        if ancestor is table:
+            return False
+        if ancestor.tag == tag:
+            return True
+    return False
+
+
+def _table_rows(table):
+    # (header, body, footer) <tr> lists, same sections as pd.read_html
+    header_rows = []
+    for thead in table.iter("thead"):
+        header_rows += [row for row in thead if row.tag == "tr"]
+        if _cells(thead):
+            header_rows.append(thead)   # <thead><th>..</th></thead> without <tr>
+    rows = list(table.iter("tr"))
+    body_rows = [row for row in rows if _inside(row, "tbody", table)] + [row for row in table if row.tag == "tr"]
+    footer_rows = [row for row in rows if _inside(row, "tfoot", table)]
+
+    if not header_rows:
+        while body_rows and all([cell.tag == "th" for cell in _cells(body_rows[0])]):
+            header_rows.append(body_rows.pop(0))
+    return header_rows, body_rows, footer_rows
+
+
+def _row_texts(rows):
+    # text rows with rowspan/ colspan cells copied to the positions they cover
+    all_texts = []
+    remainder = []   # (index, text, rows left) of cells spanning into the next rows
+    for row in rows:
+        texts = []
+        next_remainder = []
+        index = 0
+        for cell in _cells(row):
+            while remainder and remainder[0][0] <= index:
+                prev_index, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_index, prev_text, prev_rowspan - 1))
+                index += 1
+
+            text = WHITESPACE.sub(" ", _cell_text(cell).strip())
+            rowspan = int(cell.get("rowspan") or 1)
+            colspan = int(cell.get("colspan") or 1)
+            for _ in range(colspan):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+
+        for prev_index, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_index, prev_text, prev_rowspan - 1))
+        all_texts.append(texts)
+        remainder = next_remainder
+
+    while remainder:
+        texts = []
+        next_remainder = []
+        for prev_index, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_index, prev_text, prev_rowspan - 1))
+        all_texts.append(texts)
+        remainder = next_remainder
+    return all_texts
+
+
+def _table_frame(header, body, footer):
+    # DataFrame as pd.read_html builds it from the text rows (None for a table without data)
+    header_rows = None
+    if header:
+        header_rows = 0 if len(header) == 1 else [i for i, row in enumerate(header) if any(row)]
+    body = header + body + footer
+    if not body:
+        return None
+    width = max([len(row) for row in body])
+    for row in body:
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))   # padded in place, the text rows are not used after
+    try:
+        return TextParser(body, header=header_rows, thousands=",").read()
+    except EmptyDataError:
+        return None
+
+
+def _free_before(element):
+    # free the elements closed before element: its earlier siblings and those of its ancestors
+    while element.getparent() is not None:
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
+        element = parent
+
+
+def read_html_tables(content):
+    # DataFrames of the data tables of a page (bytes) in document order, ValueError when the page has no table
+    # with text at all (as pd.read_html)
+    tables = []
+    found = 0
+    for _, table in etree.iterparse(io.BytesIO(content), events=("end",), tag="table", html=True,
+                                    encoding="utf-8"):
+        if _is_hidden(table) or not any(text.strip("\n") for text in table.itertext()):
+            continue
+        found += 1
+        if table.find(".//table") is not None:
+            continue   # layout table, the tables inside it are taken on their own
+
+        for br in table.iter("br"):
+            br.tail = "\n" + (br.tail or "")
+        _drop_hidden_elements(table)
+        header, body, footer = [_row_texts(rows) for rows in _table_rows(table)]
+
+        cells = sum(1 for rows in (header, body, footer) for row in rows for text in row if text)
+        if cells >= HTML_TABLE_MIN_CELLS:
+            df = _table_frame(header, body, footer)
+            if df is not None:
+                tables.append(df)
+        table.clear(keep_tail=True)   # free the parsed table, only the DataFrame is kept
+        _free_before(table)
+
+    if not found:
+        raise ValueError("No tables found")
+    return tables
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict, Counter
+try:
+    from src.config import LAYOUT_CACHE_SIZE, LAYOUT_CACHE_PATH, LAYOUT_VALIDATION_ROWS
+    from src.api_helper import detect_columns
+except:
+    from config import LAYOUT_CACHE_SIZE, LAYOUT_CACHE_PATH, LAYOUT_VALIDATION_ROWS
+    from api_helper import detect_columns
+
+
+# Layout template cache
+# ---------------------
+# Suppliers send the same spreadsheet layouts again and again. The columns chosen by the detection cascade
+# (brand, part number, quantity, suggested quantity, or the pattern/ splitter of a mixed column) are remembered
+# per normalized header signature, and re-used for a table with the same signature once detection on a sample of
+# its rows finds them again. Layouts are learned with one catalog version, a catalog change empties the cache.
+layout_cache = OrderedDict()
+layout_cache_lock = threading.Lock()
+layout_cache_stats = Counter()
+layout_cache_state = {"version": None}
+LAYOUT_KEYS = ["brand_name_column", "part_number_column", "quantity_column", "suggested_quantity_column"]
+
+
+def normalize_header(value):
+    value = "" if value != value else str(value)
+    return re.sub(r"\s+", " ", value).strip().lower()
+
+
+def layout_signature(profile):
+    # header row cells + column names + column count, None for tables without a header row
+    if not profile.table_header["status"]:
+        return None
+    return json.dumps([[normalize_header(elt) for elt in profile.header_row],
+                       [normalize_header(elt) for elt in profile.frame.columns],
+                       len(profile.frame.columns)], ensure_ascii=False)
+
+
+def _is_layout(entry):
+    return type(entry) is list and len(entry) == 2 and isinstance(entry[0], str) and \
+        type(entry[1]) is dict and set(entry[1]) == set(LAYOUT_KEYS)
+
+
+def set_layout_catalog_version(version):
+    # called when a catalog is swapped in: layouts learned with another catalog version are dropped
+    with layout_cache_lock:
+        if layout_cache_state["version"] != version:
+            if layout_cache:
+                print("Catalog version changed, {} cached table layouts dropped".format(len(layout_cache)))
+            layout_cache.clear()
+            layout_cache_state["version"] = version
+
+
+def load_layout_cache(path=LAYOUT_CACHE_PATH):
+    # all entries or none: a corrupt/ foreign file leaves the cache empty
+    if not path or not LAYOUT_CACHE_SIZE or not os.path.exists(path):
+        return
+    try:
+        with open(path, "r") as fp:
+            saved = json.load(fp)
+        layouts = saved.get("layouts") if type(saved) is dict else None
+        if type(layouts) is not list or not all([_is_layout(entry) for entry in layouts]):
+            raise ValueError("not a list of [signature, layout] entries")
+        with layout_cache_lock:
+            layout_cache_state["version"] = saved.get("catalog_version")
+            for signature, layout in layouts[-LAYOUT_CACHE_SIZE:]:
+                layout_cache[signature] = layout
+        print("Loaded {} cached table layouts from {}".format(len(layout_cache), path))
+    except Exception as e:
+        print("ERROR loading layout cache {} ({}), starting empty".format(path, e))
+
+
+def save_layout_cache(path=LAYOUT_CACHE_PATH):
+    # written to a temporary file of its own (threads and worker processes save concurrently), then swapped in
+    if not path:
+        return
+    tmp_path = None
+    try:
+        with layout_cache_lock:
+            saved = {"catalog_version": layout_cache_state["version"], "layouts": list(layout_cache.items())}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            json.dump(saved, fp, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        traceback.print_exc()
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_layout(signature):
+    with layout_cache_lock:
+        layout = layout_cache.get(signature)
+        if layout is not None:
+            layout_cache.move_to_end(signature)
+        return layout
+
+
+def remember_layout(signature, layout):
+    with layout_cache_lock:
+        changed = layout_cache.get(signature) != layout
+        layout_cache[signature] = layout
+        layout_cache.move_to_end(signature)
+        while len(layout_cache) > LAYOUT_CACHE_SIZE:
+            layout_cache.popitem(last=False)
+    if changed:
+        save_layout_cache()
+
+
+def layout_cache_info():
+    return dict(layout_cache_stats, size=len(layout_cache))
+
+
+def same_columns(found, remembered):
+    # a mixed column is compared on its column and pattern/ splitter, not on the match count it was found with
+    if type(found) is dict and type(remembered) is dict:
+        return all([found.get(key) == remembered.get(key) for key in ["column", "pattern", "splitter"]])
+    return type(found) is type(remembered) and found == remembered
+
+
+def is_valid_layout(profile, layout, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # the detection cascade finds the remembered layout again on a sample of rows: same columns, and a mixed
+    # column from the same step with the same b#p/ p#b pattern (direction included) or splitter
+    sample = profile.sample(LAYOUT_VALIDATION_ROWS)
+    found = detect_columns(sample, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)[:4]
+    return all([same_columns(column, layout[key]) for column, key in zip(found, LAYOUT_KEYS)])
+
+
+def detect_columns_with_layout_cache(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS, remember=True):
+    # same result as detect_columns(), taken from the layout cache when the header signature is known.
+    # remember=False for the leading rows of a table (chunked uploads): columns detected on them are not kept
+    signature = layout_signature(profile) if LAYOUT_CACHE_SIZE else None
+    if signature is not None:
+        layout = get_layout(signature)
+        if layout is not None:
+            try:
+                if is_valid_layout(profile, layout, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+                    layout_cache_stats["hits"] += 1
+                    return layout["brand_name_column"], layout["part_number_column"], layout["quantity_column"], \
+                        layout["suggested_quantity_column"], profile.table_header, profile.frame
+            except Exception:
+                traceback.print_exc()
+            layout_cache_stats["invalid"] += 1
+            print("Cached layout rejected on sample rows, running full detection")
+        else:
+            layout_cache_stats["misses"] += 1
+
+    brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df = \
+        detect_columns(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+
+    # keyword search may re-slice the table below a header row found inside it, that layout is not reusable,
+    # neither is a failed detection
+    if remember and signature is not None and df is profile.frame and (brand_name_column or part_number_column):
+        remember_layout(signature, {"brand_name_column": brand_name_column,
+                                    "part_number_column": part_number_column,
+                                    "quantity_column": quantity_column,
+                                    "suggested_quantity_column": suggested_quantity_column})
+    return brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df
+
+
+try:
+    load_layout_cache()
+except Exception:
+    traceback.print_exc()   # never keeps the app from starting
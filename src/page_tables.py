@@ -0,0 +1,65 @@
+import traceback
+try:
+    from src.config import PARALLEL_TABLES, PAGE_POOL_MIN_TABLES
+    from src import table_pool
+    from src.api_helper import fix_data_frame
+    from src.table_profile import TableProfile
+    from src.layout_cache import detect_columns_with_layout_cache
+    from src.row_matcher import iter_table_matches
+except:
+    from config import PARALLEL_TABLES, PAGE_POOL_MIN_TABLES
+    import table_pool
+    from api_helper import fix_data_frame
+    from table_profile import TableProfile
+    from layout_cache import detect_columns_with_layout_cache
+    from row_matcher import iter_table_matches
+
+
+# Tables of a message page
+# ------------------------
+# Every table of a page is detected and matched on its own, in the table process pool for pages with several
+# tables. Records are tagged with their table index and come back in table order; a table whose columns can not
+# be detected or that fails adds an error entry ({"table_index": i, "Error": ...}) instead of failing the page.
+def match_page_table(page_id, index, df, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                     PART_NUMBERS, PART_NUMBER_TO_ID):
+    try:
+        df, table_header = fix_data_frame(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+        profile = TableProfile(df, table_header)
+        brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df = \
+            detect_columns_with_layout_cache(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+
+        if table_header["status"] and not (brand_name_column or part_number_column or quantity_column):
+            print("ERROR in detecting columns: mid={}, table_index={}\n".format(page_id, index))
+            return [{"table_index": index, "Error": "Could not detect columns"}]
+
+        matches = []
+        for match in iter_table_matches(df, brand_name_column, quantity_column, part_number_column,
+                                        suggested_quantity_column, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID,
+                                        BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID,
+                                        header_check_suggested_quantity=False):
+            match["table_index"] = index
+            matches.append(match)
+        return matches
+    except Exception:
+        print("ERROR processing table: mid={}, table_index={}".format(page_id, index))
+        traceback.print_exc()
+        return [{"table_index": index, "Error": "Can not process table"}]
+
+
+def match_page_table_job(job, catalog):
+    page_id, index, df = job
+    return match_page_table(page_id, index, df, *catalog)
+
+
+def iter_page_matches(page_id, tables, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                      PART_NUMBERS, PART_NUMBER_TO_ID, catalog_version=None):
+    catalog = (BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID)
+    if PARALLEL_TABLES and catalog_version and len(tables) >= PAGE_POOL_MIN_TABLES:
+        results = table_pool.map_table_jobs(match_page_table_job,
+                                            [(page_id, index, df) for index, df in enumerate(tables)], catalog,
+                                            catalog_version)
+    else:
+        results = (match_page_table(page_id, index, df, *catalog) for index, df in enumerate(tables))
+    for matches in results:
+        for match in matches:
+            yield match
@@ -0,0 +1,148 @@
+import os
+import json
+import bisect
+from array import array
+try:
+    from src.config import PART_INDEX_BLOCK_SIZE
+except:
+    from config import PART_INDEX_BLOCK_SIZE
+
+
+# Compact part number index
+# -------------------------
+# Cleaned part numbers sorted (by utf-8 bytes) in blocks of PART_INDEX_BLOCK_SIZE keys, every block stores the
+# prefix shared by all its keys once and the rest of each key after it, "\0" separated. A lookup bisects the first
+# keys of the blocks and finds the key in one block with bytes.find (no per key Python loop). The position of a key
+# is its row in the record columns: id, brand id and part number as listed upstream (left out when equal to the
+# key), records of any other shape are kept as JSON. One index serves both PART_NUMBERS (keys listed in
+# part_numbers.txt) and PART_NUMBER_TO_ID (keys with a record), records are only built when looked up.
+#
+# sections: header (q: block size, keys) | keys (blocks: prefix length, prefix, "\0", "\0" terminated rests) |
+#           blocks (I: block offsets and the end) | heads ("\0" joined first keys) | flags (B per key) |
+#           ids, brand_ids (q) | names.offsets (I), names.blob | raw.positions, raw.offsets (I), raw.blob (JSON)
+PART_INDEX_SECTIONS = [("header", "q"), ("keys", None), ("blocks", "I"), ("heads", None), ("flags", "B"),
+                       ("ids", "q"), ("brand_ids", "q"), ("names.offsets", "I"), ("names.blob", None),
+                       ("raw.positions", "I"), ("raw.offsets", "I"), ("raw.blob", None)]
+LISTED = 1        # in part_numbers.txt
+HAS_RECORD = 2    # in part_number_to_id.json
+NAME_IS_KEY = 4   # record["part_number"] == key
+RAW_RECORD = 8    # record kept as JSON
+RECORD_FIELDS = ["id", "part_number", "brand_id"]
+INT64_RANGE = (-2 ** 63, 2 ** 63)
+
+
+def _is_column_record(record):
+    # {"id": int, "part_number": str, "brand_id": int} in this order (records are rebuilt in it)
+    if type(record) is not dict or list(record) != RECORD_FIELDS or type(record["part_number"]) is not str:
+        return False
+    record_id, brand_id = record["id"], record["brand_id"]
+    return type(record_id) is int and type(brand_id) is int and \
+        INT64_RANGE[0] <= record_id < INT64_RANGE[1] and INT64_RANGE[0] <= brand_id < INT64_RANGE[1]
+
+
+def build_part_index(part_numbers, part_number_to_id, block_size=PART_INDEX_BLOCK_SIZE):
+    # {section name: bytes} of the part number lines and the key -> record map, ValueError for keys holding "\0"
+    listed = set(part_numbers)
+    keys = sorted(listed.union(part_number_to_id))
+    blob, blocks, heads, flags = bytearray(), array("I"), [], bytearray(len(keys))
+    ids, brand_ids = array("q", bytes(8 * len(keys))), array("q", bytes(8 * len(keys)))
+    name_offsets, name_blob = array("I", [0]), bytearray()
+    raw_positions, raw_offsets, raw_blob = array("I"), array("I", [0]), bytearray()
+
+    for start in range(0, len(keys), block_size):
+        block = [key.encode("utf-8") for key in keys[start:start + block_size]]
+        if any([b"\0" in key for key in block]):
+            raise ValueError("part number with a NUL byte: {!r}".format([key for key in block if b"\0" in key][0]))
+        prefix = os.path.commonprefix(block)[:255]   # first and last key would do, the block is sorted
+        blocks.append(len(blob))
+        heads.append(block[0])
+        blob += bytes((len(prefix),)) + prefix + b"\0"
+        for key in block:
+            blob += key[len(prefix):] + b"\0"
+    blocks.append(len(blob))
+
+    for index, key in enumerate(keys):
+        if key in listed:
+            flags[index] |= LISTED
+        if key in part_number_to_id:
+            flags[index] |= HAS_RECORD
+            record = part_number_to_id[key]
+            if _is_column_record(record):
+                ids[index], brand_ids[index] = record["id"], record["brand_id"]
+                if record["part_number"] == key:
+                    flags[index] |= NAME_IS_KEY
+                else:
+                    name_blob += record["part_number"].encode("utf-8")
+            else:
+                flags[index] |= RAW_RECORD
+                raw_positions.append(index)
+                raw_blob += json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                raw_offsets.append(len(raw_blob))
+        name_offsets.append(len(name_blob))
+
+    if max(len(blob), len(name_blob), len(raw_blob)) >= 2 ** 32:
+        raise ValueError("part number index too large")
+    return {"header": array("q", [block_size, len(keys)]).tobytes(), "keys": bytes(blob),
+            "blocks": blocks.tobytes(), "heads": b"\0".join(heads), "flags": bytes(flags), "ids": ids.tobytes(),
+            "brand_ids": brand_ids.tobytes(), "names.offsets": name_offsets.tobytes(), "names.blob": bytes(name_blob),
+            "raw.positions": raw_positions.tobytes(), "raw.offsets": raw_offsets.tobytes(), "raw.blob": bytes(raw_blob)}
+
+
+class PartIndex(object):
+    # read-only view of the sections (bytes, or memoryviews of a memory-mapped snapshot)
+    def __init__(self, sections):
+        views = {}
+        for name, fmt in PART_INDEX_SECTIONS:
+            view = memoryview(sections[name])
+            views[name] = view.cast(fmt) if fmt and view.format != fmt else view
+        self.block_size, self.key_count = views["header"]
+        self.blob, self.blocks, self.flags = views["keys"], views["blocks"], views["flags"]
+        self.ids, self.brand_ids = views["ids"], views["brand_ids"]
+        self.name_offsets, self.name_blob = views["names.offsets"], views["names.blob"]
+        self.raw_positions, self.raw_offsets, self.raw_blob = \
+            views["raw.positions"], views["raw.offsets"], views["raw.blob"]
+        # first key of every block, the only keys held as objects (bisect runs on them)
+        self.heads = views["heads"].tobytes().split(b"\0") if self.key_count else []
+
+    def _block(self, block):
+        # prefix length, prefix, "\0" and the "\0" terminated rests of the keys of a block
+        return self.blob[self.blocks[block]:self.blocks[block + 1]].tobytes()
+
+    def find(self, key):
+        # position of key, -1 if missing
+        if not isinstance(key, str):
+            return -1
+        key_bytes = key.encode("utf-8")
+        block = bisect.bisect_right(self.heads, key_bytes) - 1
+        if block < 0:
+            return -1
+        if self.heads[block] == key_bytes:
+            return block * self.block_size
+        data = self._block(block)
+        length = data[0] + 1
+        if not key_bytes.startswith(data[1:length]) or b"\0" in key_bytes:
+            return -1
+        pos = data.find(b"\0" + key_bytes[length - 1:] + b"\0", length)
+        return -1 if pos == -1 else block * self.block_size + data.count(b"\0", length, pos)
+
+    def keys(self):
+        # (position, key) of all keys in order
+        index = 0
+        for block in range(len(self.blocks) - 1):
+            data = self._block(block)
+            prefix = data[1:data[0] + 1]
+            for rest in data[data[0] + 2:-1].split(b"\0"):
+                yield index, (prefix + rest).decode("utf-8")
+                index += 1
+
+    def record(self, index, key):
+        # record of the key at index (HAS_RECORD set)
+        flags = self.flags[index]
+        if flags & RAW_RECORD:
+            i = bisect.bisect_left(self.raw_positions, index)
+            return json.loads(self.raw_blob[self.raw_offsets[i]:self.raw_offsets[i + 1]].tobytes())
+        if flags & NAME_IS_KEY:
+            name = key
+        else:
+            name = self.name_blob[self.name_offsets[index]:self.name_offsets[index + 1]].tobytes().decode("utf-8")
+        return {"id": self.ids[index], "part_number": name, "brand_id": self.brand_ids[index]}
@@ -0,0 +1,170 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# Quantity parsing engine
+# -----------------------
+# string_quantity_to_integer/ is_integer for a single cell, plus whole-column versions that run the same rules
+# with pandas string operations: strip/lower, drop everything except digits/ "k"/ "."/ "-", k-suffix (x1000),
+# thousands separators and "pcs/pieces" words fall out of the same character filter.
+QUANTITY_CHARACTERS = re.compile(r"[^0-9k\.\-]")
+K_QUANTITY_CHARACTERS = re.compile(r"[^0-9\.]")
+NUMBER_CHARACTERS = re.compile(r"[^0-9\.\-]")
+DECIMAL = re.compile(r"^(\d+\.\d+)?$")
+# regular shapes once filtered: "1500"/ "-20"/ ".5", "1.5k", "2k" (int(digits) * 1000 is exact in float64 up to 12 digits)
+QUANTITY_FORM = re.compile(r"(-?\d+\.?\d*|-?\.\d+)|(\d+\.\d+)k|(\d{1,12})k")
+PLAIN, K_DECIMAL, K_DIGITS = 1, 2, 3
+
+
+def string_quantity_to_integer(string_number):
+    try:
+        if string_number != string_number:
+            # nan converted to zero
+            return 0
+        if type(string_number) in [int, float]:
+            return int(float(string_number))
+        string_number = QUANTITY_CHARACTERS.sub("", str(string_number).strip().lower())   # preserver minus sign
+        is_k = True if string_number.strip().endswith("k") else False
+        if is_k:
+            element = K_QUANTITY_CHARACTERS.sub("", string_number.replace("k", "")).strip()
+            if bool(DECIMAL.match(element)):
+                return int(float(element) * 1000.0)
+            else:
+                return int(element) * 1000
+        return int(float(NUMBER_CHARACTERS.sub("", string_number).strip()))
+    except Exception as e:
+        return False
+
+
+def is_integer(element):
+    try:
+        if type(element) == int:
+            return True
+        if element != element:
+            return False
+
+        qty_related_words = ["pieces", "piece", "k", "qty"]   # not implemented yet, .replace() used instead
+        element = str(element).lower().replace(r'k', '').replace("pieces", "").replace("piece", "").replace(",", "").strip()
+        if element.isdigit():
+            return True
+        elif float(element) or int(element):
+            return True
+        return False
+    except Exception as e:
+        return False
+
+
+def _scalar_quantity(value):
+    # (number, valid, exact) of the scalar rules, ints that do not fit a float64 exactly are rounded (exact=False)
+    number = string_quantity_to_integer(value)
+    if number is False:
+        return 0, False, True
+    if abs(number) >= 2 ** 53:
+        return (float(number) if abs(number) < 10 ** 308 else np.sign(number) * np.inf), True, False
+    return number, True, True
+
+
+def _parse_quantity_strings(strings):
+    # string branch of string_quantity_to_integer for an array of str -> (numbers, valid, exact)
+    # every distinct string is parsed once, the regular shapes are converted by numpy, the rest by the scalar rules
+    codes, uniques = pd.factorize(np.asarray(strings, dtype=object))
+    forms = [QUANTITY_FORM.fullmatch(QUANTITY_CHARACTERS.sub("", string.strip().lower())) for string in uniques]
+    kinds = np.array([form.lastindex if form else 0 for form in forms], dtype=np.int64)
+    with np.errstate(over="ignore", invalid="ignore"):
+        parsed = np.array([form.group(form.lastindex) if form else "0" for form in forms], dtype=object).astype(float)
+        numbers = np.where(kinds == PLAIN, np.trunc(parsed),
+                           np.where(kinds == K_DECIMAL, np.trunc(parsed * 1000.0), parsed * 1000))
+    valid = (kinds > 0) & np.isfinite(numbers)   # float overflow -> int(inf) -> False
+    exact = np.ones(len(uniques), dtype=bool)
+    numbers[~valid] = 0
+    for index in np.flatnonzero(kinds == 0):
+        numbers[index], valid[index], exact[index] = _scalar_quantity(uniques[index])
+    return numbers[codes], valid[codes], exact[codes]
+
+
+def parse_quantities(values):
+    # string_quantity_to_integer over a whole column -> (numbers float64 array, validity mask)
+    # invalid cells (string_quantity_to_integer == False) are 0 in numbers, nan cells are a valid 0
+    numbers, valid, _ = _parse_quantities(values)
+    return numbers, valid
+
+
+def _as_cells(values):
+    # 1-d array of the cells, a list keeps its python scalars (np.asarray would turn 1 and 1.0 into float64)
+    if isinstance(values, np.ndarray):
+        return values
+    values = list(values)
+    cells = np.empty(len(values), dtype=object)
+    cells[:] = values
+    return cells
+
+
+def _parse_quantities(values):
+    values = _as_cells(values)
+    numbers = np.zeros(len(values), dtype=float)
+    valid = np.ones(len(values), dtype=bool)
+    exact = np.ones(len(values), dtype=bool)
+    if values.dtype == np.float64:
+        # numpy floats take the string branch (only python int/ float are converted directly)
+        present = ~np.isnan(values)
+        strings = values[present].astype(object).astype(str)
+    elif values.dtype.kind in "iu":
+        # int(float(str(i))) == int(float(i)), integers only go through float
+        return values.astype(float), valid, exact
+    elif values.dtype.kind == "b":
+        present = np.ones(len(values), dtype=bool)
+        strings = pd.Series(values, dtype=object).astype(str).values
+    elif pd.api.types.infer_dtype(values, skipna=False) == "integer" and \
+            all([abs(value) < 2 ** 1023 for value in (values.min(), values.max())]):
+        # only python/ numpy ints (same int(float(...)) result on both branches)
+        return values.astype(float), valid, exact
+    elif pd.api.types.infer_dtype(values, skipna=False) == "string":
+        present = np.ones(len(values), dtype=bool)
+        strings = values
+    else:
+        # object column: python numbers and unknown types go through the scalar rules, the rest is stringified
+        present = np.zeros(len(values), dtype=bool)
+        strings = []
+        for index, value in enumerate(values):
+            value_type = type(value)
+            if isinstance(value, str):
+                present[index] = True
+                strings.append(value)
+            elif value_type in (np.float64, np.float32) and value == value:
+                present[index] = True
+                strings.append(str(value))
+            elif value_type in (np.int64, np.int32, np.bool_, bool) or value is None:
+                present[index] = True
+                strings.append(str(value))
+            elif value_type in (np.float64, np.float32):
+                numbers[index] = 0
+            else:
+                numbers[index], valid[index], exact[index] = _scalar_quantity(value)
+    if len(strings):
+        numbers[present], valid[present], exact[present] = _parse_quantity_strings(strings)
+    return numbers, valid, exact
+
+
+def string_quantities_to_integers(values):
+    # list of string_quantity_to_integer(value) (python int or False) for a whole column
+    values = _as_cells(values)
+    numbers, valid, exact = _parse_quantities(values)
+    results = [int(number) if is_valid and is_exact else False
+               for number, is_valid, is_exact in zip(numbers.tolist(), valid.tolist(), exact.tolist())]
+    for index in np.flatnonzero(~exact):
+        results[index] = string_quantity_to_integer(values[index])
+    return results
+
+
+def integer_mask(values):
+    # is_integer over a whole column, once per distinct string
+    values = _as_cells(values)
+    mask = np.zeros(len(values), dtype=bool)
+    is_str = np.array([isinstance(value, str) for value in values], dtype=bool)
+    if is_str.any():
+        codes, uniques = pd.factorize(values[is_str].astype(object))
+        mask[is_str] = np.array([is_integer(unique) for unique in uniques], dtype=bool)[codes]
+    for index in np.flatnonzero(~is_str):
+        mask[index] = is_integer(values[index])
+    return mask
@@ -0,0 +1,168 @@
+import os
+import hashlib
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict, Counter
+try:
+    from src.config import RESULT_CACHE_SIZE, RESULT_CACHE_DIR, RESULT_CACHE_DISK_SIZE, RESULT_CACHE_FORMAT
+except:
+    from config import RESULT_CACHE_SIZE, RESULT_CACHE_DIR, RESULT_CACHE_DISK_SIZE, RESULT_CACHE_FORMAT
+
+
+# Result cache
+# ------------
+# Encoded match results keyed by the sha256 of what they were computed from: the uploaded bytes (and file type)
+# or the fetched page body (and page id), plus the catalog version and RESULT_CACHE_FORMAT. The key is also the
+# ETag of the response. A catalog change gives new keys, so results of the old catalog are never served; they
+# are dropped from memory right away and are the first to go from disk.
+#
+# tiers:    in-process LRU of up to RESULT_CACHE_SIZE bytes | optional directory (RESULT_CACHE_DIR) shared by
+#           all workers, least recently used files removed above RESULT_CACHE_DISK_SIZE bytes
+result_cache = OrderedDict()
+result_cache_lock = threading.Lock()
+result_cache_stats = Counter()
+result_cache_state = {"size": 0, "version": None, "disk_size": None}
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def set_result_catalog_version(version):
+    # called when a catalog is swapped in: results of other versions are dropped and no longer stored (requests
+    # still running on the old catalog finish without refilling the cache)
+    with result_cache_lock:
+        if result_cache_state["version"] != version:
+            if result_cache_state["version"] is not None:
+                print("Catalog version changed, {} cached results dropped".format(len(result_cache)))
+            result_cache.clear()
+            result_cache_state["size"] = 0
+            result_cache_state["version"] = version
+
+
+def result_key(catalog_version, kind, name, content):
+    # hex sha256 of (format, catalog version, kind, name, content), content is bytes or a binary file object
+    # (read in blocks from the start and rewound)
+    digest = hashlib.sha256()
+    for part in [RESULT_CACHE_FORMAT, catalog_version, kind, name]:
+        digest.update("{}\0".format(part).encode("utf-8"))
+    if isinstance(content, bytes):
+        digest.update(content)
+    else:
+        content.seek(0)
+        for block in iter(lambda: content.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+        content.seek(0)
+    return "{}-{}".format(catalog_version[:12], digest.hexdigest())
+
+
+# --------------------------------------------------------------------------------
+# Disk tier
+# --------------------------------------------------------------------------------
+def _disk_path(key):
+    return os.path.join(RESULT_CACHE_DIR, key + ".json")
+
+
+def _read_disk(key):
+    try:
+        path = _disk_path(key)
+        with open(path, "rb") as fp:
+            body = fp.read()
+        os.utime(path)   # mtime is the last use, for eviction
+        return body
+    except FileNotFoundError:
+        return None
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def _disk_entries():
+    entries = []
+    for entry in os.scandir(RESULT_CACHE_DIR):
+        if entry.name.endswith(".json"):
+            try:
+                stat = entry.stat()
+                entries.append((entry.path, entry.name, stat.st_size, stat.st_mtime))
+            except FileNotFoundError:
+                pass   # removed by another worker
+    return entries
+
+
+def _evict_disk(prefix):
+    # down to 90% of RESULT_CACHE_DISK_SIZE, entries of other catalog versions first, then least recently used
+    entries = _disk_entries()
+    size = sum([entry[2] for entry in entries])
+    for path, name, entry_size, _ in sorted(entries, key=lambda entry: (entry[1].startswith(prefix), entry[3])):
+        if size <= RESULT_CACHE_DISK_SIZE * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+        result_cache_stats["disk_evictions"] += 1
+    return size
+
+
+def _write_disk(key, body):
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=RESULT_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(body)
+        os.replace(tmp_path, _disk_path(key))
+
+        # the size is only re-counted from the directory when this worker's estimate passes the limit
+        with result_cache_lock:
+            if result_cache_state["disk_size"] is None:
+                result_cache_state["disk_size"] = sum([entry[2] for entry in _disk_entries()])
+            else:
+                result_cache_state["disk_size"] += len(body)
+            if result_cache_state["disk_size"] > RESULT_CACHE_DISK_SIZE:
+                result_cache_state["disk_size"] = _evict_disk(key.split("-")[0])
+    except Exception:
+        traceback.print_exc()
+
+
+# --------------------------------------------------------------------------------
+# Lookup
+# --------------------------------------------------------------------------------
+def _remember(key, body):
+    if len(body) > RESULT_CACHE_SIZE:
+        return
+    with result_cache_lock:
+        if key in result_cache:
+            result_cache.move_to_end(key)
+            return
+        result_cache[key] = body
+        result_cache_state["size"] += len(body)
+        while result_cache_state["size"] > RESULT_CACHE_SIZE:
+            _, evicted = result_cache.popitem(last=False)
+            result_cache_state["size"] -= len(evicted)
+
+
+def get_result(key):
+    # encoded result (bytes) or None
+    with result_cache_lock:
+        body = result_cache.get(key)
+        if body is not None:
+            result_cache.move_to_end(key)
+            result_cache_stats["memory_hits"] += 1
+            return body
+    if RESULT_CACHE_DIR:
+        body = _read_disk(key)
+        if body is not None:
+            result_cache_stats["disk_hits"] += 1
+            _remember(key, body)
+            return body
+    result_cache_stats["misses"] += 1
+    return None
+
+
+def store_result(key, body):
+    version = result_cache_state["version"]
+    if version is not None and not key.startswith(version[:12] + "-"):
+        return
+    _remember(key, body)
+    if RESULT_CACHE_DIR:
+        _write_disk(key, body)
@@ -0,0 +1,191 @@
+import pandas as pd
+try:
+    from src.api_helper import *
+except:
+    from api_helper import *
+
+
+# Bulk replacement of the df.iterrows() + get_row_match loop. Rows are read from df.values (the same interleaved
+# values iterrows builds its row Series from), every distinct cell of the brand/ part/ quantity columns is
+# cleaned and looked up once, and only the final dict per row is assembled in python.
+SUGGESTED_QUANTITY = "Suggested Quantity"
+
+
+def add_suggested_quantity(df, suggested_quantity_column, suggested_quantity_carry=None):
+    df[SUGGESTED_QUANTITY] = 0
+    if suggested_quantity_column or suggested_quantity_column is 0:   # 0 is logically False
+        df[SUGGESTED_QUANTITY] = df[suggested_quantity_column].ffill()
+        if suggested_quantity_carry is not None:
+            # chunk of a longer table: leading gaps continue the forward fill of the previous chunk
+            df[SUGGESTED_QUANTITY] = df[SUGGESTED_QUANTITY].fillna(suggested_quantity_carry)
+    return df
+
+
+def first_data_row(values, integer_check_positions, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # header/ title rows are skipped until the first row with an integer or a known brand/ part number,
+    # all rows after it are data rows (boolean mask = index >= first_data_row)
+    for index, row in enumerate(values):
+        if any([is_integer(clm) for clm in row[integer_check_positions]]):
+            return index
+        if exist_brand_alias_or_part(row, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+            return index
+    return len(values)
+
+
+def _lookup_column(cells, compute):
+    # compute() once per distinct str(cell) of a column, mapped back to every row
+    results = {}
+    mapped = []
+    for cell in cells:
+        k = str(cell)
+        if k not in results:
+            results[k] = compute(cell)
+        mapped.append(results[k])
+    return mapped
+
+
+def _part_number_id(part_number, PART_NUMBERS, PART_NUMBER_TO_ID):
+    cleaned = clean_part_number(part_number)
+    part_number_object = PART_NUMBER_TO_ID[cleaned] if cleaned in PART_NUMBERS else ""
+    return part_number_object["id"] if part_number_object else ""
+
+
+def _brand_id(brand_name, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID):
+    cleaned = clean_brand_name(brand_name)
+    brand_name_object = ""
+    if cleaned in BRAND_NAMES:
+        brand_name_object = BRAND_NAME_TO_ID[cleaned]
+    elif cleaned in BRAND_ALIASES:
+        brand_name_object = BRAND_ALIAS_TO_ID[cleaned]
+    return brand_name_object["id"] if brand_name_object else ""
+
+
+def _quantities(cells):
+    # string_quantity_to_integer(cell) if truthy else the cell itself, nan -> 0
+    quantities = [quantity if quantity else cell for quantity, cell in zip(string_quantities_to_integers(cells), cells)]
+    return [quantity if quantity == quantity else 0 for quantity in quantities]
+
+
+def _suggested_quantities(cells):
+    return [quantity if quantity else 0 for quantity in string_quantities_to_integers(cells)]
+
+
+def _mixed_cell_match(cell, brand_name_column, part_number_column,
+                      BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID):
+    # brand_name/ part_number (and their ids) extracted from one cell of a pattern or splitter column
+    row = {brand_name_column["column"]: cell}
+    if "pattern" in brand_name_column:
+        extracted_brand_name, extracted_part_number = get_brand_name_part_number_with_pattern(
+            row, brand_name_column, part_number_column)
+    else:
+        extracted_brand_name, extracted_part_number = get_brand_name_part_number_with_splitter(
+            row, brand_name_column, part_number_column, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+
+    extracted_part_id, extracted_brand_id = "", ""
+    if extracted_part_number and clean_part_number(extracted_part_number) in PART_NUMBERS:
+        part_number_object = PART_NUMBER_TO_ID[clean_part_number(extracted_part_number)]
+        extracted_part_id = part_number_object["id"] if part_number_object else ""
+
+    if extracted_brand_name and clean_brand_name(extracted_brand_name) in BRAND_NAMES:
+        brand_name_object = BRAND_NAME_TO_ID[clean_brand_name(extracted_brand_name)]
+        extracted_brand_id = brand_name_object["id"] if brand_name_object else ""
+    elif extracted_brand_name and clean_brand_name(extracted_brand_name) in BRAND_ALIASES:
+        brand_name_object = BRAND_ALIAS_TO_ID[clean_brand_name(extracted_brand_name)]
+        extracted_brand_id = brand_name_object["id"] if brand_name_object else ""
+    return extracted_brand_id, extracted_brand_name, extracted_part_id, extracted_part_number
+
+
+def _iter_row_matches(df, brand_name_column, quantity_column, part_number_column,
+                      BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID,
+                      first_row):
+    # per row fallback (duplicate column labels)
+    for row in list(df.iterrows())[first_row:]:
+        yield get_row_match(row[1], brand_name_column, quantity_column, part_number_column,
+                            BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                            PART_NUMBERS, PART_NUMBER_TO_ID)
+
+
+def get_table_matches(df, brand_name_column, quantity_column, part_number_column, suggested_quantity_column,
+                      BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID,
+                      header_check_suggested_quantity=True, skip_header_rows=True, suggested_quantity_carry=None):
+    # all non-empty row matches of a table, same records (and order) as get_row_match row by row
+    # (skip_header_rows=False/ suggested_quantity_carry for the chunks after the first one of a streamed table)
+    return list(iter_table_matches(df, brand_name_column, quantity_column, part_number_column,
+                                   suggested_quantity_column, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID,
+                                   BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID,
+                                   header_check_suggested_quantity, skip_header_rows, suggested_quantity_carry))
+
+
+def iter_table_matches(df, brand_name_column, quantity_column, part_number_column, suggested_quantity_column,
+                       BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID,
+                       header_check_suggested_quantity=True, skip_header_rows=True, suggested_quantity_carry=None):
+    # get_table_matches() one record at a time, each yielded as soon as its row is assembled
+    df = add_suggested_quantity(df, suggested_quantity_column, suggested_quantity_carry)
+    columns = list(df.columns)
+    values = df.values
+
+    integer_check_positions = [i for i, clm in enumerate(columns)
+                               if header_check_suggested_quantity or clm != SUGGESTED_QUANTITY]
+    first_row = first_data_row(values, integer_check_positions, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS) \
+        if skip_header_rows else 0
+    rows = values[first_row:]
+    if not len(rows):
+        return
+
+    if not df.columns.is_unique:
+        for row_match in _iter_row_matches(df, brand_name_column, quantity_column, part_number_column,
+                                           BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                                           PART_NUMBERS, PART_NUMBER_TO_ID, first_row):
+            if any([bool(x) for x in row_match.values()]):
+                yield row_match
+        return
+
+    def cells(column):
+        return rows[:, columns.index(column)]
+
+    empty = [""] * len(rows)
+    extracted_part_numbers, extracted_part_ids = empty, empty
+    if part_number_column and type(part_number_column) in [int, str]:
+        extracted_part_numbers = cells(part_number_column)
+        extracted_part_ids = _lookup_column(extracted_part_numbers, lambda cell: _part_number_id(
+            cell, PART_NUMBERS, PART_NUMBER_TO_ID))
+
+    extracted_brand_names, extracted_brand_ids = empty, empty
+    if brand_name_column and type(brand_name_column) in [int, str]:
+        extracted_brand_names = cells(brand_name_column)
+        extracted_brand_ids = _lookup_column(extracted_brand_names, lambda cell: _brand_id(
+            cell, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID))
+
+    # Pattern recognized or got matches from mixed columns
+    if brand_name_column and part_number_column and \
+            type(brand_name_column) is dict and \
+            type(part_number_column) is dict:
+        mixed = _lookup_column(cells(brand_name_column["column"]), lambda cell: _mixed_cell_match(
+            cell, brand_name_column, part_number_column, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID,
+            BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID))
+        extracted_brand_ids, extracted_brand_names, extracted_part_ids, extracted_part_numbers = \
+            [list(elt) for elt in zip(*mixed)]
+
+    elif type(brand_name_column) is dict or \
+            type(part_number_column) is dict:
+        print("problematic columns in get_table_matches:", brand_name_column, part_number_column)
+
+    quantities = [0] * len(rows)
+    if quantity_column or (quantity_column is 0 and type(quantity_column) != bool):
+        quantities = _quantities(cells(quantity_column))
+    suggested_quantities = _suggested_quantities(cells(SUGGESTED_QUANTITY))
+
+    for quantity, suggested_quantity, brand_id, brand_name, part_id, part_number in zip(
+            quantities, suggested_quantities, extracted_brand_ids, extracted_brand_names,
+            extracted_part_ids, extracted_part_numbers):
+        brand_name = brand_name.replace(")", "") if "(" not in brand_name else brand_name
+        match = {"quantity": abs(quantity) if type(quantity) in [int, float] else quantity,
+                 'suggested_quantity': abs(suggested_quantity) if type(suggested_quantity) in [int, float] else suggested_quantity,
+                 "brand_id": brand_id,
+                 "brand_name": brand_name,
+                 "part_number_id": part_id,
+                 "part_number": part_number
+                 }
+        if not any([bool(x) for x in match.values()]):
+            continue
+        yield match
@@ -0,0 +1,46 @@
+import threading
+from collections import Counter
+
+
+# Single-flight request coalescing
+# --------------------------------
+# Work keyed by what it is computed from (a page id for upstream fetches, the result cache key for matching) runs
+# once for concurrent callers: the first caller executes it, callers arriving while it is in flight wait for it and
+# get the same result (or the same exception). Nothing is kept once it is done, repeated requests are the result
+# cache's job. Per process, every worker of a pre-forked server coalesces its own requests.
+flights = {}
+flights_lock = threading.Lock()
+single_flight_stats = Counter()   # "<kind>_executed"/ "<kind>_coalesced"
+
+
+class Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(key, compute, kind):
+    with flights_lock:
+        flight = flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = flights[key] = Flight()
+        single_flight_stats[kind + ("_executed" if leader else "_coalesced")] += 1
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = compute()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with flights_lock:
+            del flights[key]
+        flight.done.set()
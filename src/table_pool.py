@@ -0,0 +1,173 @@
+import os
+import glob
+import atexit
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+try:
+    from src.config import TABLE_POOL_WORKERS, SERVER_WORKERS, CATALOG_SNAPSHOT_PATH, CATALOG_SOURCE_DIR, \
+        USE_CATALOG_SNAPSHOT, CATALOG_SHARED_DIR
+    from src.catalog_snapshot import load_catalog_snapshot, build_catalog_snapshot, CatalogSnapshot, SnapshotError
+    from src.layout_cache import set_layout_catalog_version
+    from src.api_helper import clear_normalization_cache
+except:
+    from config import TABLE_POOL_WORKERS, SERVER_WORKERS, CATALOG_SNAPSHOT_PATH, CATALOG_SOURCE_DIR, \
+        USE_CATALOG_SNAPSHOT, CATALOG_SHARED_DIR
+    from catalog_snapshot import load_catalog_snapshot, build_catalog_snapshot, CatalogSnapshot, SnapshotError
+    from layout_cache import set_layout_catalog_version
+    from api_helper import clear_normalization_cache
+
+
+# Table process pool
+# ------------------
+# One pool of worker processes per server process, shared by the endpoints that match several tables of one
+# request (workbook sheets, tables of a message page). Workers are forked from a forkserver (a fresh single
+# threaded process) rather than from the server process, which runs request/ watcher/ fetch threads holding locks
+# a forked child could inherit locked. Every job carries the version of the catalog of its request and the path of
+# a snapshot of that version, a worker maps it (pages shared with all other processes) and maps it again when the
+# version changes. Workers never parse the text/JSON files: without a snapshot of the version (the configured or
+# shared one), the server process builds one into a directory of its own before the jobs are submitted. Jobs
+# whose version has no snapshot (catalog changed again on disk meanwhile) are matched in the server process.
+table_pool = None
+table_pool_lock = threading.Lock()
+table_pool_stats = Counter()
+table_pool_state = {"snapshot_dir": None, "snapshots": {}}
+pool_snapshot_lock = threading.Lock()
+worker_catalog = {"version": None, "catalog": None, "missing": None}
+
+
+class CatalogVersionError(Exception):
+    pass
+
+
+def table_pool_size():
+    # available cores shared by the server workers (gunicorn forks SERVER_WORKERS of them, one per core by default)
+    cores = len(os.sched_getaffinity(0))
+    return TABLE_POOL_WORKERS or max(1, cores // (SERVER_WORKERS or cores))
+
+
+def snapshot_version(path):
+    try:
+        return CatalogSnapshot(path).version
+    except (OSError, SnapshotError):
+        return None
+
+
+def _build_pool_snapshot(version):
+    # snapshot of the current sources in the directory of this server process, None if they are not version
+    if table_pool_state["snapshot_dir"] is None:
+        table_pool_state["snapshot_dir"] = tempfile.mkdtemp(prefix="table_pool_catalog_",
+                                                            dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        atexit.register(shutil.rmtree, table_pool_state["snapshot_dir"], True)
+    path = os.path.join(table_pool_state["snapshot_dir"], "catalog.{}.snapshot".format(version))
+    built = build_catalog_snapshot(CATALOG_SOURCE_DIR, path)
+    table_pool_stats["snapshots_built"] += 1
+    if built != version:   # sources changed again since the request took its catalog
+        os.remove(path)
+        return None
+    for other_path in glob.glob(os.path.join(table_pool_state["snapshot_dir"], "catalog.*.snapshot")):
+        if other_path != path:
+            os.remove(other_path)   # workers still mapping it keep it until they map the new one
+    return path
+
+
+def pool_snapshot_path(version):
+    # snapshot of version the workers map: the configured one, the shared one, or one built from the sources
+    with pool_snapshot_lock:
+        path = table_pool_state["snapshots"].get(version)
+        if path and os.path.exists(path):
+            return path
+        candidates = [CATALOG_SNAPSHOT_PATH] if USE_CATALOG_SNAPSHOT else []
+        if CATALOG_SHARED_DIR:
+            candidates.append(os.path.join(CATALOG_SHARED_DIR, "catalog.{}.snapshot".format(version)))
+        path = next((path for path in candidates if snapshot_version(path) == version), None)
+        if path is None:
+            try:
+                path = _build_pool_snapshot(version)
+            except (OSError, ValueError) as e:
+                print("ERROR building the table pool catalog snapshot ({})".format(e))
+        table_pool_state["snapshots"] = {version: path} if path else {}
+        return path
+
+
+def get_worker_catalog(version, snapshot_path):
+    # (BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID) of version
+    if worker_catalog["version"] != version:
+        if worker_catalog["missing"] != [version, snapshot_path]:   # not mapped again for the same job arguments
+            try:
+                catalog = load_catalog_snapshot(snapshot_path)
+            except (OSError, SnapshotError) as e:
+                worker_catalog["missing"] = [version, snapshot_path]
+                raise CatalogVersionError("catalog {} is not available ({})".format(version, e))
+            if catalog.version == version:
+                worker_catalog["version"] = catalog.version
+                set_layout_catalog_version(catalog.version)
+                clear_normalization_cache()
+                worker_catalog["catalog"] = (catalog.brand_names, catalog.brand_aliases, catalog.brand_name_to_id,
+                                             catalog.brand_alias_to_id, catalog.part_numbers,
+                                             catalog.part_number_to_id)
+                print("Table pool worker {} mapped catalog {}".format(os.getpid(), catalog.version))
+        if worker_catalog["version"] != version:
+            worker_catalog["missing"] = [version, snapshot_path]
+            raise CatalogVersionError("catalog {} is not available, worker has {}".format(
+                version, worker_catalog["version"]))
+    return worker_catalog["catalog"]
+
+
+def run_table_job(job, argument, version, snapshot_path):
+    # in a pool worker
+    return job(argument, get_worker_catalog(version, snapshot_path))
+
+
+def get_table_pool():
+    global table_pool
+    with table_pool_lock:
+        if table_pool is None:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["src.workbook", "src.page_tables"])
+            workers = table_pool_size()
+            table_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            print("Started table pool with {} worker processes".format(workers))
+        return table_pool
+
+
+def reset_table_pool(pool):
+    global table_pool
+    with table_pool_lock:
+        if table_pool is pool:
+            table_pool = None
+    pool.shutdown(wait=False)
+
+
+def map_table_jobs(job, arguments, catalog, version):
+    # results of job(argument, catalog) in the pool, in the order of arguments
+    snapshot_path = pool_snapshot_path(version)
+    if snapshot_path is None:
+        print("Table pool: no snapshot of catalog {}, matching in the server process".format(version))
+        for argument in arguments:
+            table_pool_stats["local_jobs"] += 1
+            yield job(argument, catalog)
+        return
+    pool = get_table_pool()
+    try:
+        futures = [pool.submit(run_table_job, job, argument, version, snapshot_path) for argument in arguments]
+    except BrokenProcessPool:
+        reset_table_pool(pool)
+        raise
+    for argument, future in zip(arguments, futures):
+        try:
+            result = future.result()
+            table_pool_stats["jobs"] += 1
+        except CatalogVersionError as e:
+            print("Table pool: {}, matching in the server process".format(e))
+            table_pool_stats["local_jobs"] += 1
+            result = job(argument, catalog)
+        except BrokenProcessPool:
+            # a worker died (killed/ out of memory), the next request starts a new pool
+            reset_table_pool(pool)
+            raise
+        yield result
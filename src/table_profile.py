@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from collections import Counter
+try:
+    from src.api_helper import clean_brand_name, clean_part_number, clean_brand_names, clean_part_numbers, \
+        parse_quantities, string_quantities_to_integers, integer_mask, possible_splitter, split_candidates
+except:
+    from api_helper import clean_brand_name, clean_part_number, clean_brand_names, clean_part_numbers, \
+        parse_quantities, string_quantities_to_integers, integer_mask, possible_splitter, split_candidates
+
+
+class TableProfile(object):
+    # Built once per table (after fix_data_frame) and shared by every column detector. The header row is sliced
+    # off once and each per-column view (unique values, cleaned brand/ part forms, quantity parses, split
+    # candidates) is computed on first use and then reused by the whole detection cascade.
+    def __init__(self, df, table_header):
+        self.frame = df
+        self.table_header = table_header
+        self.header_row = None
+        self.data = df
+        if table_header["status"]:
+            if table_header["row_number"] != -1:
+                self.header_row = df.iloc[table_header["row_number"]]
+                self.data = df[table_header["row_number"] + 1:]
+            else:
+                self.header_row = pd.Series(df.columns)
+        self.columns = list(self.data.columns)
+        self.row_count = self.data.shape[0]
+        self.ratios = {}   # last columns ratios of each detector, read by the adaptive detection
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def sample(self, size):
+        # stratified sample of the data rows: `size` equal strata, middle row of each (same header)
+        size = min(size, self.row_count)
+
+        def compute():
+            sample = TableProfile(self.frame, {"status": False, "row_number": None})
+            sample.table_header, sample.header_row = self.table_header, self.header_row
+            sample.data = self.data.iloc[((np.arange(size) + 0.5) * self.row_count / size).astype(np.int64)]
+            sample.row_count = sample.data.shape[0]
+            return sample
+        return self._cached(("sample", size), compute)
+
+    # ---------------
+    # per column data
+    # ---------------
+    def non_empty_strings(self, column, boxed=False):
+        # str() of every truthy, non-nan cell (same filter as `elt and elt == elt`), vectorized for plain dtypes.
+        # boxed=True follows Series iteration (python scalars) instead of .values, they only differ for dates
+        values = self.data[column].values
+        if values.dtype.kind in "biuf":
+            return pd.Series(values[(values != 0) & (values == values)], dtype=object).astype(str).values
+        if values.dtype.kind == "O":
+            return pd.Series(values[values.astype(bool) & pd.notna(values)], dtype=object).astype(str).values
+        cells = self.data[column] if boxed else values
+        return np.array([str(elt) for elt in cells if elt and elt == elt], dtype=object)
+
+    def _stacked_cells(self, boxed=False):
+        # all non-empty cells of the table as (column position, code of distinct string, distinct strings)
+        def compute():
+            if not self.data.columns.is_unique:
+                raise ValueError("duplicate column names: {}".format(list(self.data.columns)))
+            positions, strings = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=object)]
+            for position, column in enumerate(self.columns):
+                cells = self.non_empty_strings(column, boxed)
+                positions.append(np.full(len(cells), position, dtype=np.int64))
+                strings.append(cells)
+            codes, uniques = pd.factorize(np.concatenate(strings))
+            return np.concatenate(positions), codes, uniques
+        return self._cached(("stacked_cells", boxed), compute)
+
+    def _column_forms(self, positions, cell_forms, n_forms):
+        # distinct (column position, form code) pairs
+        pairs = np.unique(positions * max(n_forms, 1) + cell_forms)
+        return pairs // max(n_forms, 1), pairs % max(n_forms, 1)
+
+    def catalog_scores(self, kind, catalog):
+        # {column: (catalog hits, unique forms)} for all columns at once; each distinct cell string is cleaned once
+        # kind="brand" drops empty cleaned names, kind="part" keeps them (as the original set comprehensions did).
+        # Cached by kind: a profile is scored against one catalog, whose brand union is built anew by every caller
+        def compute():
+            positions, codes, uniques = self._stacked_cells()
+            clean = clean_brand_names if kind == "brand" else clean_part_numbers
+            form_codes, forms = pd.factorize(clean(uniques))
+            columns, form_ids = self._column_forms(positions, form_codes[codes], len(forms))
+            keep = (forms[form_ids] != "") if kind == "brand" else np.ones(len(form_ids), dtype=bool)
+            hits = catalog_contains(catalog, forms)[form_ids]
+            n_unique = np.bincount(columns[keep], minlength=len(self.columns))
+            n_hits = np.bincount(columns[keep & hits], minlength=len(self.columns))
+            return dict((column, (int(n_hits[i]), int(n_unique[i]))) for i, column in enumerate(self.columns))
+        return self._cached(("catalog_scores", kind), compute)
+
+    def quantity_scores(self):
+        # {column: (integer forms, unique forms, max integer value)} over lowered/ stripped cell strings
+        def compute():
+            positions, codes, uniques = self._stacked_cells(boxed=True)
+            form_codes, forms = pd.factorize(pd.Series(uniques, dtype=object).str.lower().str.strip().values)
+            columns, form_ids = self._column_forms(positions, form_codes[codes], len(forms))
+            form_is_integer = integer_mask(forms)
+            form_values = np.where(form_is_integer, parse_quantities(forms)[0], -np.inf)
+            integer = form_is_integer[form_ids]
+            n_unique = np.bincount(columns, minlength=len(self.columns))
+            n_integer = np.bincount(columns[integer], minlength=len(self.columns))
+            maxima = np.full(len(self.columns), -np.inf)
+            np.maximum.at(maxima, columns[integer], form_values[form_ids][integer])
+            return dict((column, (int(n_integer[i]), int(n_unique[i]), maxima[i]))
+                        for i, column in enumerate(self.columns))
+        return self._cached("quantity_scores", compute)
+
+    def quantity_sum(self, column):
+        def compute():
+            cells = list(self.data[column])   # python scalars, as iterating the column gives them
+            quantities = string_quantities_to_integers(cells)
+            return sum([quantity for quantity, is_int in zip(quantities, integer_mask(cells)) if is_int])
+        return self._cached(("quantity_sum", column), compute)
+
+    def cell_counts(self, column):
+        # string form of every cell -> number of rows, detectors working on str(cell) score each distinct cell once
+        return self._cached(("cell_counts", column),
+                            lambda: Counter([str(row) for row in self.data[column].values]))
+
+    # -------------------------
+    # mixed brand/ part columns
+    # -------------------------
+    def fragments(self, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+        # one FragmentIndex per catalog, shared by check_existing_patterns and try_search_with_splitter
+        return self._cached(("fragments", id(BRAND_NAMES), id(BRAND_ALIASES), id(PART_NUMBERS)),
+                            lambda: FragmentIndex(BRAND_NAMES.union(BRAND_ALIASES), PART_NUMBERS))
+
+
+class FragmentIndex(object):
+    # Catalog hits of cell fragments. Every distinct fragment is cleaned and looked up once, whichever splitter
+    # hypothesis or b#p/ p#b pattern produced it, and every distinct cell is split once for all splitters.
+    def __init__(self, brands, part_numbers):
+        self.brands = brands
+        self.part_numbers = part_numbers
+        self._hits = {}
+        self._split_hits = {}
+
+    def hits(self, fragment):
+        # (brand hit, part number hit, non-empty brand hit, non-empty part number hit)
+        hit = self._hits.get(fragment)
+        if hit is None:
+            brand_name, part_number = clean_brand_name(fragment), clean_part_number(fragment)
+            brand_hit, part_number_hit = brand_name in self.brands, part_number in self.part_numbers
+            hit = self._hits[fragment] = (brand_hit, part_number_hit,
+                                          bool(brand_name) and brand_hit, bool(part_number) and part_number_hit)
+        return hit
+
+    def split_hits(self, cell):
+        # {splitter: any brand/ part number among split_candidates(cell, splitter)} for all possible splitters,
+        # splitters missing from the cell all give the same candidates (the cell and its sub splits)
+        hits = self._split_hits.get(cell)
+        if hits is None:
+            hits, absent = {}, None
+            for splitter in possible_splitter:
+                if splitter not in cell and absent is not None:
+                    hits[splitter] = absent
+                    continue
+                hits[splitter] = any(any(self.hits(fragment)[2:]) for fragment in split_candidates(cell, splitter))
+                if splitter not in cell:
+                    absent = hits[splitter]
+            self._split_hits[cell] = hits
+        return hits
+
+
+def catalog_contains(catalog, forms):
+    # membership of distinct forms only, never iterates the catalog (it may be a memory-mapped snapshot set)
+    return np.fromiter((form in catalog for form in forms), dtype=bool, count=len(forms))
@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from src.config import UPSTREAM_CONCURRENCY, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, \
+        UPSTREAM_RETRIES, UPSTREAM_RETRY_BACKOFF
+    from src.single_flight import single_flight
+except:
+    from config import UPSTREAM_CONCURRENCY, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, \
+        UPSTREAM_RETRIES, UPSTREAM_RETRY_BACKOFF
+    from single_flight import single_flight
+
+
+# Upstream page fetches
+# ---------------------
+# One keep-alive HTTP session per process (connection pool sized to UPSTREAM_CONCURRENCY), with connect/ read
+# timeouts and retries of connection errors and 429/ 5xx answers with exponential backoff. Pages of a batch are
+# fetched by a bounded thread pool, at most UPSTREAM_CONCURRENCY requests in flight. Concurrent fetches of the
+# same url (single and batch requests alike) share one upstream request.
+upstream_session = None
+upstream_session_lock = threading.Lock()
+
+
+def get_upstream_session():
+    global upstream_session
+    with upstream_session_lock:
+        if upstream_session is None:
+            retry = Retry(total=UPSTREAM_RETRIES, backoff_factor=UPSTREAM_RETRY_BACKOFF,
+                          status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"],
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_CONCURRENCY, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            upstream_session = session
+        return upstream_session
+
+
+def _get(url):
+    response = get_upstream_session().get(url, timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT))
+    response.raise_for_status()
+    return response.content
+
+
+def fetch_page(url):
+    # page body (bytes), raises on connection errors, timeouts and non 2xx answers left after the retries
+    return single_flight("fetch:" + url, lambda: _get(url), "fetch")
+
+
+def _fetch(url):
+    try:
+        return fetch_page(url), None
+    except Exception as e:
+        print("ERROR fetching {}: {}".format(url, e))
+        return None, e
+
+
+def iter_fetched_pages(urls):
+    # (content, error) per url in the order of urls. Fetches run ahead of the consumer in the thread pool,
+    # bounded to twice the concurrency so fetched pages do not pile up while they are being processed
+    executor = ThreadPoolExecutor(max_workers=UPSTREAM_CONCURRENCY)
+    futures = deque()
+    try:
+        for url in urls:
+            futures.append(executor.submit(_fetch, url))
+            if len(futures) >= 2 * UPSTREAM_CONCURRENCY:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,137 @@
+import io
+import traceback
+import pandas as pd
+from pandas.io.parsers import TextParser
+try:
+    from src.config import PARALLEL_TABLES, TABLE_POOL_MIN_SIZE
+    from src import table_pool
+    from src.api_helper import fix_data_frame, is_header_row
+    from src.table_profile import TableProfile
+    from src.layout_cache import detect_columns_with_layout_cache
+    from src.row_matcher import iter_table_matches
+except:
+    from config import PARALLEL_TABLES, TABLE_POOL_MIN_SIZE
+    import table_pool
+    from api_helper import fix_data_frame, is_header_row
+    from table_profile import TableProfile
+    from layout_cache import detect_columns_with_layout_cache
+    from row_matcher import iter_table_matches
+
+
+# Workbook processing
+# -------------------
+# Every sheet of an uploaded workbook is read, sheets holding several tables stacked below each other are cut
+# into one table per block. The sheets are read and every table is matched in the table process pool (the workers
+# load the catalog themselves, it is not pickled). Records are tagged with their sheet name and table index, a table that
+# fails adds an error entry ({"sheet": name, "table_index": i, "Error": ...}) instead of failing the upload.
+
+
+def split_stacked_tables(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # a sheet is cut after empty rows that are followed by a header row (quantity keyword, no integer, no catalog
+    # hit), the first row of every following block is its column header as pd.read_excel would read it.
+    # A single table with empty rows in it is returned as it is
+    empty = df.isna().all(axis=1).values
+    starts = [index for index in range(1, len(df))
+              if empty[index - 1] and not empty[index] and
+              is_header_row(df.values[index], BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)]
+    if not starts:
+        return [df]
+    tables = [df.iloc[:starts[0]]]
+    for start, end in zip(starts, starts[1:] + [len(df)]):
+        block = df.iloc[start:end]
+        table = TextParser(block.values.tolist(), header=0, skip_blank_lines=False).read()
+        table.index = block.index[1:]
+        tables.append(table)
+    return tables
+
+
+def read_sheet_tables(book, sheet, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+    # [(sheet name, table index, DataFrame)] of the non-empty tables of a sheet (pd.ExcelFile book)
+    tables = []
+    df = book.parse(sheet)
+    for table_index, table in enumerate(split_stacked_tables(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)):
+        if table.dropna(axis=0, how="all").dropna(axis=1, how="all").size:
+            tables.append((sheet, table_index, table))
+    return tables
+
+
+def match_table(sheet, table_index, df, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                PART_NUMBERS, PART_NUMBER_TO_ID):
+    df, table_header = fix_data_frame(df, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+    profile = TableProfile(df, table_header)
+    brand_name_column, part_number_column, quantity_column, suggested_quantity_column, table_header, df = \
+        detect_columns_with_layout_cache(profile, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+
+    matches = []
+    for match in iter_table_matches(df, brand_name_column, quantity_column, part_number_column,
+                                    suggested_quantity_column, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID,
+                                    BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID):
+        match["sheet"], match["table_index"] = sheet, table_index
+        matches.append(match)
+    return matches
+
+
+def match_table_or_error(sheet, table_index, df, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                         PART_NUMBERS, PART_NUMBER_TO_ID):
+    try:
+        return match_table(sheet, table_index, df, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                           PART_NUMBERS, PART_NUMBER_TO_ID)
+    except Exception:
+        print("ERROR processing table: sheet={}, table_index={}".format(sheet, table_index))
+        traceback.print_exc()
+        return [{"sheet": sheet, "table_index": table_index, "Error": "Can not process table"}]
+
+
+def match_sheet(book, sheet, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                PART_NUMBERS, PART_NUMBER_TO_ID):
+    matches = []
+    for _, table_index, df in read_sheet_tables(book, sheet, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS):
+        matches += match_table_or_error(sheet, table_index, df, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID,
+                                        BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID)
+    return matches
+
+
+def read_sheet_job(job, catalog):
+    # a worker reads its sheet from the upload bytes itself (reading is most of the time spent on a workbook)
+    data, sheet = job
+    BRAND_NAMES, BRAND_ALIASES, _, _, PART_NUMBERS, _ = catalog
+    with pd.ExcelFile(io.BytesIO(data)) as book:
+        return read_sheet_tables(book, sheet, BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+
+
+def match_table_job(job, catalog):
+    sheet, table_index, df = job
+    return match_table_or_error(sheet, table_index, df, *catalog)
+
+
+def iter_workbook_matches(stream, BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID,
+                          PART_NUMBERS, PART_NUMBER_TO_ID, catalog_version=None):
+    # matches of all sheets/ tables of a workbook in order. Uploads of at least TABLE_POOL_MIN_SIZE bytes (below
+    # that a worker round trip costs more than it saves) of a catalog with a version (the workers load it by
+    # version) go to the process pool: sheets are read there when there are several of them, then every table
+    # (stacked tables of a sheet included) is matched as a job of its own when there are several. Otherwise the
+    # sheets are read and matched one after another
+    catalog = (BRAND_NAMES, BRAND_ALIASES, BRAND_NAME_TO_ID, BRAND_ALIAS_TO_ID, PART_NUMBERS, PART_NUMBER_TO_ID)
+    data = stream.read()
+    with pd.ExcelFile(io.BytesIO(data)) as book:
+        sheets = book.sheet_names
+        if not (PARALLEL_TABLES and catalog_version and len(data) >= TABLE_POOL_MIN_SIZE):
+            for sheet in sheets:
+                for match in match_sheet(book, sheet, *catalog):
+                    yield match
+            return
+        if len(sheets) == 1:
+            tables = read_sheet_tables(book, sheets[0], BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+
+    if len(sheets) > 1:
+        tables = [table for sheet_tables in
+                  table_pool.map_table_jobs(read_sheet_job, [(data, sheet) for sheet in sheets], catalog,
+                                            catalog_version)
+                  for table in sheet_tables]
+    if len(tables) > 1:
+        results = table_pool.map_table_jobs(match_table_job, tables, catalog, catalog_version)
+    else:
+        results = (match_table_job(table, catalog) for table in tables)
+    for matches in results:
+        for match in matches:
+            yield match
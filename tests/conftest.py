@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import pytest
+
+# Tests run against a catalog of their own: brand files of data/outputs and the part numbers of the sample
+# workbooks (tests/data/catalog, the crawled part number files are not part of the repository), loaded from the
+# text/JSON files. Settings are changed before the app modules are imported (they copy them at import time).
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DATA_DIR = os.path.join(ROOT, "tests", "data")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)   # keyword files are read from ./data
+
+CATALOG_DIR = tempfile.mkdtemp(prefix="catalog_")
+for name in ["brand_names.txt", "brand_aliases.txt", "brand_name_to_id.json", "brand_alias_to_id.json"]:
+    shutil.copy(os.path.join(ROOT, "data", "outputs", name), CATALOG_DIR)
+for name in ["part_numbers.txt", "part_number_to_id.json"]:
+    shutil.copy(os.path.join(TEST_DATA_DIR, "catalog", name), CATALOG_DIR)
+
+import src.config as config
+config.CATALOG_SOURCE_DIR = CATALOG_DIR
+config.CATALOG_SNAPSHOT_PATH = os.path.join(CATALOG_DIR, "catalog.snapshot")
+config.USE_CATALOG_SNAPSHOT = False
+config.CATALOG_SHARED_DIR = None
+config.CATALOG_RELOAD_INTERVAL = 0
+config.LAYOUT_CACHE_PATH = None
+config.RESULT_CACHE_SIZE = 0
+config.RESULT_CACHE_DIR = None
+config.PARALLEL_TABLES = False
+
+
+@pytest.fixture
+def other_catalog(tmp_path):
+    # the test catalog with one more part number (ZZ0000), swapped in for the test and swapped back after it
+    from src import catalog_holder
+    source_dir = str(tmp_path / "catalog")
+    shutil.copytree(CATALOG_DIR, source_dir)
+    with open(os.path.join(source_dir, "part_numbers.txt"), "a") as fp:
+        fp.write("zz0000\n")
+    with open(os.path.join(source_dir, "part_number_to_id.json"), "r") as fp:
+        part_number_to_id = json.load(fp)
+    part_number_to_id["zz0000"] = {"id": 999999, "part_number": "ZZ0000", "brand_id": 1}
+    with open(os.path.join(source_dir, "part_number_to_id.json"), "w") as fp:
+        json.dump(part_number_to_id, fp)
+    catalog_holder.CATALOG_SOURCE_DIR = source_dir
+    try:
+        assert catalog_holder.reload_catalog(force=True)
+        yield catalog_holder.current_catalog()
+    finally:
+        catalog_holder.CATALOG_SOURCE_DIR = CATALOG_DIR
+        catalog_holder.reload_catalog(force=True)   # no-op when the test swapped back already
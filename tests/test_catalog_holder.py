@@ -0,0 +1,116 @@
+import io
+import os
+import threading
+import api
+from conftest import CATALOG_DIR
+from src import catalog_holder, catalog_snapshot, layout_cache, result_cache
+from src.api_helper import clean_brand_name, normalization_cache_info
+
+
+# Catalog swaps: a request keeps the catalog it started with, the caches of the old catalog go in the same swap, a
+# catalog that does not load is never swapped in, and the admin endpoint wants its token
+UPLOAD = b"Manufacturer,MPN,Qty\nMurata,ZZ0000,10\n"
+
+
+def post_upload():
+    return api.app.test_client().post("/api/get-match-from-file/", data={"file": (io.BytesIO(UPLOAD), "upload.csv")})
+
+
+def swap_back():
+    # the test catalog again, in place of other_catalog
+    catalog_holder.CATALOG_SOURCE_DIR = CATALOG_DIR
+    assert catalog_holder.reload_catalog(force=True)
+    return catalog_holder.current_catalog()
+
+
+def test_request_keeps_its_catalog_across_a_swap(other_catalog, monkeypatch):
+    started, release, catalogs = threading.Event(), threading.Event(), []
+
+    def iter_file_matches(stream, filename, catalog):
+        catalogs.append(catalog)
+        started.set()
+        release.wait(5)
+        yield {"part_number": "ZZ0000", "listed": "zz0000" in catalog.part_numbers}
+
+    monkeypatch.setattr(api, "iter_file_matches", iter_file_matches)
+    responses = []
+    thread = threading.Thread(target=lambda: responses.append(post_upload()), daemon=True)
+    thread.start()
+    assert started.wait(5)
+
+    # swapped while the request is matching: it finishes on the catalog it took, the next one gets the new one
+    new = swap_back()
+    assert catalog_holder.current_catalog() is new and new.version != other_catalog.version
+    release.set()
+    thread.join(5)
+    assert catalogs == [other_catalog]
+    assert responses[0].headers["X-Catalog-Version"] == other_catalog.version
+    assert responses[0].get_json() == [{"part_number": "ZZ0000", "listed": True}]
+    assert "zz0000" not in new.part_numbers
+    assert post_upload().headers["X-Catalog-Version"] == new.version
+
+
+def test_swap_invalidates_caches(other_catalog):
+    with layout_cache.layout_cache_lock:
+        layout_cache.layout_cache["signature"] = {"brand_name_column": "a", "part_number_column": "b",
+                                                  "quantity_column": False, "suggested_quantity_column": False}
+    clean_brand_name("Some Brand Not In The Catalog Inc")
+    size = normalization_cache_info()["brand_name"]["size"]
+
+    new = swap_back()
+    assert result_cache.result_cache_state["version"] == new.version
+    assert layout_cache.layout_cache_state["version"] == new.version
+    assert len(layout_cache.layout_cache) == 0
+    # emptied and warmed with the brands of the new catalog only
+    assert normalization_cache_info()["brand_name"]["size"] < size
+    assert normalization_cache_info()["part_number"]["size"] == 0
+
+
+def test_corrupt_snapshot_is_not_swapped_in(other_catalog, monkeypatch, tmp_path):
+    snapshot_path = str(tmp_path / "catalog.snapshot")
+    catalog_snapshot.build_catalog_snapshot(catalog_holder.CATALOG_SOURCE_DIR, snapshot_path)
+    monkeypatch.setattr(catalog_snapshot, "USE_CATALOG_SNAPSHOT", True)
+    monkeypatch.setattr(catalog_holder, "CATALOG_SNAPSHOT_PATH", snapshot_path)
+    assert catalog_holder.reload_catalog(force=True)
+    assert catalog_holder.current_catalog().source == "snapshot"
+
+    # truncated: rejected, the catalog of the same sources is read from the text/JSON files
+    with open(snapshot_path, "r+b") as fp:
+        fp.truncate(os.path.getsize(snapshot_path) // 2)
+    assert catalog_holder.reload_catalog(force=True)
+    catalog = catalog_holder.current_catalog()
+    assert catalog.source == "files" and catalog.version == other_catalog.version
+    assert catalog.part_number_to_id["zz0000"]["id"] == 999999
+
+
+def test_catalog_that_fails_to_load_keeps_the_old_one(other_catalog):
+    with open(os.path.join(catalog_holder.CATALOG_SOURCE_DIR, "part_number_to_id.json"), "w") as fp:
+        fp.write('{"zz0000": {"id": ')   # cut off mid-write
+    errors = catalog_holder.catalog_holder_stats["reload_errors"]
+    assert not catalog_holder.reload_catalog(force=True)
+    assert catalog_holder.catalog_holder_stats["reload_errors"] == errors + 1
+    assert catalog_holder.current_catalog() is other_catalog
+    assert post_upload().headers["X-Catalog-Version"] == other_catalog.version
+
+
+def test_admin_reload_token(monkeypatch):
+    reloads = []
+    monkeypatch.setattr(api, "start_catalog_reload", lambda force=False: reloads.append(force))
+    client = api.app.test_client()
+    url = "/api/admin/reload-catalog/"
+
+    monkeypatch.setattr(api, "CATALOG_ADMIN_TOKEN", None)   # endpoint disabled
+    assert client.post(url, headers={"X-Admin-Token": "secret"}).status_code == 403
+
+    monkeypatch.setattr(api, "CATALOG_ADMIN_TOKEN", "secret")
+    response = client.post(url)
+    assert response.status_code == 401 and response.headers["WWW-Authenticate"]
+    assert client.post(url, headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.post(url, headers={"X-Admin-Token": "secret!"}).status_code == 403
+    assert reloads == []
+
+    response = client.post(url, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 202
+    assert response.get_json() == {"version": catalog_holder.current_catalog().version,
+                                   "source": catalog_holder.current_catalog().source, "reloading": True}
+    assert reloads == [True]
@@ -0,0 +1,111 @@
+import os
+import json
+import shutil
+import struct
+import pytest
+from conftest import CATALOG_DIR
+from src import catalog_snapshot
+from src.catalog_snapshot import build_catalog_snapshot, load_catalog_snapshot, read_catalog_sources, \
+    load_catalog_files, catalog_version, SnapshotError, HEADER, SECTION
+from src.api_helper import invalid_brand_names, invalid_part_numbers
+
+
+# Snapshot build -> load round trip against the text/JSON sources it was built from, and snapshots that are cut
+# off or damaged being rejected (SnapshotError, the loader falls back to the files)
+@pytest.fixture
+def source_dir(tmp_path):
+    # the test catalog plus part numbers only listed, only mapped, with records of other shapes and non-ASCII keys
+    directory = str(tmp_path / "catalog")
+    shutil.copytree(CATALOG_DIR, directory)
+    with open(os.path.join(directory, "part_numbers.txt"), "a") as fp:
+        fp.write("".join("listed{:03d}\n".format(i) for i in range(40)) + "été25\n")
+    with open(os.path.join(directory, "part_number_to_id.json"), "r") as fp:
+        part_number_to_id = json.load(fp)
+    part_number_to_id.update(("mapped{:03d}".format(i), {"id": 5000 + i, "part_number": "MAPPED-{}".format(i),
+                                                          "brand_id": i % 3}) for i in range(40))
+    part_number_to_id["raw1"] = {"id": "R1", "part_number": "RAW1", "brand_id": None, "extra": ["é"]}
+    part_number_to_id["été25"] = {"id": 9000, "part_number": "ÉTÉ25", "brand_id": 4}
+    with open(os.path.join(directory, "part_number_to_id.json"), "w") as fp:
+        json.dump(part_number_to_id, fp, ensure_ascii=False)
+    return directory
+
+
+@pytest.fixture
+def snapshot_path(source_dir, tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    build_catalog_snapshot(source_dir, path)
+    return path
+
+
+def test_round_trip(source_dir, snapshot_path):
+    snapshot = load_catalog_snapshot(snapshot_path)
+    sources = read_catalog_sources(source_dir)
+    assert snapshot.version == catalog_version(source_dir)
+    for name, excluded in [("brand_names", invalid_brand_names), ("brand_aliases", invalid_brand_names),
+                           ("part_numbers", invalid_part_numbers)]:
+        expected = set(sources[name]).difference(excluded)
+        assert set(getattr(snapshot, name)) == expected
+        assert all([key in getattr(snapshot, name) for key in expected])
+    for name in ["brand_name_to_id", "brand_alias_to_id", "part_number_to_id"]:
+        mapping = getattr(snapshot, name)
+        assert len(mapping) == len(sources[name])
+        for key, record in sources[name].items():
+            assert key in mapping and mapping[key] == record and mapping.get(key) == record
+        assert dict(mapping.items()) == sources[name]
+    # same catalog as the text/JSON fallback
+    files = load_catalog_files(source_dir)
+    assert files.version == snapshot.version
+    assert set(files.part_numbers) == set(snapshot.part_numbers)
+    for missing in ["", "not-a-part", "listed", "mapped", "zzzzzz", None]:
+        assert missing not in snapshot.part_numbers and snapshot.part_number_to_id.get(missing) is None
+        assert missing not in snapshot.brand_names and snapshot.brand_name_to_id.get(missing) is None
+
+
+def damaged(path, change):
+    with open(path, "rb") as fp:
+        data = bytearray(fp.read())
+    data = change(data)
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+def section_table_entry(data, name):
+    # offset into data of the section table entry of name
+    section_count = HEADER.unpack_from(bytes(data), 0)[2]
+    for index in range(section_count):
+        offset = HEADER.size + SECTION.size * index
+        if SECTION.unpack_from(bytes(data), offset)[0].rstrip(b"\0").decode() == name:
+            return offset
+    raise KeyError(name)
+
+
+def set_section_length(name, delta):
+    def change(data):
+        offset = section_table_entry(data, name)
+        section_name, section_offset, length = SECTION.unpack_from(bytes(data), offset)
+        SECTION.pack_into(data, offset, section_name, section_offset, length + delta)
+        return data
+    return change
+
+
+@pytest.mark.parametrize("change", [
+    lambda data: data[:0],
+    lambda data: data[:HEADER.size - 1],
+    lambda data: data[:HEADER.size + 10],
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:-1],
+    lambda data: data + b"\0" * 8,
+    lambda data: b"XXCATLOG" + data[8:],
+    lambda data: data[:8] + struct.pack("<I", 99) + data[12:],
+    set_section_length("part_numbers.keys", 8),
+    set_section_length("part_numbers.ids", -1),
+], ids=["empty", "header", "section table", "half", "last byte", "trailing bytes", "magic", "format", "overlap",
+        "misaligned"])
+def test_corrupt_snapshot_rejected(snapshot_path, source_dir, monkeypatch, change):
+    damaged(snapshot_path, change)
+    with pytest.raises(SnapshotError):
+        load_catalog_snapshot(snapshot_path)
+    monkeypatch.setattr(catalog_snapshot, "USE_CATALOG_SNAPSHOT", True)
+    monkeypatch.setattr(catalog_snapshot, "CATALOG_SHARED_DIR", None)
+    catalog = catalog_snapshot.load_catalog(snapshot_path, source_dir)
+    assert catalog.source == "files" and catalog.version == catalog_version(source_dir)
@@ -0,0 +1,85 @@
+import io
+import os
+import json
+import pytest
+from conftest import TEST_DATA_DIR
+import api
+
+
+# Chunked uploads (at least CHUNKED_UPLOAD_MIN_SIZE bytes) answer the JSON array written out as rows are matched:
+# same body as the upload matched whole, never held in memory at once
+with open(os.path.join(TEST_DATA_DIR, "catalog", "part_numbers.txt")) as fp:
+    PART_NUMBERS = [line.strip() for line in fp if line.strip()]
+BRANDS = ["AVX", "KEMET", "YAGEO", "VISHAY", "MURATA"]
+
+
+def upload_csv(rows):
+    lines = ["Manufacturer,MPN,Qty"]
+    for i in range(rows):
+        part_number = PART_NUMBERS[i % len(PART_NUMBERS)] if i % 4 else "X{}".format(i)
+        lines.append("{},{},{}".format(BRANDS[i % len(BRANDS)], part_number.upper(), 10 * (i + 1)))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def post(body, **kwargs):
+    return api.app.test_client().post("/api/get-match-from-file/",
+                                      data={"file": (io.BytesIO(body), "upload.csv")}, **kwargs)
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    monkeypatch.setattr(api, "CHUNKED_UPLOAD_MIN_SIZE", 1)
+    monkeypatch.setattr(api, "UPLOAD_CHUNK_ROWS", 50)
+
+
+def test_chunked_json_body_equals_whole_upload(monkeypatch):
+    body = upload_csv(400)
+    whole = post(body)
+    monkeypatch.setattr(api, "CHUNKED_UPLOAD_MIN_SIZE", 1)
+    monkeypatch.setattr(api, "UPLOAD_CHUNK_ROWS", 50)
+    streamed = post(body)
+    assert streamed.status_code == 200
+    assert streamed.mimetype == "application/json"
+    assert streamed.get_data() == whole.get_data()
+    assert any([record["part_number_id"] for record in json.loads(streamed.get_data())])
+
+
+def test_chunked_json_is_written_as_matched(chunked, monkeypatch):
+    produced = []
+
+    def iter_upload_matches(file, filename, catalog):
+        for i in range(100000):
+            produced.append(i)
+            yield {"row": i, "padding": "x" * 64}
+
+    monkeypatch.setattr(api, "iter_upload_matches", iter_upload_matches)
+    response = post(upload_csv(10), buffered=False)
+    blocks = iter(response.response)
+    assert next(blocks) == b'[{"padding":"' + b"x" * 64 + b'","row":0}'
+    next(blocks)
+    # one NDJSON_BUFFER_SIZE block of records matched, not the whole result
+    assert len(produced) < 2 * api.NDJSON_BUFFER_SIZE // 64
+    response.close()
+
+
+def test_chunked_json_failure_ends_the_array(chunked, monkeypatch):
+    def iter_upload_matches(file, filename, catalog):
+        yield {"row": 0}
+        yield {"row": 1}
+        raise ValueError("broken row")
+
+    monkeypatch.setattr(api, "iter_upload_matches", iter_upload_matches)
+    response = post(upload_csv(10))
+    assert response.status_code == 200
+    assert json.loads(response.get_data()) == [{"row": 0}, {"row": 1}, {"Error": "Can not process tables"}]
+
+
+def test_chunked_json_failure_on_first_record_answers_500(chunked, monkeypatch):
+    def iter_upload_matches(file, filename, catalog):
+        raise ValueError("broken table")
+        yield
+
+    monkeypatch.setattr(api, "iter_upload_matches", iter_upload_matches)
+    response = post(upload_csv(10))
+    assert response.status_code == 500
+    assert response.get_json() == {"Error": "Can not process tables"}
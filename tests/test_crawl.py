@@ -0,0 +1,194 @@
+import os
+import copy
+import json
+import time
+import shutil
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+from conftest import CATALOG_DIR
+from src import data_extractors, catalog_snapshot
+from src.api_helper import clean_part_number
+
+
+# Part number crawl/ sync against a local stub of the catalog API: PAGES pages of RECORDS records (server.pages),
+# pages after them answer {"code": 200, "data": []}, or a 500 once the catalog is over with failing_past_end.
+# failing_page always answers 500 (a crawl interrupted there).
+PAGES = 6
+RECORDS = 3
+CONCURRENCY = 2
+RECORDS_BY_PAGE = dict((page, [{"id": page * 10 + i, "part_number": "PN-{}/{}".format(page, i), "brand_id": i}
+                               for i in range(RECORDS)]) for page in range(1, PAGES + 1))
+
+
+class CatalogServer(object):
+    def __init__(self):
+        self.hits = Counter()
+        self.pages = copy.deepcopy(RECORDS_BY_PAGE)
+        self.failing_page = None
+        self.failing_past_end = False
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                page = int(parse_qs(urlparse(self.path).query)["page"][0])
+                with stub.lock:
+                    stub.hits[page] += 1
+                if page == stub.failing_page or (stub.failing_past_end and page > PAGES + 1):
+                    time.sleep(0.05)
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps({"code": 200, "data": stub.pages.get(page, [])}).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/parts?page={{i}}".format(self.server.server_port)
+
+
+@pytest.fixture
+def catalog_server(monkeypatch, tmp_path):
+    server = CatalogServer()
+    monkeypatch.setattr(data_extractors, "CATALOG_SOURCE_DIR", str(tmp_path))
+    monkeypatch.setattr(data_extractors, "PART_NUMBER_DETAIL_URL", server.url)
+    monkeypatch.setattr(data_extractors, "CRAWL_CONCURRENCY", CONCURRENCY)
+    monkeypatch.setattr(data_extractors, "CRAWL_RETRIES", 1)
+    monkeypatch.setattr(data_extractors, "CRAWL_RETRY_BACKOFF", 0.2)
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def crawled(directory):
+    # part number files named by the manifest
+    paths = catalog_snapshot.source_paths(str(directory))
+    with open(paths["part_numbers"], "r") as fp:
+        part_numbers = [line for line in fp.read().split("\n") if line]
+    with open(paths["part_number_to_id"], "r") as fp:
+        part_number_to_id = json.load(fp)
+    return part_numbers, part_number_to_id
+
+
+def loaded(directory):
+    # part numbers of the catalog loader (sources with the deltas applied), with the test catalog's brand files
+    for name in ["brand_names.txt", "brand_aliases.txt", "brand_name_to_id.json", "brand_alias_to_id.json"]:
+        if not (directory / name).exists():
+            shutil.copy(os.path.join(CATALOG_DIR, name), str(directory))
+    sources = catalog_snapshot.read_catalog_sources(str(directory))
+    return set(sources["part_numbers"]), sources["part_number_to_id"]
+
+
+def expected_catalog():
+    records = [record for page in sorted(RECORDS_BY_PAGE) for record in RECORDS_BY_PAGE[page]]
+    return [clean_part_number(record["part_number"]) for record in records], \
+        dict((clean_part_number(record["part_number"]), record) for record in records)
+
+
+def test_crawl(catalog_server, tmp_path):
+    assert data_extractors.crawl_catalog("part_numbers") == PAGES
+    assert crawled(tmp_path) == expected_catalog()
+    assert not (tmp_path / "part_numbers.checkpoint.json").exists()
+    assert len((tmp_path / "part_numbers.pages.txt").read_text().split("\n")) == PAGES + 1
+    # pages requested past the end of the catalog: the lookahead of the thread pool, nothing more
+    past_end = [page for page in catalog_server.hits if page > PAGES]
+    assert PAGES + 1 in past_end and max(past_end) < PAGES + 1 + 2 * CONCURRENCY
+
+
+def test_lookahead_past_end_is_not_retried(catalog_server, tmp_path):
+    catalog_server.failing_past_end = True
+    assert data_extractors.crawl_catalog("part_numbers") == PAGES
+    assert crawled(tmp_path) == expected_catalog()
+    assert all(count == 1 for page, count in catalog_server.hits.items() if page > PAGES)
+
+
+def test_resume_from_checkpoint(catalog_server, tmp_path):
+    catalog_server.failing_page = 4
+    with pytest.raises(Exception):
+        data_extractors.crawl_catalog("part_numbers")
+    assert json.loads((tmp_path / "part_numbers.checkpoint.json").read_text())["page"] == 3
+    # catalog files only replaced by a complete crawl
+    assert not (tmp_path / "catalog.manifest.json").exists()
+    assert not list(tmp_path.glob("part_numbers.0*"))
+
+    catalog_server.failing_page = None
+    catalog_server.hits.clear()
+    assert data_extractors.crawl_catalog("part_numbers") == PAGES
+    assert min(catalog_server.hits) == 4
+    assert crawled(tmp_path) == expected_catalog()
+    assert not (tmp_path / "part_numbers.checkpoint.json").exists()
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_crawl_publishes_a_new_generation(catalog_server, tmp_path):
+    data_extractors.crawl_catalog("part_numbers")
+    catalog_server.pages[2][0]["brand_id"] = 7
+    data_extractors.crawl_catalog("part_numbers")
+    manifest = catalog_snapshot.read_manifest(str(tmp_path))
+    assert manifest["generation"] == 2
+    assert manifest["sources"]["part_numbers"] == "part_numbers.000002.txt"
+    assert manifest["sources"]["part_number_to_id"] == "part_number_to_id.000002.json"
+    assert manifest["sources"]["brand_names"] == "brand_names.txt"   # not part of this crawl
+    # files of the first generation are removed once the manifest names the new ones
+    assert sorted(path.name for path in tmp_path.glob("part_number*")) == \
+        ["part_number_to_id.000002.json", "part_numbers.000002.txt", "part_numbers.pages.txt"]
+    assert crawled(tmp_path)[1][clean_part_number("PN-2/0")]["brand_id"] == 7
+
+
+def test_sync_writes_delta_and_crawl_folds_it_in(catalog_server, tmp_path):
+    data_extractors.crawl_catalog("part_numbers")
+    catalog_server.pages[PAGES].append({"id": PAGES * 10 + RECORDS, "part_number": "PN-NEW", "brand_id": 1})
+    assert data_extractors.sync_catalog("part_numbers") == 1
+    manifest = catalog_snapshot.read_manifest(str(tmp_path))
+    assert manifest["deltas"] == ["part_numbers.delta.000001.jsonl"]
+    part_numbers, part_number_to_id = loaded(tmp_path)
+    assert clean_part_number("PN-NEW") in part_numbers
+    assert part_number_to_id[clean_part_number("PN-NEW")]["id"] == PAGES * 10 + RECORDS
+    assert data_extractors.sync_catalog("part_numbers") == 0   # nothing changed since
+
+    data_extractors.crawl_catalog("part_numbers")
+    assert catalog_snapshot.read_manifest(str(tmp_path))["deltas"] == []
+    assert not list(tmp_path.glob("*.delta.*"))
+    assert loaded(tmp_path)[0] == part_numbers
+
+
+def test_sync_is_append_only(catalog_server, tmp_path, capsys):
+    data_extractors.crawl_catalog("part_numbers")
+    removed = catalog_server.pages.pop(PAGES)
+    assert data_extractors.sync_catalog("part_numbers") == 0
+    assert "1 pages of part_numbers after page {} are gone".format(PAGES - 1) in capsys.readouterr().out
+    assert PAGES not in [int(line.split(" ")[0]) for line in
+                         (tmp_path / "part_numbers.pages.txt").read_text().split("\n") if line]
+    # records of the removed page stay until a full crawl
+    part_numbers = loaded(tmp_path)[0]
+    assert all([clean_part_number(record["part_number"]) in part_numbers for record in removed])
+    data_extractors.crawl_catalog("part_numbers")
+    part_numbers = loaded(tmp_path)[0]
+    assert not any([clean_part_number(record["part_number"]) in part_numbers for record in removed])
+
+
+def test_catalog_load_waits_for_running_update(catalog_server, tmp_path, monkeypatch):
+    data_extractors.crawl_catalog("part_numbers")
+    loaded(tmp_path)
+    monkeypatch.setattr(catalog_snapshot, "USE_CATALOG_SNAPSHOT", False)
+    monkeypatch.setattr(catalog_snapshot, "CATALOG_SHARED_DIR", None)
+    catalogs = []
+    with data_extractors.catalog_update_lock():
+        thread = threading.Thread(target=lambda: catalogs.append(catalog_snapshot.load_catalog(
+            str(tmp_path / "catalog.snapshot"), str(tmp_path))), daemon=True)
+        thread.start()
+        thread.join(0.3)
+        assert thread.is_alive() and not catalogs   # no snapshot to use: waits for the update
+    thread.join(5)
+    assert catalogs and catalogs[0].source == "files"
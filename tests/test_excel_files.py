@@ -0,0 +1,141 @@
+import io
+import os
+import sys
+import glob
+import json
+import shutil
+import tempfile
+import subprocess
+import pytest
+import pandas as pd
+from conftest import ROOT, TEST_DATA_DIR, CATALOG_DIR
+import api
+from src import layout_cache
+from src.api_helper import fix_data_frame, detect_columns
+from src.table_profile import TableProfile
+from src.workbook import read_sheet_tables
+
+
+# Regression test over the sample workbooks against the baseline implementation (commit ba54cc4): the columns it
+# detected and the records its upload endpoint answered, on the test catalog (tests/data/excel_expected.json).
+# Records now also name their "sheet"/ "table_index" (every sheet and stacked table is matched), those fields are
+# not compared. Intended changes since the baseline are listed under "changed" with the reason, they replace the
+# baseline records of their file.
+# regenerate the baseline records: git worktree add /tmp/baseline ba54cc4
+#                                  python tests/test_excel_files.py /tmp/baseline
+EXCEL_FILES = sorted(glob.glob(os.path.join(ROOT, "data", "excel", "*")))
+EXPECTED_PATH = os.path.join(TEST_DATA_DIR, "excel_expected.json")
+ADDED_FIELDS = ("sheet", "table_index")
+
+# run in a copy of the baseline checkout with the test catalog in data/outputs: pd.read_excel of the first sheet,
+# the column detection sequence of its process_from_excel, then its endpoint
+BASELINE_SCRIPT = r'''
+import io, os, sys, json
+import api
+from api import *
+results = {}
+client = api.app.test_client()
+for path in sys.argv[1:]:
+    df, table_header = fix_data_frame(pd.read_excel(path), BRAND_NAMES, BRAND_ALIASES, PART_NUMBERS)
+    brand_name_column = get_brand_name_column(df, table_header, BRAND_NAMES, BRAND_ALIASES)
+    quantity_column, suggested_quantity_column = get_quantity_column(df, table_header)
+    part_number_column = get_part_number_column(df, table_header, brand_name_column, quantity_column, PART_NUMBERS)
+    if brand_name_column is False or part_number_column is False:
+        brand_name_column, part_number_column = check_existing_patterns(df, table_header, brand_name_column,
+                                                                        part_number_column, BRAND_NAMES,
+                                                                        BRAND_ALIASES, PART_NUMBERS)
+    if brand_name_column is False and part_number_column is False:
+        brand_name_column, part_number_column = try_search_with_splitter(df, table_header, BRAND_NAMES,
+                                                                         BRAND_ALIASES, PART_NUMBERS)
+    if brand_name_column is False or part_number_column is False:
+        brand_name_column, part_number_column, suggested_quantity_column, table_header, df = \
+            try_search_with_keywords(df, table_header, brand_name_column, part_number_column,
+                                     suggested_quantity_column)
+    with open(path, "rb") as fp:
+        response = client.post("/api/get-match-from-file/",
+                               data={"file": (io.BytesIO(fp.read()), os.path.basename(path))})
+    results[os.path.basename(path)] = {
+        "columns": [brand_name_column, part_number_column, quantity_column, suggested_quantity_column],
+        "records": [response.status_code, response.get_json()]}
+print(json.dumps(results, default=str))
+'''
+
+
+def as_json(value):
+    # json round trip: numpy scalars/ column names as the endpoint would write them, NaN as NaN
+    return json.loads(json.dumps(value, default=str))
+
+
+def detected_columns(path):
+    # [brand, part number, quantity, suggested quantity column] of every table
+    catalog = api.current_catalog()
+    tables = []
+    with pd.ExcelFile(path) as book:
+        for sheet in book.sheet_names:
+            for _, table_index, df in read_sheet_tables(book, sheet, catalog.brand_names, catalog.brand_aliases,
+                                                        catalog.part_numbers):
+                df, table_header = fix_data_frame(df, catalog.brand_names, catalog.brand_aliases,
+                                                  catalog.part_numbers)
+                columns = detect_columns(TableProfile(df, table_header), catalog.brand_names,
+                                         catalog.brand_aliases, catalog.part_numbers)
+                tables.append(list(columns[:4]))
+    return as_json(tables)
+
+
+def upload_records(path):
+    # status and JSON body of the upload endpoint, without the fields the baseline did not have
+    with open(path, "rb") as fp:
+        data = fp.read()
+    response = api.app.test_client().post("/api/get-match-from-file/",
+                                          data={"file": (io.BytesIO(data), os.path.basename(path))})
+    body = as_json(response.get_json())
+    if isinstance(body, list):
+        body = [dict((key, value) for key, value in record.items() if key not in ADDED_FIELDS) for record in body]
+    return [response.status_code, body]
+
+
+@pytest.fixture(autouse=True)
+def empty_layout_cache():
+    # every file is detected on its own, not through layouts learned from the files before it
+    with layout_cache.layout_cache_lock:
+        layout_cache.layout_cache.clear()
+
+
+@pytest.fixture(scope="module")
+def expected():
+    with open(EXPECTED_PATH, "r") as fp:
+        return json.load(fp)
+
+
+@pytest.mark.parametrize("path", EXCEL_FILES, ids=os.path.basename)
+def test_excel_file(path, expected):
+    name = os.path.basename(path)
+    baseline = expected["baseline"][name]
+    # the baseline read the first sheet as one table, the sample workbooks hold one table each
+    assert json.dumps(detected_columns(path)) == json.dumps([baseline["columns"]])
+    records = expected["changed"][name]["records"] if name in expected["changed"] else baseline["records"]
+    # compared as JSON text: NaN cells are not equal to themselves
+    assert json.dumps(upload_records(path)) == json.dumps(records)
+
+
+def baseline_results(checkout):
+    # columns and endpoint records of the baseline checkout on the test catalog
+    work = tempfile.mkdtemp(prefix="baseline_")
+    try:
+        shutil.copytree(checkout, os.path.join(work, "app"), ignore=shutil.ignore_patterns(".git", "outputs"))
+        shutil.copytree(CATALOG_DIR, os.path.join(work, "app", "data", "outputs"))
+        output = subprocess.check_output([sys.executable, "-c", BASELINE_SCRIPT] + EXCEL_FILES,
+                                         cwd=os.path.join(work, "app"), env=dict(os.environ, PYTHONPATH="."))
+        return json.loads(output.decode("utf-8").strip().split("\n")[-1])
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    with open(EXPECTED_PATH, "r") as fp:
+        expected = json.load(fp)
+    expected["baseline"] = baseline_results(os.path.abspath(sys.argv[1]))
+    with open(EXPECTED_PATH, "w") as fp:
+        json.dump(expected, fp, indent=1, ensure_ascii=False)
+    print("Wrote the baseline results of {} files to {}".format(len(expected["baseline"]), EXPECTED_PATH),
+          file=sys.stderr)
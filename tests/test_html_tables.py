@@ -0,0 +1,90 @@
+import io
+import os
+import glob
+import warnings
+import pytest
+import pandas as pd
+from conftest import ROOT
+from src.html_tables import read_html_tables
+
+
+# The extractor must give the DataFrames of pd.read_html(encoding="utf-8") for the data tables of a page, and drop
+# only the layout, hidden and near empty tables around them
+DATA_TABLES = {
+    "thead": '<table><thead><tr><th>MPN</th><th>Brand</th><th>Qty</th></tr></thead><tbody>'
+             '<tr><td>GRM155R71C104KA88D</td><td>Murata</td><td>10,000</td></tr>'
+             '<tr><td>RC0402FR-0710KL</td><td>Yageo</td><td>2,500</td></tr></tbody>'
+             '<tfoot><tr><td>total</td><td></td><td>12,500</td></tr></tfoot></table>',
+    "th rows": '<table><tr><th colspan="2">Part</th><th>Qty</th></tr><tr><th>MPN</th><th>Brand</th><th></th></tr>'
+               '<tr><td>LM358DR</td><td>TI</td><td>300</td></tr><tr><td>NE555P</td><td>TI</td><td>1.5k</td></tr></table>',
+    "td header": '<table><tr><td>MPN</td><td>Qty</td></tr><tr><td>BAV99</td><td>3000</td></tr>'
+                 '<tr><td>BC847</td><td>-</td></tr></table>',
+    "rowspan": '<table><tr><th>Brand</th><th>MPN</th><th>Qty</th></tr>'
+               '<tr><td rowspan="2"><span style="font-family:Calibri">Vishay</span></td><td>CRCW0603</td><td>100</td>'
+               '</tr><tr><td>CRCW0805</td><td>200</td></tr><tr><td>Bourns</td><td colspan="2">SRR1260</td></tr></table>',
+    "br and spans": '<table><tr><td><p class=MsoNormal><span lang=EN-US>MPN<o:p></o:p></span></p></td><td>Note</td>'
+                    '</tr><tr><td>AO3400A</td><td>urgent<br>before 04/20</td></tr>'
+                    '<tr><td>  SI2302  \n CDS </td><td>1,000 pcs</td></tr></table>',
+    "hidden cells": '<table><tr><th>MPN</th><th>Qty</th></tr><tr><td>TPS5430</td><td>50</td></tr>'
+                    '<tr style="display: none"><td>hidden</td><td>1</td></tr>'
+                    '<tr><td>LM2596<span style="display:none">x</span></td><td>25</td></tr></table>',
+    "ragged": '<table><tr><td>a</td><td>b</td><td>c</td></tr><tr><td>1</td></tr><tr><td>2</td><td>3</td></tr></table>',
+}
+SIGNATURE = ('<table><tr><td><img src="logo.png"></td><td>John Doe<br>Purchasing</td></tr>'
+             '<tr><td colspan="2">ACME Electronics Ltd.</td></tr></table>')
+DROPPED_TABLES = ('<table><tr><td></td></tr></table><table><tr><td>one cell</td></tr></table>'
+                  '<table style="display:none"><tr><td>a</td><td>b</td></tr></table>')
+
+
+def page_of(*parts):
+    return ("<html><head><meta charset='utf-8'><style>td{margin:0}</style></head><body><p>Hi,</p>" + "".join(parts) +
+            "<div><p>" + "quoted text " * 50 + "</p></div></body></html>").encode("utf-8")
+
+
+def layout(*tables):
+    # outlook like layout table, each table in a row of its own
+    return "<table width='100%'>{}</table>".format("".join("<tr><td>{}</td></tr>".format(table) for table in tables))
+
+
+def pandas_tables(page):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.read_html(io.BytesIO(page), encoding="utf-8")
+
+
+def assert_same_tables(expected, got):
+    assert len(got) == len(expected)
+    for expected_df, df in zip(expected, got):
+        pd.testing.assert_frame_equal(df, expected_df)
+
+
+@pytest.mark.parametrize("name", sorted(DATA_TABLES))
+def test_data_table(name):
+    page = page_of(DATA_TABLES[name])
+    assert_same_tables(pandas_tables(page), read_html_tables(page))
+
+
+def test_layout_and_small_tables_dropped():
+    tables = [DATA_TABLES[name] for name in sorted(DATA_TABLES)]
+    expected = pandas_tables(page_of(*tables + [SIGNATURE]))
+    page = page_of(DROPPED_TABLES, layout(*tables[:3]), DROPPED_TABLES, layout(layout(*tables[3:]), SIGNATURE))
+    assert len(pandas_tables(page)) > len(expected)
+    assert_same_tables(expected, read_html_tables(page))
+
+
+def test_sample_workbooks_as_html():
+    # the sample workbooks as pasted into a message, one page with all of them
+    frames = [pd.read_excel(path) for path in sorted(glob.glob(os.path.join(ROOT, "data", "excel", "*")))]
+    tables = [df.to_html(index=False, na_rep="") for df in frames]
+    tables += [df.to_html(index=False, header=False) for df in frames[:3]]
+    page = page_of(layout(*tables), SIGNATURE)
+    got = read_html_tables(page)
+    assert len(got) == len(tables) + 1
+    assert_same_tables(pandas_tables(page_of(*tables + [SIGNATURE])), got)
+
+
+def test_page_without_tables():
+    with pytest.raises(ValueError):
+        read_html_tables(page_of("<p>no tables</p>"))
+    with pytest.raises(ValueError):
+        read_html_tables(page_of("<table><tr><td>\n</td></tr></table>"))
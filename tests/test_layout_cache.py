@@ -0,0 +1,63 @@
+import io
+import json
+import pytest
+import pandas as pd
+import conftest
+import api
+from src import layout_cache
+
+
+# Tables with the same header but brand and part number mixed in one column in different ways: the layout
+# learned on the first one must not be re-used on the second
+BRANDS = ["AVX", "KEMET", "YAGEO", "VISHAY", "AVX", "KEMET", "YAGEO", "VISHAY"]
+PART_NUMBERS = ["C0805C106K9PAC", "GRM21BR60J106KE19L", "B7106KG-T", "GRM219R60J106KE19D", "CC0402JRNPO9BN220",
+                "GMC04CG220J25NT-LF", "C1005NP0220JGT", "C0402C220J5GAC"]
+PATTERNS = {"b#p": "{b}#{p}", "p#b": "{p}#{b}", "b(p": "{b}({p})", "b/p": "{b}/{p}"}
+
+
+def upload(pattern):
+    df = pd.DataFrame({"Item": range(1, len(BRANDS) + 1),
+                       "Description": [PATTERNS[pattern].format(b=b, p=p) for b, p in zip(BRANDS, PART_NUMBERS)],
+                       "Qty": [100 * (i + 1) for i in range(len(BRANDS))]})
+    response = api.app.test_client().post("/api/get-match-from-file/", data={
+        "file": (io.BytesIO(df.to_csv(index=False).encode("utf-8")), "{}.csv".format(pattern.replace("/", "_")))})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def clear_layout_cache():
+    with layout_cache.layout_cache_lock:
+        layout_cache.layout_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def empty_layout_cache():
+    clear_layout_cache()
+    yield
+    clear_layout_cache()
+
+
+@pytest.mark.parametrize("first, second", [("b#p", "p#b"), ("p#b", "b#p"), ("b#p", "b(p"), ("b#p", "b/p")])
+def test_mixed_column_layout_not_reused_for_other_pattern(first, second):
+    fresh = upload(second)
+    assert any(record["part_number_id"] for record in fresh)
+    clear_layout_cache()
+    upload(first)
+    assert len(layout_cache.layout_cache) == 1
+    assert upload(second) == fresh
+
+
+def test_mixed_column_layout_reused_for_same_pattern():
+    fresh = upload("p#b")
+    hits = layout_cache.layout_cache_stats["hits"]
+    assert upload("p#b") == fresh
+    assert layout_cache.layout_cache_stats["hits"] == hits + 1
+
+
+def test_catalog_version_change_drops_layouts():
+    upload("b#p")
+    layout_cache.set_layout_catalog_version(api.current_catalog().version)
+    assert len(layout_cache.layout_cache) == 1
+    layout_cache.set_layout_catalog_version("other")
+    assert len(layout_cache.layout_cache) == 0
+    layout_cache.set_layout_catalog_version(api.current_catalog().version)
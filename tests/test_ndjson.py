@@ -0,0 +1,67 @@
+import io
+import json
+import pytest
+import api
+
+
+# NDJSON answers (Accept: application/x-ndjson or ?stream=1): one JSON record per line, the records of the JSON
+# array answer. A failure after the first record becomes the last line, a failure before it answers 500
+UPLOAD = b"Manufacturer,MPN,Qty\nMurata,GRM033R60J104KE19D,100\nYageo,MG0220,2k\nAVX,NOT-A-PART,5\n"
+NDJSON = "application/x-ndjson"
+
+
+def post(url="/api/get-match-from-file/", **kwargs):
+    return api.app.test_client().post(url, data={"file": (io.BytesIO(UPLOAD), "upload.csv")}, **kwargs)
+
+
+def lines_of(response):
+    body = response.get_data(as_text=True)
+    assert body.endswith("\n")
+    return [json.loads(line) for line in body.split("\n")[:-1]]
+
+
+@pytest.mark.parametrize("kwargs", [{"headers": {"Accept": NDJSON}}, {"url": "/api/get-match-from-file/?stream=1"}],
+                         ids=["accept", "stream"])
+def test_ndjson_lines_are_the_json_records(kwargs):
+    records = post().get_json()
+    response = post(**kwargs)
+    assert response.status_code == 200
+    assert response.mimetype == NDJSON
+    assert "Accept" in response.vary
+    lines = lines_of(response)
+    assert all([isinstance(line, dict) for line in lines])
+    assert lines == records and len(lines) == 3
+
+
+def test_json_stays_the_default():
+    response = post(headers={"Accept": "application/json, */*"})
+    assert response.mimetype == "application/json"
+    assert isinstance(response.get_json(), list)
+
+
+def test_failure_mid_stream_is_the_last_line(monkeypatch):
+    produced = []
+
+    def iter_file_matches(stream, filename, catalog):
+        for i in range(3):
+            produced.append(i)
+            yield {"row": i}
+        raise ValueError("broken table")
+
+    monkeypatch.setattr(api, "iter_file_matches", iter_file_matches)
+    response = post(headers={"Accept": NDJSON}, buffered=False)
+    assert response.status_code == 200   # the status line was out before the failure
+    assert response.mimetype == NDJSON
+    assert produced == [0]   # only the first record is matched before the response starts
+    assert lines_of(response) == [{"row": 0}, {"row": 1}, {"row": 2}, {"Error": "Can not process tables"}]
+
+
+def test_failure_on_first_record_answers_500(monkeypatch):
+    def iter_file_matches(stream, filename, catalog):
+        raise ValueError("broken table")
+        yield
+
+    monkeypatch.setattr(api, "iter_file_matches", iter_file_matches)
+    response = post(headers={"Accept": NDJSON})
+    assert response.status_code == 500
+    assert response.get_json() == {"Error": "Can not process tables"}
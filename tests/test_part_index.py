@@ -0,0 +1,74 @@
+import pytest
+from src.part_index import build_part_index, PartIndex, LISTED, HAS_RECORD
+
+
+# Part number index lookups around block boundaries: first/ last key of a block, keys between blocks, partial
+# and full blocks, prefixes longer than the 255 bytes a block can hold
+def index_of(keys, block_size, records=None):
+    records = dict((key, {"id": i, "part_number": key.upper(), "brand_id": i % 7}) for i, key in enumerate(keys)) \
+        if records is None else records
+    return PartIndex(build_part_index(keys, records, block_size=block_size))
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 16])
+@pytest.mark.parametrize("count", [0, 1, 15, 16, 17, 32, 33, 100])
+def test_every_key_found_at_its_position(block_size, count):
+    keys = sorted("pn{:04d}".format(i * 3) for i in range(count))
+    index = index_of(keys, block_size)
+    assert index.key_count == count
+    assert list(index.keys()) == list(enumerate(keys))
+    for position, key in enumerate(keys):
+        assert index.find(key) == position
+        assert index.record(position, key) == {"id": position, "part_number": key.upper(), "brand_id": position % 7}
+    # between every two keys, before the first and after the last
+    for i in range(count * 3 + 2):
+        key = "pn{:04d}".format(i)
+        if key not in keys:
+            assert index.find(key) == -1
+    for key in ["", "a", "pn", "pn0", "pz", "zzz", "pn0000x"]:
+        assert index.find(key) == (keys.index(key) if key in keys else -1)
+
+
+def test_keys_that_are_prefixes_of_each_other():
+    keys = ["ab", "abc", "abcd", "abcde", "abd", "b", "ba", "bab"]
+    for block_size in [2, 3, 16]:
+        index = index_of(keys, block_size)
+        assert [index.find(key) for key in keys] == list(range(len(keys)))
+        assert [index.find(key) for key in ["a", "abcdef", "abe", "bb", "c"]] == [-1] * 5
+
+
+def test_block_prefix_longer_than_255_bytes():
+    prefix = "x" * 300
+    keys = sorted(prefix + suffix for suffix in ["a", "b", "c", "d", "e"])
+    index = index_of(keys, 16)
+    assert [index.find(key) for key in keys] == list(range(len(keys)))
+    assert index.find(prefix) == -1
+    assert index.find(prefix[:255] + "a") == -1
+
+
+def test_non_ascii_keys_sorted_by_bytes():
+    keys = ["abc", "été", "étz", "z", "中文"]
+    index = index_of(keys, 2)
+    found = dict((key, index.find(key)) for key in keys)
+    assert sorted(found.values()) == list(range(len(keys)))
+    assert [key for _, key in index.keys()] == sorted(keys, key=lambda key: key.encode("utf-8"))
+
+
+def test_lookup_of_other_values():
+    index = index_of(["a1", "b2"], 16)
+    assert index.find(None) == -1
+    assert index.find(12) == -1
+    assert index.find("a1\0") == -1
+    with pytest.raises(ValueError):
+        build_part_index(["a\0b"], {})
+
+
+def test_listed_and_recorded_keys():
+    # keys only listed, only with a record, with a record of another shape (kept as JSON)
+    records = {"b": {"id": 2, "part_number": "b", "brand_id": 1}, "c": {"id": "3", "extra": [1]},
+               "d": {"id": 4, "part_number": "D-1", "brand_id": 2}}
+    index = index_of(["a", "b"], 2, records)
+    flags = dict((key, index.flags[position] & (LISTED | HAS_RECORD)) for position, key in index.keys())
+    assert flags == {"a": LISTED, "b": LISTED | HAS_RECORD, "c": HAS_RECORD, "d": HAS_RECORD}
+    for key, record in records.items():
+        assert index.record(index.find(key), key) == record
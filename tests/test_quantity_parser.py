@@ -0,0 +1,52 @@
+import random
+import pytest
+import numpy as np
+import pandas as pd
+import conftest
+from src.quantity_parser import string_quantity_to_integer, is_integer, string_quantities_to_integers, integer_mask
+
+
+# The column versions must give the result of the scalar helpers cell by cell (same value and type: python int
+# or False), alone and mixed into columns of other types
+TRICKY_CELLS = ["1500", "1.5k", "2k", "2K", "1,500", "-20", "300 pcs", "12 pieces", "k", "1kk", "k1", "-1.5k", "1.2.3",
+                "1e5", ".5", "5.", "-", "-.5", "--5", "9" * 400, "9" * 400 + "k", "1" * 14 + "k", "0" * 13 + "1k", "9" * 17,
+                "1,5k", "", " ", "nan", "inf", "None", "True", "0", "00", "-0", "- 5", "5 -", "٣", "²", "1_000",
+                "1.5.k", "1 k", "k.5", ".k", "12345678901234567890", "qty 5", "\n7\n",
+                float("nan"), None, True, False, 0, 0.0, 2.5, -3.7, 1e20, float("inf"), -float("inf"), 10 ** 400, 2 ** 60,
+                np.float64(1e20), np.float64("nan"), np.float64(12.5), np.int64(5), np.float32(1.1), np.bool_(True),
+                np.str_("2k"), pd.Timestamp("2020-01-01"), pd.NaT]
+COLUMNS = [
+    TRICKY_CELLS,
+    [cell for cell in TRICKY_CELLS if isinstance(cell, str)],
+    np.array([1.5, np.nan, 1e20, -3.7, 1e16, 123456789.123]),
+    np.array([1, -5, 0, 10 ** 18]),
+    np.array([True, False]),
+    np.array(["2k", "1,5", "300 pcs"]),
+    [1, 2, 10 ** 30],
+    [np.int64(1), 2, -3],
+]
+
+
+def same(expected, got):
+    return type(expected) is type(got) and expected == got
+
+
+@pytest.mark.parametrize("cell", TRICKY_CELLS, ids=repr)
+def test_single_cell(cell):
+    assert same(string_quantity_to_integer(cell), string_quantities_to_integers([cell])[0])
+    assert bool(is_integer(cell)) == bool(integer_mask([cell])[0])
+
+
+@pytest.mark.parametrize("values", COLUMNS, ids=lambda values: "{}x{}".format(type(values).__name__, len(values)))
+def test_column(values):
+    got = string_quantities_to_integers(values)
+    assert all(same(string_quantity_to_integer(cell), value) for cell, value in zip(values, got))
+    assert [bool(is_integer(cell)) for cell in values] == list(integer_mask(values))
+
+
+def test_random_strings():
+    random.seed(0)
+    alphabet = list("0123456789kK.,-- pcsPIECESqty+e_") + ["pieces", "piece", "1,000", "inf", "nan", "1e5"]
+    cells = ["".join(random.choice(alphabet) for _ in range(random.randint(0, 10))) for _ in range(5000)]
+    assert string_quantities_to_integers(cells) == [string_quantity_to_integer(cell) for cell in cells]
+    assert list(integer_mask(cells)) == [bool(is_integer(cell)) for cell in cells]
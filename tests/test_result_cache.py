@@ -0,0 +1,123 @@
+import io
+import os
+import pytest
+from conftest import CATALOG_DIR
+import api
+from src import result_cache, catalog_holder
+
+
+# Result cache through the upload endpoint: ETag/ If-None-Match, keys of another catalog version, the disk tier
+# and results with table error entries (never kept)
+UPLOAD = b"Manufacturer,MPN,Qty\nMurata,GRM033R60J104KE19D,1500\nAVX,MG0220,20\n"
+
+
+def post(body=UPLOAD, **kwargs):
+    return api.app.test_client().post("/api/get-match-from-file/", data={"file": (io.BytesIO(body), "upload.csv")},
+                                      **kwargs)
+
+
+def clear_memory():
+    with result_cache.result_cache_lock:
+        result_cache.result_cache.clear()
+        result_cache.result_cache_state["size"] = 0
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_SIZE", 1 << 20)
+    clear_memory()
+    yield
+    clear_memory()
+
+
+@pytest.fixture
+def disk(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setitem(result_cache.result_cache_state, "disk_size", None)
+    return tmp_path
+
+
+def test_repeated_upload_is_answered_from_memory():
+    first = post()
+    assert first.status_code == 200 and first.headers["ETag"]
+    hits = result_cache.result_cache_stats["memory_hits"]
+    second = post()
+    assert result_cache.result_cache_stats["memory_hits"] == hits + 1
+    assert second.get_data() == first.get_data()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert "Accept" in second.headers["Vary"]
+
+
+def test_if_none_match_answers_304():
+    etag = post().headers["ETag"]
+    response = post(headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == etag
+    # the NDJSON body is another representation with an ETag of its own
+    streamed = post(headers={"If-None-Match": etag, "Accept": "application/x-ndjson"})
+    assert streamed.status_code == 200
+    assert streamed.headers["ETag"] != etag
+    assert post(headers={"If-None-Match": streamed.headers["ETag"],
+                         "Accept": "application/x-ndjson"}).status_code == 304
+
+
+def test_key_changes_with_catalog_version(other_catalog):
+    assert result_cache.result_key("a" * 40, "upload", ".csv", UPLOAD) != \
+        result_cache.result_key("b" * 40, "upload", ".csv", UPLOAD)
+    response = post()
+    assert response.headers["X-Catalog-Version"] == other_catalog.version
+    assert response.get_etag()[0].startswith(other_catalog.version[:12] + "-")
+    etag = response.headers["ETag"]
+
+    # back on the test catalog: the ETag of the other version is stale, its results are dropped
+    catalog_holder.CATALOG_SOURCE_DIR = CATALOG_DIR
+    assert catalog_holder.reload_catalog(force=True)
+    assert len(result_cache.result_cache) == 0
+    response = post(headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_result_of_another_version_is_not_stored():
+    key = result_cache.result_key("0" * 40, "upload", ".csv", UPLOAD)
+    result_cache.store_result(key, b"[]\n")
+    assert result_cache.get_result(key) is None
+
+
+def test_disk_tier_serves_after_memory_is_cleared(disk):
+    first = post()
+    files = os.listdir(str(disk))
+    assert files == [first.get_etag()[0] + ".json"]
+    clear_memory()
+    hits = result_cache.result_cache_stats["disk_hits"]
+    second = post()
+    assert result_cache.result_cache_stats["disk_hits"] == hits + 1
+    assert second.get_data() == first.get_data()
+
+
+def test_disk_tier_evicts_least_recently_used(disk, monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DISK_SIZE", 1000)
+    version = result_cache.result_cache_state["version"]
+    keys = [result_cache.result_key(version, "upload", ".csv", str(i).encode()) for i in range(6)]
+    for index, key in enumerate(keys):
+        result_cache.store_result(key, b"x" * 300)
+        os.utime(result_cache._disk_path(key), (index, index))   # written one after the other
+    remaining = sorted(name[:-len(".json")] for name in os.listdir(str(disk)))
+    assert remaining == sorted(keys[-3:])
+    assert result_cache.result_cache_stats["disk_evictions"] >= 3
+
+
+@pytest.mark.parametrize("accept", ["application/json", "application/x-ndjson"])
+def test_result_with_error_entries_is_not_cached(monkeypatch, disk, accept):
+    def iter_file_matches(stream, filename, catalog):
+        yield {"brand_name": "Murata", "part_number": "GRM033R60J104KE19D"}
+        yield {"sheet": "Sheet2", "table_index": 0, "Error": "Can not process table"}
+
+    monkeypatch.setattr(api, "iter_file_matches", iter_file_matches)
+    response = post(headers={"Accept": accept})
+    assert response.status_code == 200
+    assert b"Can not process table" in response.get_data()
+    assert len(result_cache.result_cache) == 0
+    assert os.listdir(str(disk)) == []
+    assert post(headers={"If-None-Match": response.headers["ETag"], "Accept": accept}).status_code == 200
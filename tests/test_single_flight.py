@@ -0,0 +1,100 @@
+import io
+import time
+import threading
+import conftest
+import api
+from src import single_flight as sf
+
+
+# Concurrent identical work runs once: callers arriving while it is in flight wait for the leader and get its
+# result or its exception, the flight is gone once it is done
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def start(target, *args):
+    results = []
+
+    def run():
+        try:
+            results.append(("result", target(*args)))
+        except Exception as e:
+            results.append(("error", e))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, results
+
+
+def waiting_flight(key, kind, count):
+    # the flight of key exists and count callers have joined it as followers
+    return key in sf.flights and sf.single_flight_stats[kind + "_coalesced"] >= count
+
+
+def test_concurrent_calls_compute_once():
+    release, calls = threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "body"
+
+    coalesced = sf.single_flight_stats["test_coalesced"]
+    threads = [start(sf.single_flight, "k1", compute, "test") for _ in range(3)]
+    wait_until(lambda: waiting_flight("k1", "test", coalesced + 2))
+    release.set()
+    for thread, _ in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert [results for _, results in threads] == [[("result", "body")]] * 3
+    assert "k1" not in sf.flights
+
+
+def test_leader_exception_reaches_waiters_and_clears_flight():
+    release, error = threading.Event(), ValueError("upstream down")
+
+    def compute():
+        release.wait(5)
+        raise error
+
+    coalesced = sf.single_flight_stats["test_coalesced"]
+    threads = [start(sf.single_flight, "k2", compute, "test") for _ in range(3)]
+    wait_until(lambda: waiting_flight("k2", "test", coalesced + 2))
+    release.set()
+    for thread, _ in threads:
+        thread.join(5)
+    assert [results for _, results in threads] == [[("error", error)]] * 3
+    assert "k2" not in sf.flights
+    # the next call is a new flight
+    assert sf.single_flight("k2", lambda: "again", "test") == "again"
+
+
+def test_concurrent_identical_uploads_match_once(monkeypatch):
+    release, calls = threading.Event(), []
+
+    def iter_file_matches(stream, filename, catalog):
+        calls.append(1)
+        release.wait(5)
+        yield {"part_number": "MG0220"}
+
+    monkeypatch.setattr(api, "iter_file_matches", iter_file_matches)
+
+    def post():
+        response = api.app.test_client().post("/api/get-match-from-file/", data={
+            "file": (io.BytesIO(b"Manufacturer,MPN,Qty\nAVX,MG0220,20\n"), "upload.csv")})
+        return response.status_code, response.get_data(), response.headers.get("ETag")
+
+    coalesced = sf.single_flight_stats["match_coalesced"]
+    threads = [start(post) for _ in range(2)]
+    wait_until(lambda: sf.single_flight_stats["match_coalesced"] >= coalesced + 1 and sf.flights)
+    release.set()
+    for thread, _ in threads:
+        thread.join(5)
+    assert calls == [1]
+    first, second = [results[0] for _, results in threads]
+    assert first == second
+    assert first[1][:2] == (200, b'[{"part_number":"MG0220"}]\n')
+    assert not sf.flights
@@ -0,0 +1,63 @@
+import os
+import pytest
+import api
+from src import table_pool
+from src.catalog_snapshot import build_catalog_snapshot
+
+
+# Table pool workers map a snapshot of the catalog version of their jobs, built once by the server process when
+# there is none (the test catalog is read from text/JSON files), never the text/JSON files themselves
+def catalog_kind_job(argument, catalog):
+    # in a worker: the kind of catalog it matches with
+    return argument, type(catalog[4]).__name__, type(catalog[0]).__name__, os.getpid()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setitem(table_pool.table_pool_state, "snapshots", {})
+    yield api.current_catalog()
+    if table_pool.table_pool is not None:
+        table_pool.reset_table_pool(table_pool.table_pool)
+
+
+def catalog_tuple(catalog):
+    return (catalog.brand_names, catalog.brand_aliases, catalog.brand_name_to_id, catalog.brand_alias_to_id,
+            catalog.part_numbers, catalog.part_number_to_id)
+
+
+def test_snapshot_built_once_per_version(pool):
+    built = table_pool.table_pool_stats["snapshots_built"]
+    path = table_pool.pool_snapshot_path(pool.version)
+    assert table_pool.snapshot_version(path) == pool.version
+    assert table_pool.pool_snapshot_path(pool.version) == path
+    assert table_pool.table_pool_stats["snapshots_built"] == built + 1
+
+
+def test_configured_snapshot_of_the_version_is_used(pool, monkeypatch, tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    build_catalog_snapshot(table_pool.CATALOG_SOURCE_DIR, path)
+    monkeypatch.setattr(table_pool, "USE_CATALOG_SNAPSHOT", True)
+    monkeypatch.setattr(table_pool, "CATALOG_SNAPSHOT_PATH", path)
+    built = table_pool.table_pool_stats["snapshots_built"]
+    assert table_pool.pool_snapshot_path(pool.version) == path
+    assert table_pool.table_pool_stats["snapshots_built"] == built
+
+
+def test_version_without_snapshot_is_matched_in_server_process(pool):
+    version = "0" * 40   # not the version of the sources
+    assert table_pool.pool_snapshot_path(version) is None
+    local = table_pool.table_pool_stats["local_jobs"]
+    results = list(table_pool.map_table_jobs(catalog_kind_job, [1, 2], catalog_tuple(pool), version))
+    assert [result[:2] for result in results] == [(1, "PartNumberSet"), (2, "PartNumberSet")]
+    assert all([result[3] == os.getpid() for result in results])
+    assert table_pool.table_pool_stats["local_jobs"] == local + 2
+    assert table_pool.table_pool is None   # no pool started for them
+
+
+def test_workers_map_the_snapshot(pool):
+    results = list(table_pool.map_table_jobs(catalog_kind_job, [1, 2, 3], catalog_tuple(pool), pool.version))
+    assert [result[0] for result in results] == [1, 2, 3]
+    # snapshot sets/ maps, where the server process matches with the text/JSON catalog
+    assert set(result[2] for result in results) == {"SnapshotSet"}
+    assert type(pool.brand_names).__name__ == "set"
+    assert all([result[3] != os.getpid() for result in results])
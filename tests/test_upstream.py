@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+import conftest
+import api
+from src import upstream
+
+
+# Upstream fetches and the batch route against a local stub of EMAIL_DETAIL_URL. The answer depends on the id:
+# 1 mod 10 fails once with a 503 then answers, 2 mod 10 is a 404, 3 mod 10 always answers 503, any other id
+# answers a page with one table. Every answer takes DELAY seconds so concurrent fetches overlap.
+CONCURRENCY = 4
+DELAY = 0.05
+PAGE = ("<html><body><table><tr><th>Manufacturer</th><th>MPN</th><th>Qty</th></tr>"
+        "<tr><td>NXP</td><td>GRM033R60J104KE19D</td><td>1,500</td></tr>"
+        "<tr><td>Murata</td><td>08056D106KAT2A</td><td>2k</td></tr></table></body></html>").encode()
+
+
+class StubServer(object):
+    def __init__(self):
+        self.hits = Counter()
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                page_id = int(self.path.split("mid=")[1])
+                with stub.lock:
+                    stub.hits[page_id] += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    attempt = stub.hits[page_id]
+                time.sleep(DELAY)
+                with stub.lock:
+                    stub.in_flight -= 1
+                if page_id % 10 == 2:
+                    status, body = 404, b""
+                elif page_id % 10 == 3 or (page_id % 10 == 1 and attempt == 1):
+                    status, body = 503, b""
+                else:
+                    status, body = 200, PAGE
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}/get/?mid={{i}}".format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def requests(self):
+        return sum(self.hits.values())
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubServer()
+    monkeypatch.setattr(api, "EMAIL_DETAIL_URL", server.url)
+    monkeypatch.setattr(upstream, "UPSTREAM_CONCURRENCY", CONCURRENCY)
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(upstream, "upstream_session", None)   # session built with the settings above
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+    upstream.upstream_session = None
+
+
+def test_fetch_retries(stub):
+    assert upstream.fetch_page(stub.url.format(i=11)) == PAGE
+    assert stub.hits[11] == 2
+    with pytest.raises(Exception):
+        upstream.fetch_page(stub.url.format(i=13))
+    assert stub.hits[13] == 1 + upstream.UPSTREAM_RETRIES
+    with pytest.raises(Exception):
+        upstream.fetch_page(stub.url.format(i=12))
+    assert stub.hits[12] == 1   # 404 is not retried
+
+
+def test_fetched_pages_in_order(stub):
+    page_ids = list(range(40, 70))
+    results = list(upstream.iter_fetched_pages([stub.url.format(i=i) for i in page_ids]))
+    assert len(results) == len(page_ids)
+    for page_id, (content, error) in zip(page_ids, results):
+        if page_id % 10 in (2, 3):
+            assert content is None and error is not None
+        else:
+            assert content == PAGE and error is None
+    assert 1 < stub.max_in_flight <= CONCURRENCY
+
+
+def test_fetches_bounded_ahead_of_consumer(stub):
+    pages = upstream.iter_fetched_pages([stub.url.format(i=i) for i in range(100, 200, 10)] * 10)
+    next(pages)
+    time.sleep(10 * DELAY)
+    # no more than twice the concurrency fetched while the first page is being processed
+    assert stub.requests() == 2 * CONCURRENCY
+    pages.close()
+
+
+def test_batch_route(stub):
+    client = api.app.test_client()
+    page_ids = [10, 11, 12, 13, 14]
+    response = client.post("/api/get-match-batch/", json={"ids": page_ids})
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [result["id"] for result in results] == page_ids
+    single = client.get("/api/get-match/10").get_json()
+    assert len(single) == 2
+    for result in results:
+        if result["id"] % 10 in (2, 3):
+            assert result == {"id": result["id"], "status": 400, "Error": "Could not fetch tables"}
+        else:
+            assert result == {"id": result["id"], "status": 200, "matches": single}
+
+
+def test_batch_route_rejects_bad_ids(stub):
+    client = api.app.test_client()
+    assert client.post("/api/get-match-batch/", json={"ids": [1, "2"]}).status_code == 400
+    assert client.post("/api/get-match-batch/", json={"ids": list(range(api.BATCH_MAX_IDS + 1))}).status_code == 400
+    assert stub.requests() == 0
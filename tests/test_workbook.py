@@ -0,0 +1,82 @@
+import io
+import pytest
+import pandas as pd
+import api
+from src import workbook, table_pool
+from src.workbook import iter_workbook_matches
+
+
+# Workbooks with several sheets and tables stacked in a sheet: every table is matched (in the process pool one job
+# per table), records come in sheet/ table order with the same fields as when matched one after another
+SHEETS = {
+    "Shortage": [["Manufacturer", "MPN", "Qty"], ["Murata", "GRM033R60J104KE19D", 100], ["Murata", "MG0220", "2k"],
+                 [None, None, None],
+                 ["Brand", "Part Number", "Quantity"], ["Murata", "100NF", 50], ["Yageo", "NMC0201Y5V104Z63TRPF", 10]],
+    "Spot buy": [["MPN", "Manufacturer", "QTY"], ["20010488-02R1F", "Murata", 30], ["MG0220", "Yageo", 5]],
+    "Empty": [],
+}
+
+
+def workbook_bytes(sheets):
+    data = io.BytesIO()
+    with pd.ExcelWriter(data, engine="openpyxl") as writer:
+        for name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, sheet_name=name, header=False, index=False)
+    return data.getvalue()
+
+
+def matches_of(data, catalog, catalog_version=None):
+    return list(iter_workbook_matches(io.BytesIO(data), catalog.brand_names, catalog.brand_aliases,
+                                      catalog.brand_name_to_id, catalog.brand_alias_to_id, catalog.part_numbers,
+                                      catalog.part_number_to_id, catalog_version))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(workbook, "PARALLEL_TABLES", True)
+    monkeypatch.setattr(workbook, "TABLE_POOL_MIN_SIZE", 0)
+    monkeypatch.setitem(table_pool.table_pool_state, "snapshots", {})
+    yield api.current_catalog()
+    if table_pool.table_pool is not None:
+        table_pool.reset_table_pool(table_pool.table_pool)
+
+
+def test_every_sheet_and_stacked_table_matched():
+    matches = matches_of(workbook_bytes(SHEETS), api.current_catalog())
+    assert [(match["sheet"], match["table_index"]) for match in matches] == \
+        [("Shortage", 0)] * 2 + [("Shortage", 1)] * 2 + [("Spot buy", 0)] * 2
+    assert [match["part_number"] for match in matches] == \
+        ["GRM033R60J104KE19D", "MG0220", "100NF", "NMC0201Y5V104Z63TRPF", "20010488-02R1F", "MG0220"]
+    assert not any(["Error" in match for match in matches])
+
+
+def test_one_pool_job_per_table(pool):
+    data = workbook_bytes(SHEETS)
+    expected = matches_of(data, pool)
+    jobs = table_pool.table_pool_stats["jobs"]
+    assert matches_of(data, pool, pool.version) == expected
+    # 3 sheets read, then the 3 tables matched (the 2 stacked tables of "Shortage" on their own)
+    assert table_pool.table_pool_stats["jobs"] == jobs + 3 + 3
+
+
+def test_stacked_tables_of_a_single_sheet_in_the_pool(pool):
+    data = workbook_bytes({"Shortage": SHEETS["Shortage"]})
+    expected = matches_of(data, pool)
+    jobs = table_pool.table_pool_stats["jobs"]
+    assert matches_of(data, pool, pool.version) == expected
+    assert table_pool.table_pool_stats["jobs"] == jobs + 2   # the sheet is read in the server process
+
+
+def test_failing_table_adds_an_error_entry(monkeypatch):
+    match_table = workbook.match_table
+
+    def failing_match_table(sheet, table_index, df, *catalog):
+        if (sheet, table_index) == ("Shortage", 1):
+            raise ValueError("broken table")
+        return match_table(sheet, table_index, df, *catalog)
+
+    monkeypatch.setattr(workbook, "match_table", failing_match_table)
+    matches = matches_of(workbook_bytes(SHEETS), api.current_catalog())
+    assert [(match["sheet"], match["table_index"], "Error" in match) for match in matches] == \
+        [("Shortage", 0, False)] * 2 + [("Shortage", 1, True)] + [("Spot buy", 0, False)] * 2
+    assert matches[2] == {"sheet": "Shortage", "table_index": 1, "Error": "Can not process table"}